@@ -1,32 +1,69 @@
 import os
-import requests
+import json
+import time
 from llm_config import LLM_CONFIG
 from llm_config import SERPAPI_API_KEY
+from llm_client import LLM_POOL_SIZE, CircuitOpenError, create_http_session, get_llm_client
+from model_router import TASK_FINAL, endpoint_key, get_model_router
 
-_HTTP_SESSION = requests.Session()
+# Sized for AGENT_LLM_POOL_SIZE concurrent LLM calls per process, so busy
+# workers reuse connections instead of opening and discarding them.
+_HTTP_SESSION = create_http_session(LLM_POOL_SIZE)
 _LLM_REQUEST_TIMEOUT_SECS = 45
+# Returned as the assistant message when the provider call fails.
+LLM_ERROR_CONTENT = "Sorry, I encountered an error connecting to the agent's brain."
 
 class Agent:
-    def __init__(self):
-        self.api_key = LLM_CONFIG["config_list"][0]["api_key"]
-        self.base_url = LLM_CONFIG["config_list"][0]["base_url"]
-        self.model = LLM_CONFIG["config_list"][0]["model"]
+    def __init__(self, task: str = TASK_FINAL):
+        # Default task class for calls that do not pass one. The model router
+        # picks the config_list entry per call, so model/base_url below are
+        # the endpoint used by the most recent call (or the preferred one).
+        self.task = task
+        self._router = get_model_router()
+        self._use_endpoint(self._router.candidates(task)[0])
         
         self.temperature = LLM_CONFIG["temperature"]
         self.max_tokens = LLM_CONFIG["max_tokens"]
 
+        # id(message) -> (message, content, formatted). An Agent lives for one
+        # request, so each history message is wrapped once, not once per round.
+        self._formatted_cache = {}
+        # Retry, hedge and circuit-breaker outcomes of this Agent's calls.
+        self.client_stats = {}
+        # One entry per call: task class, model that answered, latency, failovers.
+        self.route_stats = []
+
+    def _use_endpoint(self, entry: dict):
+        self.api_key = entry["api_key"]
+        self.base_url = entry["base_url"]
+        self.model = entry["model"]
+        # SiliconFlow's vision/multimodal models often require content to be formatted
+        # specifically if they are strictly expecting a VLM schema even for text.
+        self._wrap_text_content = "V" in self.model.upper()
+        self._client = get_llm_client(endpoint_key(entry), _HTTP_SESSION)
+
+    def _record_route(self, task: str, entry: dict, ok: bool, start: float, failovers: int):
+        self.route_stats.append({
+            "task": task,
+            "model": entry["model"] if ok else None,
+            "ok": ok,
+            "ms": round((time.monotonic() - start) * 1000, 1),
+            "failovers": failovers
+        })
+
     def chat(
         self, 
         messages: list, 
         attached_file_content: str = None,
-        tools: list = None
+        tools: list = None,
+        task: str = None
     ) -> dict:
         """
         Main method to interact with the LLM.
         Returns the assistant's message dict.
         """
         prompt = self.construct_prompt(messages, attached_file_content)
-        response_msg = self.call_llm_api(prompt, tools)
+        response_msg = self.call_llm_api(prompt, tools, task)
         return response_msg
 
     def construct_prompt(
@@ -37,26 +74,30 @@ class Agent:
         """
         Constructs the list of message dicts required by the API.
         If file content is provided, prepends it to the last user message.
+
+        The result is a new list that shares the caller's message dicts. Only a
+        message that changes is replaced, by a new dict, so the caller's
+        messages are never modified. Treat the returned messages as read-only.
         """
-        import copy
-        # Create a deep copy so we don't modify the original messages list directly
-        formatted_messages = copy.deepcopy(messages)
+        formatted_messages = list(messages)
         
         # If there's an attached file, we inject it into the most recent user message
         if attached_file_content:
-            for message in reversed(formatted_messages):
+            for index in range(len(formatted_messages) - 1, -1, -1):
+                message = formatted_messages[index]
                 if message.get("role") == "user":
                     original_content = message.get("content", "")
                     
                     if attached_file_content.startswith("data:application/pdf;base64,"):
                         # If the model natively supports base64 files
-                        message["content"] = [
+                        content = [
                             {"type": "text", "text": f"{original_content}"},
                             {"type": "file_url", "file_url": {"url": attached_file_content}}
                         ]
                     else:
                         # Otherwise append string explicitly
-                        message["content"] = f"Here is the content of the attached file:\n\n{attached_file_content}\n\nUser's question:\n{original_content}"
+                        content = f"Here is the content of the attached file:\n\n{attached_file_content}\n\nUser's question:\n{original_content}"
+                    formatted_messages[index] = {**message, "content": content}
                     break
             else:
                 # If no user message was found but we have file content, append one
@@ -67,19 +108,25 @@ class Agent:
                 
         return formatted_messages
 
-    def call_llm_api(self, formatted_messages: list, tools: list = None) -> dict:
+    def iter_chat_stream(
+        self,
+        messages: list,
+        attached_file_content: str = None,
+        tools: list = None,
+        task: str = None
+    ):
         """
-        Sends the formatted messages to the SiliconFlow API and returns the message dict.
+        Streaming variant of chat(). Yields assistant content deltas as they arrive
+        and returns the fully reassembled assistant message dict.
         """
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json"
-        }
-        
+        prompt = self.construct_prompt(messages, attached_file_content)
+        return (yield from self.call_llm_api_stream(prompt, tools, task))
+
+    def _build_payload(self, formatted_messages: list, tools: list = None, stream: bool = False) -> dict:
         payload = {
             "model": self.model,
-            "messages": formatted_messages,
-            "stream": False
+            "messages": self._format_for_model(formatted_messages),
+            "stream": stream
         }
         
         if tools:
@@ -90,26 +137,149 @@ class Agent:
             payload["temperature"] = max(0.01, min(0.99, self.temperature))
         if self.max_tokens is not None:
             payload["max_tokens"] = min(self.max_tokens, 4096)
-            
-        # SiliconFlow's vision/multimodal models often require content to be formatted
-        # specifically if they are strictly expecting a VLM schema even for text.
-        for msg in payload["messages"]:
-            if isinstance(msg.get("content"), str) and "V" in self.model.upper():
-                msg["content"] = [{"type": "text", "text": msg["content"]}]
-        
-        url = f"{self.base_url}/chat/completions"
-        try:
-            response = _HTTP_SESSION.post(
-                url,
-                headers=headers,
-                json=payload,
-                timeout=_LLM_REQUEST_TIMEOUT_SECS
-            )
-            response.raise_for_status()
-            data = response.json()
-            return data["choices"][0]["message"]
-        except Exception as e:
-            print(f"Error calling LLM API: {e}")
-            if 'response' in locals() and hasattr(response, 'text'):
-                print(f"Response details: {response.text}")
-            return {"role": "assistant", "content": "Sorry, I encountered an error connecting to the agent's brain."}
\ No newline at end of file
+        return payload
+
+    def _format_for_model(self, messages: list) -> list:
+        """Wrap plain-text content in the VLM schema, reusing each message's wrapped copy."""
+        if not self._wrap_text_content:
+            return messages
+        formatted = []
+        for msg in messages:
+            content = msg.get("content")
+            if not isinstance(content, str):
+                formatted.append(msg)
+                continue
+            cached = self._formatted_cache.get(id(msg))
+            if cached is None or cached[0] is not msg or cached[1] is not content:
+                # Keeping msg in the entry pins its id for as long as the entry lives.
+                cached = (msg, content, {**msg, "content": [{"type": "text", "text": content}]})
+                self._formatted_cache[id(msg)] = cached
+            formatted.append(cached[2])
+        return formatted
+
+    def _headers(self) -> dict:
+        return {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+
+    def call_llm_api(self, formatted_messages: list, tools: list = None, task: str = None) -> dict:
+        """
+        Sends the formatted messages to the SiliconFlow API and returns the message dict.
+        Fails over to the next config_list entry for the task when a call fails.
+        """
+        task = task or self.task
+        start = time.monotonic()
+        failovers = 0
+        for entry in self._router.candidates(task):
+            self._use_endpoint(entry)
+            payload = self._build_payload(formatted_messages, tools)
+            url = f"{self.base_url}/chat/completions"
+            call_start = time.monotonic()
+            response = None
+            try:
+                response = self._client.post(
+                    url,
+                    self._headers(),
+                    payload,
+                    _LLM_REQUEST_TIMEOUT_SECS,
+                    self.client_stats
+                )
+                data = response.json()
+                message = data["choices"][0]["message"]
+            except Exception as e:
+                print(f"Error calling LLM API ({self.model}): {e}")
+                if response is not None and hasattr(response, 'text'):
+                    print(f"Response details: {response.text}")
+                if not isinstance(e, CircuitOpenError):
+                    self._router.record(entry, False, time.monotonic() - call_start)
+                failovers += 1
+                continue
+            self._router.record(entry, True, time.monotonic() - call_start)
+            self._record_route(task, entry, True, start, failovers)
+            return message
+
+        self._record_route(task, None, False, start, failovers)
+        return {"role": "assistant", "content": LLM_ERROR_CONTENT}
+
+    def call_llm_api_stream(self, formatted_messages: list, tools: list = None, task: str = None):
+        """
+        Sends the formatted messages with stream=True and parses the provider's SSE chunks.
+        Yields content deltas and returns the assistant message dict, with streamed
+        tool_calls argument fragments stitched back together per index.
+        Fails over to the next config_list entry only before any text was yielded.
+        """
+        task = task or self.task
+        start = time.monotonic()
+        failovers = 0
+        for entry in self._router.candidates(task):
+            self._use_endpoint(entry)
+            payload = self._build_payload(formatted_messages, tools, stream=True)
+            url = f"{self.base_url}/chat/completions"
+            call_start = time.monotonic()
+            content_parts = []
+            tool_calls_by_index = {}
+            try:
+                with self._client.post(
+                    url,
+                    self._headers(),
+                    payload,
+                    _LLM_REQUEST_TIMEOUT_SECS,
+                    self.client_stats,
+                    stream=True
+                ) as response:
+                    # SSE is always UTF-8; requests would otherwise guess ISO-8859-1 for text/event-stream.
+                    response.encoding = "utf-8"
+                    for line in response.iter_lines(decode_unicode=True):
+                        if not line or not line.startswith("data:"):
+                            continue
+                        data = line[len("data:"):].strip()
+                        if data == "[DONE]":
+                            break
+
+                        chunk = json.loads(data)
+                        choices = chunk.get("choices") or []
+                        if not choices:
+                            continue
+                        delta = choices[0].get("delta") or {}
+
+                        piece = delta.get("content")
+                        if piece:
+                            content_parts.append(piece)
+                            yield piece
+
+                        for fragment in delta.get("tool_calls") or []:
+                            index = fragment.get("index", len(tool_calls_by_index))
+                            call = tool_calls_by_index.setdefault(index, {
+                                "id": "",
+                                "type": "function",
+                                "function": {"name": "", "arguments": ""}
+                            })
+                            if fragment.get("id"):
+                                call["id"] = fragment["id"]
+                            if fragment.get("type"):
+                                call["type"] = fragment["type"]
+                            function = fragment.get("function") or {}
+                            if function.get("name"):
+                                call["function"]["name"] += function["name"]
+                            if function.get("arguments"):
+                                call["function"]["arguments"] += function["arguments"]
+            except Exception as e:
+                print(f"Error streaming from LLM API ({self.model}): {e}")
+                if not isinstance(e, CircuitOpenError):
+                    self._router.record(entry, False, time.monotonic() - call_start)
+                failovers += 1
+                if content_parts:
+                    # The client already shows part of this answer; another model cannot continue it.
+                    break
+                continue
+
+            self._router.record(entry, True, time.monotonic() - call_start)
+            self._record_route(task, entry, True, start, failovers)
+            message = {"role": "assistant", "content": "".join(content_parts)}
+            if tool_calls_by_index:
+                message["tool_calls"] = [tool_calls_by_index[i] for i in sorted(tool_calls_by_index)]
+            return message
+
+        self._record_route(task, None, False, start, failovers)
+        return {"role": "assistant", "content": LLM_ERROR_CONTENT}
@@ -0,0 +1,98 @@
+"""
+PDF text extraction time on the sample transcripts in parse/test_file/.
+
+    python agent/bench_pdf.py --repeat 5 --synthetic-pages 60
+
+Times three ways of extracting each sample PDF:
+- the previous implementation: serial extraction with repeated `text +=`
+- the inline path of pdf_extract
+- the process-pool path of pdf_extract
+
+The samples are only 1-3 pages long, so the benchmark also builds a synthetic
+PDF of --synthetic-pages pages out of the sample pages. That document stands
+in for a long course outline. Timings are the best of --repeat runs. The
+process pool is warmed up first, so worker start-up is not counted. A
+final run shows the partial result under a --budget-secs time budget.
+"""
+
+import argparse
+import io
+import os
+import sys
+import time
+
+AGENT_DIR = os.path.dirname(os.path.abspath(__file__))
+SAMPLE_DIR = os.path.join(os.path.dirname(AGENT_DIR), "parse", "test_file")
+sys.path.insert(0, AGENT_DIR)
+
+import pypdf
+from pdf_extract import PDF_WORKERS, extract_pdf_text
+
+
+def _legacy_extract(data: bytes) -> str:
+    text = ""
+    reader = pypdf.PdfReader(io.BytesIO(data))
+    for page in reader.pages:
+        extracted = page.extract_text()
+        if extracted:
+            text += extracted + "\n"
+    return text.strip()
+
+
+def _synthetic_pdf(samples: list, page_count: int) -> bytes:
+    writer = pypdf.PdfWriter()
+    readers = [pypdf.PdfReader(io.BytesIO(data)) for data in samples]
+    source_pages = [page for reader in readers for page in reader.pages]
+    for i in range(page_count):
+        writer.add_page(source_pages[i % len(source_pages)])
+    out = io.BytesIO()
+    writer.write(out)
+    return out.getvalue()
+
+
+def _best(fn, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--synthetic-pages", type=int, default=60)
+    parser.add_argument("--budget-secs", type=float, default=0.25)
+    args = parser.parse_args()
+
+    documents = []
+    for name in sorted(os.listdir(SAMPLE_DIR)):
+        if name.lower().endswith(".pdf"):
+            with open(os.path.join(SAMPLE_DIR, name), "rb") as f:
+                documents.append((name, f.read()))
+    documents.append((f"synthetic-{args.synthetic_pages}p", _synthetic_pdf([d for _, d in documents], args.synthetic_pages)))
+
+    # Start the pool's worker processes before timing anything.
+    extract_pdf_text(documents[-1][1], max_pages=None, time_budget_secs=None, parallel=True)
+
+    print(f"best of {args.repeat}, {PDF_WORKERS} pool workers, {os.cpu_count()} CPUs")
+    print(f"{'document':<28} {'pages':>5} {'legacy_ms':>10} {'inline_ms':>10} {'pool_ms':>10}")
+    for name, data in documents:
+        pages = len(pypdf.PdfReader(io.BytesIO(data)).pages)
+        legacy = _best(lambda: _legacy_extract(data), args.repeat)
+        inline = _best(lambda: extract_pdf_text(data, max_pages=None, time_budget_secs=None, parallel=False), args.repeat)
+        pooled = _best(lambda: extract_pdf_text(data, max_pages=None, time_budget_secs=None, parallel=True), args.repeat)
+        print(f"{name:<28} {pages:>5} {legacy * 1000:>10.1f} {inline * 1000:>10.1f} {pooled * 1000:>10.1f}")
+
+    name, data = documents[-1]
+    start = time.perf_counter()
+    _, info = extract_pdf_text(data, max_pages=None, time_budget_secs=args.budget_secs)
+    print(
+        f"{name} with a {args.budget_secs}s budget: {(time.perf_counter() - start) * 1000:.1f} ms, "
+        f"{info['pages_extracted']} of {info['page_count']} pages, parallel={info['parallel']}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Prompt-construction cost across the tool rounds of one chat request.
+
+    python agent/bench_prompt.py --messages 30 --rounds 12 --payload-kb 8
+
+Builds a conversation whose tool messages carry --payload-kb of course JSON.
+It then times what the agent does before every LLM round: construct the prompt
+and build the request payload. The copy-on-write path in Agent is compared with
+the previous implementation, which deep-copied the whole history and re-wrapped
+every message for "V" models on every round. Each round appends an assistant
+message and a tool result, the same way the chat loop does. No network calls
+are made.
+"""
+
+import argparse
+import copy
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from agent import Agent
+
+
+def _legacy_prompt(agent: Agent, messages: list, attached_file_content: str = None) -> dict:
+    formatted_messages = copy.deepcopy(messages)
+    if attached_file_content:
+        for message in reversed(formatted_messages):
+            if message.get("role") == "user":
+                message["content"] = f"Here is the content of the attached file:\n\n{attached_file_content}\n\nUser's question:\n{message.get('content', '')}"
+                break
+    payload = {"model": agent.model, "messages": formatted_messages, "stream": False}
+    for msg in payload["messages"]:
+        if isinstance(msg.get("content"), str) and "V" in agent.model.upper():
+            msg["content"] = [{"type": "text", "text": msg["content"]}]
+    return payload
+
+
+def _current_prompt(agent: Agent, messages: list, attached_file_content: str = None) -> dict:
+    return agent._build_payload(agent.construct_prompt(messages, attached_file_content))
+
+
+def _conversation(message_count: int, payload_kb: int) -> list:
+    section = {"class": "4021", "component": "LEC 001", "time_date": "10:00-11:20TTh", "location": "MC 2065"}
+    tool_payload = json.dumps({"course": "CS 341", "sections": [section] * max(1, payload_kb * 1024 // 100)})
+    messages = [{"role": "system", "content": "You are a course planning assistant. " * 40}]
+    while len(messages) < message_count:
+        messages.append({"role": "user", "content": "Which CS 341 sections fit my timetable?"})
+        messages.append({
+            "role": "assistant", "content": None,
+            "tool_calls": [{"id": f"call_{len(messages)}", "type": "function", "function": {"name": "query_database_readonly", "arguments": "{}"}}]
+        })
+        messages.append({"role": "tool", "tool_call_id": f"call_{len(messages)}", "content": tool_payload})
+        messages.append({"role": "assistant", "content": "LEC 001 fits on Tuesday and Thursday."})
+    return messages[:message_count], tool_payload
+
+
+def _run(build, model: str, base: list, tool_payload: str, rounds: int, attachment: str, trace: bool = False):
+    agent = Agent()
+    agent.model = model
+    agent._wrap_text_content = "V" in model.upper()
+    messages = list(base)
+    if trace:
+        tracemalloc.start()
+    start = time.perf_counter()
+    for round_index in range(rounds):
+        build(agent, messages, attachment if round_index == 0 else None)
+        messages.append({
+            "role": "assistant", "content": None,
+            "tool_calls": [{"id": f"r{round_index}", "type": "function", "function": {"name": "query_database_readonly", "arguments": "{}"}}]
+        })
+        messages.append({"role": "tool", "tool_call_id": f"r{round_index}", "content": tool_payload})
+    elapsed = time.perf_counter() - start
+    if not trace:
+        return elapsed
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=30)
+    parser.add_argument("--rounds", type=int, default=12)
+    parser.add_argument("--payload-kb", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    base, tool_payload = _conversation(args.messages, args.payload_kb)
+    attachment = "Transcript text. " * 500
+    print(f"{args.messages} messages, {args.rounds} rounds, {args.payload_kb} KB tool payloads, best of {args.repeat}")
+    print(f"{'model':<14} {'builder':<14} {'ms/request':>11} {'peak_kb':>9}")
+    for model in ["text-model", "VLM-model"]:
+        for name, build in [("deepcopy", _legacy_prompt), ("copy-on-write", _current_prompt)]:
+            elapsed = min(_run(build, model, base, tool_payload, args.rounds, attachment) for _ in range(args.repeat))
+            peak = _run(build, model, base, tool_payload, args.rounds, attachment, trace=True)
+            print(f"{model:<14} {name:<14} {elapsed * 1000:>11.2f} {peak / 1024:>9.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Schedule generation time for synthetic wishlists of 5-10 courses.
+
+    python agent/bench_schedule.py --courses 5 6 8 10 --results 5 --seed 7
+
+Each synthetic course has 2-8 lecture sections and may have tutorials and
+labs, at times drawn from the usual MWF and TTh grids. Each wishlist is timed
+two ways:
+- "app dfs": a port of the Android generator. It walks components in wishlist
+  order, checks each candidate against every chosen section pairwise, and
+  drops visually identical schedules only at the end
+- schedule_generator: bitmask times, identical sections merged into one
+  option, most-constrained-first order and forward-checking pruning
+For each, the benchmark reports the time to the first --results schedules and
+to enumerate every schedule. The full enumeration is capped at --max-nodes
+search nodes, and a "+" marks a run that hit the cap. No Firestore access is
+needed.
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from schedule_generator import course_slots, iter_schedules
+
+MWF_TIMES = ["08:30-09:20", "09:30-10:20", "10:30-11:20", "11:30-12:20", "12:30-01:20", "01:30-02:20", "02:30-03:20", "03:30-04:20"]
+TTH_TIMES = ["08:30-09:50", "10:00-11:20", "11:30-12:50", "01:00-02:20", "02:30-03:50", "04:00-05:20"]
+SINGLE_DAYS = ["M", "T", "W", "Th", "F"]
+
+
+def _synthetic_course(rng: random.Random, index: int) -> dict:
+    sections = []
+    class_number = 1000 + index * 100
+    for n in range(rng.randint(2, 8)):
+        pattern = rng.choice([("MWF", MWF_TIMES), ("TTh", TTH_TIMES)])
+        sections.append({"class": str(class_number + n), "component": f"LEC {n + 1:03d}", "time_date": rng.choice(pattern[1]) + pattern[0]})
+    if rng.random() < 0.7:
+        for n in range(rng.randint(2, 8)):
+            sections.append({"class": str(class_number + 20 + n), "component": f"TUT {101 + n}", "time_date": rng.choice(MWF_TIMES) + rng.choice(SINGLE_DAYS)})
+    if rng.random() < 0.3:
+        for n in range(rng.randint(2, 6)):
+            start = rng.choice(["08:30-11:20", "11:30-02:20", "02:30-05:20"])
+            sections.append({"class": str(class_number + 40 + n), "component": f"LAB {n + 1:03d}", "time_date": start + rng.choice(SINGLE_DAYS)})
+    return {"title": f"Synthetic {index}", "units": "0.50", "sections": sections}
+
+
+def _minutes(entry: dict, prefix: str) -> int:
+    return entry[f"{prefix}Hour"] * 60 + entry[f"{prefix}Minute"]
+
+
+def _app_dfs(slots_by_course: dict, limit: int, max_nodes: int):
+    """Port of generateTimetables() in GenerateScreen.kt for one full-size subset."""
+    choices = [[entry for _, entries in slot.options for entry in entries] for code in slots_by_course for slot in slots_by_course[code]]
+    results, seen, nodes = [], set(), [0]
+
+    def dfs(index: int, current: list):
+        nodes[0] += 1
+        if len(results) >= limit or nodes[0] > max_nodes:
+            return
+        if index == len(choices):
+            signature = "|".join(sorted(
+                f"{e['code']}-{e['component'].split(' ')[0]}-{''.join(e['days'])}-{_minutes(e, 'start')}-{_minutes(e, 'end')}"
+                for e in current
+            ))
+            if signature not in seen:
+                seen.add(signature)
+                results.append(current)
+            return
+        for entry in choices[index]:
+            conflict = False
+            for scheduled in current:
+                if set(entry["days"]) & set(scheduled["days"]):
+                    if _minutes(entry, "start") < _minutes(scheduled, "end") and _minutes(scheduled, "start") < _minutes(entry, "end"):
+                        conflict = True
+                        break
+            if not conflict:
+                dfs(index + 1, current + [entry])
+
+    dfs(0, [])
+    return len(results), nodes[0] > max_nodes
+
+
+def _generator(slots_by_course: dict, limit: int, max_nodes: int):
+    stats = {}
+    count = 0
+    for _ in iter_schedules(slots_by_course, max_nodes=max_nodes, stats=stats):
+        count += 1
+        if count >= limit:
+            break
+    return count, not stats["exhausted"] and count < limit
+
+
+def _timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return (time.perf_counter() - start) * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--courses", type=int, nargs="+", default=[5, 6, 8, 10])
+    parser.add_argument("--results", type=int, default=5)
+    parser.add_argument("--max-nodes", type=int, default=2_000_000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print(f"{'courses':>7} {'sections':>8} | {'app first ms':>12} {'gen first ms':>12} | {'app all ms':>11} {'gen all ms':>11} {'schedules':>10}")
+    for course_count in args.courses:
+        courses = {f"SYN {100 + i}": _synthetic_course(rng, i) for i in range(course_count)}
+        slots_by_course = {code: course_slots("1261", code, data) for code, data in courses.items()}
+        section_count = sum(len(data["sections"]) for data in courses.values())
+
+        app_first, _ = _timed(_app_dfs, slots_by_course, args.results, args.max_nodes)
+        gen_first, _ = _timed(_generator, slots_by_course, args.results, args.max_nodes)
+        app_all, (app_count, app_capped) = _timed(_app_dfs, slots_by_course, float("inf"), args.max_nodes)
+        gen_all, (gen_count, gen_capped) = _timed(_generator, slots_by_course, float("inf"), args.max_nodes)
+        print(
+            f"{course_count:>7} {section_count:>8} | {app_first:>12.1f} {gen_first:>12.1f} | "
+            f"{app_all:>10.1f}{'+' if app_capped else ' '} {gen_all:>10.1f}{'+' if gen_capped else ' '} "
+            f"{gen_count:>10}" + ("" if app_capped or gen_capped or app_count == gen_count else f" (app dfs found {app_count})")
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""
+Concurrent-request throughput of the agent server against a local fake LLM.
+
+    python agent/bench_serving.py --requests 60 --concurrency 30 --llm-delay 1.0
+
+Starts a fake OpenAI-compatible /chat/completions endpoint that takes
+--llm-delay seconds per call. It then serves the real Flask app two ways: with
+the Flask dev server (`python agent/server_agent.py`) and with the production
+gunicorn config (agent/gunicorn.conf.py). Each server gets a burst of concurrent
+/summarize requests. Firebase auth is stubbed in the benchmark child processes
+only, so no credentials are needed.
+"""
+
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+
+AGENT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class _FakeLLMHandler(BaseHTTPRequestHandler):
+    delay_secs = 1.0
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        time.sleep(self.delay_secs)
+        body = json.dumps({
+            "choices": [{"message": {"role": "assistant", "content": "Winter Term Planning"}}]
+        }).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class _FakeLLMServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # The stdlib default backlog of 5 drops bursts of connections, which would
+    # show up as 1s SYN-retry stalls that have nothing to do with the agent.
+    request_queue_size = 1024
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for_port(port: int, timeout_secs: float = 30.0):
+    deadline = time.time() + timeout_secs
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Server on port {port} did not start within {timeout_secs}s")
+
+
+def _load_bench_app():
+    """Import the real app with a placeholder Firebase app and a fixed signed-in uid."""
+    sys.path.insert(0, AGENT_DIR)
+    import firebase_admin
+    from firebase_admin import credentials
+    from google.auth.credentials import AnonymousCredentials
+
+    class _BenchCredential(credentials.Base):
+        def get_credential(self):
+            return AnonymousCredentials()
+
+    if not firebase_admin._apps:
+        firebase_admin.initialize_app(_BenchCredential(), {"projectId": "bench"})
+
+    import server_agent
+    server_agent._require_uid = lambda: ("bench-user", None)
+    return server_agent.app
+
+
+def _serve(mode: str, port: int):
+    if mode == "dev":
+        _load_bench_app().run(host="127.0.0.1", port=port)
+        return
+
+    from gunicorn.app.base import Application
+
+    class _BenchApplication(Application):
+        def init(self, parser, opts, args):
+            return {}
+
+        def load_config(self):
+            self.load_config_from_file(os.path.join(AGENT_DIR, "gunicorn.conf.py"))
+            self.cfg.set("bind", f"127.0.0.1:{port}")
+            self.cfg.set("accesslog", None)
+
+        def load(self):
+            return _load_bench_app()
+
+    _BenchApplication().run()
+
+
+def _run_load(port: int, total: int, concurrency: int):
+    # Imported here so gunicorn's gevent workers can monkey-patch ssl before it loads.
+    import requests
+
+    url = f"http://127.0.0.1:{port}/summarize"
+
+    def one(i):
+        start = time.perf_counter()
+        response = requests.post(
+            url,
+            json={"message": f"help me plan my winter term #{i}"},
+            headers={"Authorization": "Bearer bench"},
+            timeout=300
+        )
+        response.raise_for_status()
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(one, range(total)))
+    return time.perf_counter() - start, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=60)
+    parser.add_argument("--concurrency", type=int, default=30)
+    parser.add_argument("--llm-delay", type=float, default=1.0)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--modes", default="dev,gunicorn")
+    parser.add_argument("--serve", choices=["dev", "gunicorn"], help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        _serve(args.serve, args.port)
+        return
+
+    _FakeLLMHandler.delay_secs = args.llm_delay
+    llm_port = _free_port()
+    llm_server = _FakeLLMServer(("127.0.0.1", llm_port), _FakeLLMHandler)
+    threading.Thread(target=llm_server.serve_forever, daemon=True).start()
+
+    env = dict(
+        os.environ,
+        SILICONFLOW_BASE_URL=f"http://127.0.0.1:{llm_port}/v1",
+        AGENT_RATE_LIMIT_MAX_REQUESTS="1000000",
+        AGENT_DAILY_QUOTA_MAX_COST="1000000000",
+        AGENT_WEB_WORKERS=str(args.workers),
+        AGENT_USAGE_DB_PATH=os.path.join(tempfile.mkdtemp(prefix="agent-bench-"), "usage.sqlite3")
+    )
+
+    print(f"{args.requests} /summarize requests, concurrency {args.concurrency}, fake LLM delay {args.llm_delay}s")
+    print(f"{'mode':<10} {'wall_s':>8} {'req/s':>8} {'p50_s':>8} {'p95_s':>8}")
+    for mode in [m.strip() for m in args.modes.split(",") if m.strip()]:
+        port = _free_port()
+        child = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--serve", mode, "--port", str(port)],
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL
+        )
+        try:
+            _wait_for_port(port)
+            wall, latencies = _run_load(port, args.requests, args.concurrency)
+        finally:
+            child.terminate()
+            child.wait(timeout=30)
+        latencies.sort()
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        print(
+            f"{mode:<10} {wall:>8.2f} {len(latencies) / wall:>8.1f} "
+            f"{statistics.median(latencies):>8.2f} {p95:>8.2f}"
+        )
+
+    llm_server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    Thread-safe, size-bounded LRU cache whose entries also expire after a TTL.
+
+    Values may be None, which lets callers cache "known missing" results
+    (negative caching) with a separate, usually shorter, TTL.
+    """
+
+    def __init__(self, max_entries: int, ttl_secs: float, negative_ttl_secs: float = None):
+        self.max_entries = max(1, int(max_entries))
+        self.ttl_secs = ttl_secs
+        self.negative_ttl_secs = ttl_secs if negative_ttl_secs is None else negative_ttl_secs
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def lookup(self, key):
+        """Return (found, value). A found value of None is a cached miss."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return False, None
+            expires_at, value = entry
+            if expires_at is not None and expires_at <= now:
+                del self._entries[key]
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, value
+
+    def get(self, key, default=None):
+        found, value = self.lookup(key)
+        return value if found else default
+
+    def set(self, key, value, ttl_secs: float = None):
+        if ttl_secs is None:
+            ttl_secs = self.negative_ttl_secs if value is None else self.ttl_secs
+        expires_at = time.monotonic() + ttl_secs if ttl_secs is not None else None
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key=None):
+        """Drop one key, or everything when key is None."""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "evictions": self.evictions
+            }
@@ -0,0 +1,146 @@
+import json
+
+# Rough provider-agnostic estimate. Real tokenizers land within ~20% of this
+# for English and JSON, which is close enough to decide when to compact.
+CHARS_PER_TOKEN = 4
+MESSAGE_OVERHEAD_TOKENS = 4
+
+SUMMARY_HEADER = "Summary of the earlier conversation (older turns were condensed to save context):"
+SUMMARY_USER_CHARS = 160
+SUMMARY_ASSISTANT_CHARS = 240
+
+
+def estimate_text_tokens(text) -> int:
+    return len(text or "") // CHARS_PER_TOKEN
+
+
+def estimate_tokens(message: dict) -> int:
+    content = message.get("content")
+    if content is None:
+        chars = 0
+    elif isinstance(content, str):
+        chars = len(content)
+    else:
+        chars = len(json.dumps(content, ensure_ascii=False))
+    if message.get("tool_calls"):
+        chars += len(json.dumps(message["tool_calls"], ensure_ascii=False))
+    return MESSAGE_OVERHEAD_TOKENS + chars // CHARS_PER_TOKEN
+
+
+def estimate_total_tokens(messages: list) -> int:
+    return sum(estimate_tokens(m) for m in messages)
+
+
+def _split_turns(history: list) -> list:
+    """Group messages into turns that each start at a user message."""
+    turns = []
+    for msg in history:
+        if msg.get("role") == "user" or not turns:
+            turns.append([])
+        turns[-1].append(msg)
+    return turns
+
+
+def _tool_names_by_call_id(turn: list) -> dict:
+    names = {}
+    for msg in turn:
+        for call in msg.get("tool_calls") or []:
+            names[call.get("id")] = (call.get("function") or {}).get("name", "tool")
+    return names
+
+
+def _stub_tool_outputs(turn: list) -> list:
+    """Replace tool results with a short reference, keeping tool_call_id pairing intact."""
+    names = _tool_names_by_call_id(turn)
+    stubbed = []
+    for msg in turn:
+        if msg.get("role") == "tool":
+            name = names.get(msg.get("tool_call_id"), "tool")
+            size = len(msg.get("content") or "")
+            msg = dict(msg, content=f"[Earlier {name} result ({size} chars) omitted. Call {name} again if it is needed.]")
+        stubbed.append(msg)
+    return stubbed
+
+
+def _clip(text, limit: int) -> str:
+    text = " ".join(str(text or "").split())
+    return text if len(text) <= limit else text[:limit - 3].rstrip() + "..."
+
+
+def _summarize_turn(turn: list) -> str:
+    """Condense one turn extractively: the question, the tools used and the final answer."""
+    user_text = next((m.get("content") for m in turn if m.get("role") == "user"), "")
+    answer = next(
+        (m.get("content") for m in reversed(turn) if m.get("role") == "assistant" and m.get("content")),
+        ""
+    )
+    tools = sorted(set(_tool_names_by_call_id(turn).values()))
+    line = f"- User: {_clip(user_text, SUMMARY_USER_CHARS)}"
+    if tools:
+        line += f" | Tools used: {', '.join(tools)}"
+    if answer:
+        line += f" | Advisor: {_clip(answer, SUMMARY_ASSISTANT_CHARS)}"
+    return line
+
+
+def trim_turns(history: list, budget_tokens: int) -> list:
+    """
+    Drop the oldest whole turns until history fits budget_tokens. The newest
+    turn is always kept, so tool calls never lose their results.
+    """
+    turns = _split_turns(history)
+    total = estimate_total_tokens(history)
+    while len(turns) > 1 and total > budget_tokens:
+        total -= estimate_total_tokens(turns.pop(0))
+    return [m for turn in turns for m in turn]
+
+
+def compact_messages(messages: list, budget_tokens: int, keep_recent_turns: int):
+    """
+    Fit [system, *history, current user message] into budget_tokens.
+
+    The system prompt, the current message and the last keep_recent_turns turns
+    stay verbatim where possible. Compaction happens in stages and stops once the
+    estimate fits:
+    1. tool results in older turns are replaced by short references;
+    2. older turns, oldest first, are folded into an extractive summary that is
+       appended to the system prompt;
+    3. tool results in the recent turns are replaced by references as well;
+    4. summary lines are dropped, oldest first.
+    Returns (new_messages, stats). Input messages are never mutated.
+    """
+    before = estimate_total_tokens(messages)
+    stats = {"context_tokens": before, "context_tokens_saved": 0, "compacted_turns": 0}
+    if before <= budget_tokens or len(messages) < 3:
+        return messages, stats
+
+    system, history, current = messages[0], messages[1:-1], messages[-1]
+    turns = _split_turns(history)
+    split = max(0, len(turns) - max(0, keep_recent_turns))
+    older, recent = turns[:split], turns[split:]
+    older = [_stub_tool_outputs(turn) for turn in older]
+    summary_lines = []
+
+    def assemble():
+        system_msg = system
+        if summary_lines:
+            system_msg = dict(system, content=f"{system.get('content') or ''}\n\n{SUMMARY_HEADER}\n" + "\n".join(summary_lines))
+        body = [m for turn in older + recent for m in turn]
+        return [system_msg] + body + [current]
+
+    compacted = assemble()
+    while estimate_total_tokens(compacted) > budget_tokens and older:
+        summary_lines.append(_summarize_turn(older.pop(0)))
+        stats["compacted_turns"] += 1
+        compacted = assemble()
+    if estimate_total_tokens(compacted) > budget_tokens:
+        recent = [_stub_tool_outputs(turn) for turn in recent]
+        compacted = assemble()
+    while estimate_total_tokens(compacted) > budget_tokens and summary_lines:
+        summary_lines.pop(0)
+        compacted = assemble()
+
+    after = estimate_total_tokens(compacted)
+    stats["context_tokens"] = after
+    stats["context_tokens_saved"] = before - after
+    return compacted, stats
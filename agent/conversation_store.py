@@ -0,0 +1,125 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from context_budget import trim_turns
+
+
+class ConversationStore:
+    """
+    Server-side chat history keyed by (uid, session_id).
+
+    Every session is a JSONL file, and each turn is appended when it finishes.
+    Once a session is over max_tokens, its oldest turns are dropped and the file
+    is rewritten, so stored history never outgrows the prompt budget used to
+    replay it. A bounded LRU keeps the hottest sessions parsed in memory.
+    Sessions that go idle, or that fall out of the LRU, are simply dropped from
+    memory. They are reloaded from disk on their next turn. A cached copy is
+    reused only while the file size still matches, so several worker processes
+    can share one session directory without serving stale history.
+    """
+
+    def __init__(self, directory: str, max_sessions_in_memory: int = 256, idle_secs: int = 600, ttl_secs: int = 7 * 24 * 3600, max_tokens: int = None):
+        self.directory = directory
+        self.max_tokens = max_tokens
+        self.max_sessions_in_memory = max(1, max_sessions_in_memory)
+        self.idle_secs = idle_secs
+        self.ttl_secs = ttl_secs
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self._next_sweep = 0.0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, uid: str, session_id: str) -> str:
+        # Hash the key so client-supplied ids can never escape the directory.
+        digest = hashlib.sha256(f"{uid}\0{session_id}".encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{digest}.jsonl")
+
+    def load(self, uid: str, session_id: str) -> list:
+        """Return the stored messages for a session, or [] for a new/expired one."""
+        key = (uid, session_id)
+        path = self._path(uid, session_id)
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return []
+
+        now = time.monotonic()
+        with self._lock:
+            cached = self._sessions.get(key)
+            if cached and cached["size"] == size:
+                cached["last_access"] = now
+                self._sessions.move_to_end(key)
+                return list(cached["messages"])
+
+        messages = []
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    messages.append(json.loads(line))
+        self._remember(key, messages, size, now)
+        return list(messages)
+
+    def append(self, uid: str, session_id: str, new_messages: list):
+        if not new_messages:
+            return
+        key = (uid, session_id)
+        path = self._path(uid, session_id)
+        payload = "".join(json.dumps(m, ensure_ascii=False) + "\n" for m in new_messages)
+        # One write() on an O_APPEND file keeps concurrent appends from interleaving.
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(payload)
+        size = os.path.getsize(path)
+
+        now = time.monotonic()
+        with self._lock:
+            cached = self._sessions.get(key)
+        # Only extend the cached copy if nobody else appended in between.
+        if cached is not None and cached["size"] + len(payload.encode("utf-8")) == size:
+            self._remember(key, cached["messages"] + list(new_messages), size, now)
+        if self.max_tokens:
+            self._trim(uid, session_id)
+
+    def _trim(self, uid: str, session_id: str):
+        messages = self.load(uid, session_id)
+        kept = trim_turns(messages, self.max_tokens)
+        if len(kept) == len(messages):
+            return
+        path = self._path(uid, session_id)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write("".join(json.dumps(m, ensure_ascii=False) + "\n" for m in kept))
+        os.replace(tmp_path, path)
+        self._remember((uid, session_id), kept, os.path.getsize(path), time.monotonic())
+
+    def _remember(self, key, messages: list, size: int, now: float):
+        with self._lock:
+            self._sessions[key] = {"messages": messages, "size": size, "last_access": now}
+            self._sessions.move_to_end(key)
+            while len(self._sessions) > self.max_sessions_in_memory:
+                self._sessions.popitem(last=False)
+            if now >= self._next_sweep:
+                self._sweep(now)
+
+    def _sweep(self, now: float):
+        """Drop idle sessions from memory and delete session files past their TTL."""
+        self._next_sweep = now + min(self.idle_secs, 300)
+        idle = [k for k, v in self._sessions.items() if now - v["last_access"] > self.idle_secs]
+        for key in idle:
+            del self._sessions[key]
+
+        cutoff = time.time() - self.ttl_secs
+        try:
+            with os.scandir(self.directory) as entries:
+                for entry in entries:
+                    if entry.name.endswith(".jsonl") and entry.stat().st_mtime < cutoff:
+                        os.remove(entry.path)
+        except OSError as e:
+            print(f"Conversation store sweep failed: {e}")
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
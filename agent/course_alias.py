@@ -0,0 +1,82 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from cache import TTLCache
+from search_cache import normalize_query
+from sqlite_store import connection
+
+# Maps what the model typed for course_info ("CS136 1261", "1261 cs 136") to the
+# course doc id it resolved to. The map is kept in SQLite next to the search
+# cache, so it survives restarts and is shared by every worker on the node, and
+# repeat spellings skip candidate resolution entirely.
+COURSE_ALIAS_MEMORY_ENTRIES = int(os.getenv("AGENT_COURSE_ALIAS_MEMORY_ENTRIES", "4096"))
+COURSE_ALIAS_MAX_AGE_SECS = int(os.getenv("AGENT_COURSE_ALIAS_MAX_AGE_SECS", str(180 * 24 * 3600)))
+
+
+class CourseAliasStore:
+    def __init__(self, path: str):
+        self.path = path
+        self._memory = TTLCache(COURSE_ALIAS_MEMORY_ENTRIES, COURSE_ALIAS_MAX_AGE_SECS)
+        with connection(self.path) as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS course_alias ("
+                "alias TEXT PRIMARY KEY, doc_id TEXT, updated_at REAL)"
+            )
+
+    def get(self, raw_id: str):
+        """The doc id raw_id resolved to before, or None."""
+        alias = normalize_query(raw_id)
+        found, doc_id = self._memory.lookup(alias)
+        if found:
+            return doc_id
+        try:
+            with connection(self.path) as conn:
+                row = conn.execute(
+                    "SELECT doc_id FROM course_alias WHERE alias = ? AND updated_at >= ?",
+                    (alias, time.time() - COURSE_ALIAS_MAX_AGE_SECS)
+                ).fetchone()
+        except sqlite3.Error as e:
+            print(f"Course alias read failed: {e}")
+            return None
+        if row:
+            self._memory.set(alias, row[0])
+            return row[0]
+        return None
+
+    def set(self, raw_id: str, doc_id: str):
+        alias = normalize_query(raw_id)
+        self._memory.set(alias, doc_id)
+        try:
+            with connection(self.path) as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO course_alias (alias, doc_id, updated_at) VALUES (?, ?, ?)",
+                    (alias, doc_id, time.time())
+                )
+        except sqlite3.Error as e:
+            print(f"Course alias write failed: {e}")
+
+    def forget(self, raw_id: str):
+        """Drop an alias whose course no longer exists."""
+        alias = normalize_query(raw_id)
+        self._memory.invalidate(alias)
+        try:
+            with connection(self.path) as conn:
+                conn.execute("DELETE FROM course_alias WHERE alias = ?", (alias,))
+        except sqlite3.Error as e:
+            print(f"Course alias delete failed: {e}")
+
+
+_ALIAS_STORE = None
+_alias_store_lock = threading.Lock()
+
+
+def get_course_alias_store() -> CourseAliasStore:
+    global _ALIAS_STORE
+    if _ALIAS_STORE is None:
+        with _alias_store_lock:
+            if _ALIAS_STORE is None:
+                path = os.getenv("AGENT_COURSE_ALIAS_DB_PATH") or os.path.join(tempfile.gettempdir(), "agent_course_alias.sqlite3")
+                _ALIAS_STORE = CourseAliasStore(path)
+    return _ALIAS_STORE
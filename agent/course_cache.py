@@ -0,0 +1,99 @@
+import os
+import threading
+import time
+from typing import Optional
+from cache import TTLCache
+
+# The courses collection is only rewritten by parse/script_populate_db.py (every
+# 6 hours). That job bumps meta/courses.version when it finishes. Every process
+# polls that version and drops its cache when it changes, so new data shows up
+# in seconds without waiting for the TTL.
+COURSES_META_COLLECTION = "meta"
+COURSES_META_DOC = "courses"
+
+COURSE_CACHE_MAX_ENTRIES = int(os.getenv("AGENT_COURSE_CACHE_MAX_ENTRIES", "2048"))
+COURSE_CACHE_TTL_SECS = int(os.getenv("AGENT_COURSE_CACHE_TTL_SECS", "3600"))
+COURSE_CACHE_NEGATIVE_TTL_SECS = int(os.getenv("AGENT_COURSE_CACHE_NEGATIVE_TTL_SECS", "300"))
+COURSE_CACHE_VERSION_CHECK_SECS = int(os.getenv("AGENT_COURSE_CACHE_VERSION_CHECK_SECS", "60"))
+
+_COURSE_CACHE = TTLCache(
+    COURSE_CACHE_MAX_ENTRIES,
+    COURSE_CACHE_TTL_SECS,
+    negative_ttl_secs=COURSE_CACHE_NEGATIVE_TTL_SECS
+)
+_version_lock = threading.Lock()
+_known_version = None
+_next_version_check = 0.0
+
+
+def _check_courses_version(db):
+    """Clear the cache if the populate job has published a new courses version."""
+    global _known_version, _next_version_check
+    now = time.monotonic()
+    if now < _next_version_check:
+        return
+    with _version_lock:
+        if now < _next_version_check:
+            return
+        _next_version_check = now + COURSE_CACHE_VERSION_CHECK_SECS
+        try:
+            meta = db.collection(COURSES_META_COLLECTION).document(COURSES_META_DOC).get()
+            version = (meta.to_dict() or {}).get("version") if meta.exists else None
+        except Exception as e:
+            print(f"Course cache version check failed: {e}")
+            return
+        if version != _known_version:
+            if _known_version is not None:
+                print(f"Courses version changed ({_known_version} -> {version}); clearing course cache.")
+            _COURSE_CACHE.invalidate()
+            _known_version = version
+
+
+def get_course(db, doc_id: str) -> Optional[dict]:
+    """
+    Return the courses/{doc_id} payload, or None if the document does not exist.
+    The returned dict is shared with other requests and must be treated as read-only.
+    """
+    _check_courses_version(db)
+    found, data = _COURSE_CACHE.lookup(doc_id)
+    if found:
+        return data
+
+    doc = db.collection("courses").document(doc_id).get()
+    data = (doc.to_dict() or {}) if doc.exists else None
+    _COURSE_CACHE.set(doc_id, data)
+    return data
+
+
+def get_courses(db, doc_ids: list) -> dict:
+    """
+    Return {doc_id: payload or None} for doc_ids. Every id that is not cached
+    is fetched in a single get_all round trip. Payloads are shared and read-only.
+    """
+    _check_courses_version(db)
+    result = {}
+    missing = []
+    for doc_id in doc_ids:
+        found, data = _COURSE_CACHE.lookup(doc_id)
+        if found:
+            result[doc_id] = data
+        elif doc_id not in missing:
+            missing.append(doc_id)
+
+    if missing:
+        refs = [db.collection("courses").document(doc_id) for doc_id in missing]
+        for doc in db.get_all(refs):
+            data = (doc.to_dict() or {}) if doc.exists else None
+            _COURSE_CACHE.set(doc.id, data)
+            result[doc.id] = data
+    return result
+
+
+def courses_version(db):
+    """The last meta/courses.version seen, re-read at most once per check interval."""
+    _check_courses_version(db)
+    return _known_version
+
+
+def course_cache_stats() -> dict:
+    return _COURSE_CACHE.stats()
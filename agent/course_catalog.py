@@ -0,0 +1,243 @@
+import bisect
+import difflib
+import heapq
+import json
+import os
+import re
+import threading
+import time
+from course_cache import courses_version
+
+# parse/script_populate_db.py writes the catalog as one course_catalog/{term}
+# document per term ({"columns", "rows_json"}), and optionally as a JSON file
+# ({"columns", "rows"}) that AGENT_COURSE_CATALOG_PATH can point to. Without either,
+# the index is built from a projected scan of the courses collection.
+COURSE_CATALOG_COLLECTION = "course_catalog"
+CATALOG_COLUMNS = ["term", "subject", "catalog", "title", "units"]
+COURSE_CATALOG_PATH = os.getenv("AGENT_COURSE_CATALOG_PATH")
+COURSE_CATALOG_TTL_SECS = int(os.getenv("AGENT_COURSE_CATALOG_TTL_SECS", "21600"))
+COURSE_CATALOG_RETRY_SECS = 60
+SEARCH_DEFAULT_LIMIT = 10
+SEARCH_MAX_LIMIT = 50
+# Typo matching compares a word only against the title words that share the
+# most trigrams with it, not against the whole vocabulary.
+FUZZY_MAX_CANDIDATES = 50
+
+# "CS136", "cs 136l", "1261 CS 136", "1261_CS_136", or just a subject "MATH".
+_CODE_RE = re.compile(r"^(?:(1\d{3})[\s_]*)?([A-Za-z]{2,8})(?:[\s_]*(\d[0-9A-Za-z]{0,4}))?$")
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_STOPWORDS = {"a", "an", "and", "for", "in", "of", "on", "the", "to", "with", "course", "courses"}
+
+
+def course_doc_id(term: str, subject: str, catalog: str) -> str:
+    return f"{term}_{subject}_{catalog}"
+
+
+def _newest_first(term: str) -> int:
+    return -int(term) if term.isdigit() else 0
+
+
+def _words(text: str) -> list:
+    return [w for w in _WORD_RE.findall((text or "").lower()) if w not in _STOPWORDS]
+
+
+def _trigrams(word: str) -> set:
+    padded = f" {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class CourseCatalog:
+    """
+    Immutable in-memory index of (term, subject, catalog, title, units) rows.
+    Code lookups are dict hits, prefix lookups bisect sorted keys, and title
+    search intersects a word index, with close-spelling matches for typos.
+    """
+
+    def __init__(self, rows: list):
+        self.entries = []
+        self.by_code = {}
+        self.by_subject = {}
+        self.title_index = {}
+        self.tiebreak = []
+        for term, subject, catalog, title, units in rows:
+            subject, catalog = str(subject).upper(), str(catalog).upper()
+            idx = len(self.entries)
+            self.entries.append({
+                "doc_id": course_doc_id(term, subject, catalog),
+                "term": str(term),
+                "code": f"{subject} {catalog}",
+                "title": title,
+                "units": units
+            })
+            # Ties go to the newest term, then to the course code.
+            self.tiebreak.append((_newest_first(str(term)), f"{subject} {catalog}"))
+            self.by_code.setdefault(subject + catalog, []).append(idx)
+            self.by_subject.setdefault(subject, []).append(idx)
+            for word in set(_words(title)):
+                self.title_index.setdefault(word, set()).add(idx)
+        self.code_keys = sorted(self.by_code)
+        self.subject_keys = sorted(self.by_subject)
+        self.vocabulary = sorted(self.title_index)
+        self.trigram_index = {}
+        for word in self.vocabulary:
+            for gram in _trigrams(word):
+                self.trigram_index.setdefault(gram, []).append(word)
+
+    def __len__(self):
+        return len(self.entries)
+
+    @staticmethod
+    def _prefixed(keys: list, prefix: str) -> list:
+        start = bisect.bisect_left(keys, prefix)
+        end = bisect.bisect_left(keys, prefix + "\uffff")
+        return keys[start:end]
+
+    def _code_matches(self, query: str, scores: dict):
+        match = _CODE_RE.match(query)
+        if not match:
+            return None
+        term, subject, catalog = match.group(1), match.group(2).upper(), (match.group(3) or "").upper()
+        if catalog:
+            for key in self._prefixed(self.code_keys, subject + catalog):
+                score = 100 if key == subject + catalog else 80
+                for idx in self.by_code[key]:
+                    scores[idx] = max(scores.get(idx, 0), score)
+        else:
+            for key in self._prefixed(self.subject_keys, subject):
+                score = 60 if key == subject else 40
+                for idx in self.by_subject[key]:
+                    scores[idx] = max(scores.get(idx, 0), score)
+        return term
+
+    def lookup_code(self, query: str, term: str = None) -> list:
+        """Entries whose code is exactly the one in query ("CS136", "1261cs 136"), newest term first."""
+        match = _CODE_RE.match((query or "").strip())
+        if not match or not match.group(3):
+            return []
+        term = term or match.group(1)
+        indexes = self.by_code.get(match.group(2).upper() + match.group(3).upper(), [])
+        entries = [self.entries[idx] for idx in sorted(indexes, key=lambda idx: self.tiebreak[idx])]
+        return [e for e in entries if not term or e["term"] == term]
+
+    def _close_words(self, word: str) -> list:
+        shared = {}
+        for gram in _trigrams(word):
+            for candidate in self.trigram_index.get(gram, ()):
+                shared[candidate] = shared.get(candidate, 0) + 1
+        candidates = heapq.nlargest(FUZZY_MAX_CANDIDATES, shared, key=shared.get)
+        return difflib.get_close_matches(word, candidates, n=3, cutoff=0.8)
+
+    def _title_matches(self, query: str, scores: dict):
+        words = _words(query)
+        if not words:
+            return
+        hits = {}
+        for i, word in enumerate(words):
+            matched = set(self.title_index.get(word, ()))
+            if i == len(words) - 1:
+                # The last word may still be being typed.
+                for key in self._prefixed(self.vocabulary, word):
+                    matched |= self.title_index[key]
+            if not matched:
+                for key in self._close_words(word):
+                    matched |= self.title_index[key]
+            for idx in matched:
+                hits[idx] = hits.get(idx, 0) + 1
+        for idx, count in hits.items():
+            if count * 2 >= len(words):
+                scores[idx] = max(scores.get(idx, 0), int(50 * count / len(words)))
+
+    def search(self, query: str, term: str = None, limit: int = SEARCH_DEFAULT_LIMIT) -> list:
+        """Entries matching query by code, code prefix or title, best first."""
+        query = (query or "").strip()
+        scores = {}
+        query_term = self._code_matches(query, scores)
+        self._title_matches(query, scores)
+        term = str(term or query_term or "").strip()
+        if term:
+            scores = {idx: s for idx, s in scores.items() if self.entries[idx]["term"] == term}
+        ranked = heapq.nsmallest(limit, scores, key=lambda idx: (-scores[idx], self.tiebreak[idx]))
+        return [self.entries[idx] for idx in ranked]
+
+
+def _rows_from_table(table: dict) -> list:
+    columns = table.get("columns") or CATALOG_COLUMNS
+    positions = [columns.index(c) for c in CATALOG_COLUMNS]
+    rows = json.loads(table["rows_json"]) if "rows_json" in table else table.get("rows", [])
+    return [[row[p] for p in positions] for row in rows]
+
+
+def _load_rows(db) -> list:
+    if COURSE_CATALOG_PATH and os.path.exists(COURSE_CATALOG_PATH):
+        with open(COURSE_CATALOG_PATH, "r", encoding="utf-8") as f:
+            return _rows_from_table(json.load(f))
+
+    rows = []
+    for doc in db.collection(COURSE_CATALOG_COLLECTION).stream():
+        rows.extend(_rows_from_table(doc.to_dict() or {}))
+    if rows:
+        return rows
+
+    print("Course catalog export not found; indexing the courses collection.")
+    for doc in db.collection("courses").select(["term", "subject", "catalog", "title", "units"]).stream():
+        data = doc.to_dict() or {}
+        term = data.get("term") or doc.id.split("_", 1)[0]
+        rows.append([term, data.get("subject", ""), data.get("catalog", ""), data.get("title", ""), data.get("units", "")])
+    return rows
+
+
+_CATALOG = None
+_catalog_lock = threading.Lock()
+_loaded_version = None
+_loaded_at = 0.0
+_building = False
+_next_attempt = 0.0
+
+
+def _build(db, version):
+    global _CATALOG, _loaded_version, _loaded_at, _building, _next_attempt
+    try:
+        catalog = CourseCatalog(_load_rows(db))
+    except Exception as e:
+        print(f"Course catalog build failed, keeping the previous index: {e}")
+        with _catalog_lock:
+            # Try again after COURSE_CATALOG_RETRY_SECS rather than on every call.
+            _next_attempt = time.monotonic() + COURSE_CATALOG_RETRY_SECS
+            _building = False
+        return
+    with _catalog_lock:
+        _CATALOG = catalog
+        _loaded_version = version
+        _loaded_at = time.monotonic()
+        _building = False
+    print(f"Course catalog indexed {len(catalog)} courses.")
+
+
+def warm_course_catalog(db, version=None):
+    """Start building the catalog in a background thread, unless a build is already running."""
+    global _building
+    with _catalog_lock:
+        if _building or time.monotonic() < _next_attempt:
+            return
+        _building = True
+    if version is None:
+        version = courses_version(db)
+    threading.Thread(target=_build, args=(db, version), name="course-catalog", daemon=True).start()
+
+
+def get_course_catalog(db):
+    """
+    The shared catalog, or None until the first build finishes. Builds never run
+    on the caller: the server warms the index at startup, and when the populate
+    job publishes a new courses version or the TTL runs out, a background
+    rebuild starts while the previous index keeps serving.
+    """
+    version = courses_version(db)
+    catalog = _CATALOG
+    if (
+        catalog is None
+        or version != _loaded_version
+        or time.monotonic() - _loaded_at >= COURSE_CATALOG_TTL_SECS
+    ):
+        warm_course_catalog(db, version)
+    return catalog
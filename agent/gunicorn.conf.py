@@ -0,0 +1,52 @@
+"""
+Production serving config for the agent backend.
+
+    gunicorn -c agent/gunicorn.conf.py
+
+The default "gevent" worker class monkey-patches sockets, so a request that
+is waiting on the LLM provider or SerpAPI yields to other requests instead of
+holding an OS thread. Every worker process can then serve AGENT_WEB_CONCURRENCY
+chats at once. Set AGENT_WEB_WORKER_CLASS=gthread to use a plain thread pool
+of AGENT_WEB_THREADS per worker instead.
+
+With more than one worker, rate limits default to the shared SQLite usage
+store so that all workers enforce a single limit.
+"""
+
+import os
+
+chdir = os.path.dirname(os.path.abspath(__file__))
+wsgi_app = "server_agent:app"
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+
+workers = int(os.environ.get("AGENT_WEB_WORKERS", "2"))
+worker_class = os.environ.get("AGENT_WEB_WORKER_CLASS", "gevent")
+worker_connections = int(os.environ.get("AGENT_WEB_CONCURRENCY", "100"))
+threads = int(os.environ.get("AGENT_WEB_THREADS", "8"))
+
+if workers > 1:
+    os.environ.setdefault("AGENT_USAGE_BACKEND", "sqlite")
+
+# A chat can run up to AGENT_MAX_TOOL_CALLS_PER_REQUEST tool rounds, each with a
+# 45s LLM call, so allow long requests before the arbiter kills a worker.
+timeout = int(os.environ.get("AGENT_WEB_TIMEOUT_SECS", "600"))
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = "-"
+errorlog = "-"
+
+
+def post_worker_init(worker):
+    # Firestore talks gRPC, which has its own event loop. Make it cooperate with
+    # gevent before the first Firestore client is created in this worker.
+    if worker_class == "gevent":
+        from grpc.experimental import gevent as grpc_gevent
+        grpc_gevent.init_gevent()
+
+    # Index the course catalog in the background, so no chat request builds it.
+    import firebase_admin
+    if firebase_admin._apps:
+        from firebase_admin import firestore
+        from course_catalog import warm_course_catalog
+        warm_course_catalog(firestore.client())
@@ -0,0 +1,221 @@
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import requests
+from requests.adapters import HTTPAdapter
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+LLM_MAX_RETRIES = int(os.getenv("AGENT_LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BASE_DELAY_SECS = float(os.getenv("AGENT_LLM_RETRY_BASE_DELAY_SECS", "0.5"))
+LLM_RETRY_MAX_DELAY_SECS = float(os.getenv("AGENT_LLM_RETRY_MAX_DELAY_SECS", "8"))
+
+# Hedging sends a duplicate non-streaming request once the first has been
+# outstanding longer than the recent p95 latency, and keeps whichever answers
+# first. It trades a few percent of extra provider calls for a shorter tail.
+LLM_HEDGE_REQUESTS = os.getenv("AGENT_LLM_HEDGE_REQUESTS", "0") == "1"
+LLM_HEDGE_MIN_DELAY_SECS = float(os.getenv("AGENT_LLM_HEDGE_MIN_DELAY_SECS", "2"))
+LLM_HEDGE_MIN_SAMPLES = 20
+
+LLM_BREAKER_FAILURE_THRESHOLD = int(os.getenv("AGENT_LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_COOLDOWN_SECS = float(os.getenv("AGENT_LLM_BREAKER_COOLDOWN_SECS", "30"))
+
+LLM_POOL_SIZE = int(os.getenv("AGENT_LLM_POOL_SIZE", "32"))
+LLM_LATENCY_WINDOW = 200
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling the provider while its circuit breaker is open."""
+
+
+class RetryableStatusError(requests.HTTPError):
+    pass
+
+
+def create_http_session(pool_size: int = LLM_POOL_SIZE) -> requests.Session:
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def _close_response(future):
+    if future.exception() is None:
+        future.result().close()
+
+
+class CircuitBreaker:
+    """
+    Opens after LLM_BREAKER_FAILURE_THRESHOLD consecutive failed calls, fails
+    fast for the cooldown, then lets a single trial call through (half-open).
+    """
+
+    def __init__(self, failure_threshold: int, cooldown_secs: float):
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown_secs = cooldown_secs
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.cooldown_secs or self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+    @property
+    def is_open(self) -> bool:
+        with self._lock:
+            return self._opened_at is not None
+
+
+class ResilientLLMClient:
+    """
+    POSTs to one LLM provider with jittered retries on 429/5xx and network
+    errors, optional hedged requests and a circuit breaker. Instances are shared
+    across requests. Per-call outcomes are added to the stats dict that the
+    caller passes in.
+    """
+
+    def __init__(self, session: requests.Session):
+        self.session = session
+        self.breaker = CircuitBreaker(LLM_BREAKER_FAILURE_THRESHOLD, LLM_BREAKER_COOLDOWN_SECS)
+        self._latencies = deque(maxlen=LLM_LATENCY_WINDOW)
+        self._latency_lock = threading.Lock()
+        self._hedge_pool = ThreadPoolExecutor(max_workers=max(2, LLM_POOL_SIZE), thread_name_prefix="llm-hedge")
+
+    def _record_latency(self, secs: float):
+        with self._latency_lock:
+            self._latencies.append(secs)
+
+    def p95_latency(self):
+        with self._latency_lock:
+            if len(self._latencies) < LLM_HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    def _post_once(self, url: str, headers: dict, payload: dict, timeout: float, stream: bool):
+        start = time.monotonic()
+        response = self.session.post(url, headers=headers, json=payload, timeout=timeout, stream=stream)
+        if response.status_code in RETRYABLE_STATUS_CODES:
+            response.close()
+            raise RetryableStatusError(f"{response.status_code} from LLM provider", response=response)
+        response.raise_for_status()
+        if not stream:
+            self._record_latency(time.monotonic() - start)
+        return response
+
+    def _post_hedged(self, url: str, headers: dict, payload: dict, timeout: float, stats: dict):
+        delay = self.p95_latency()
+        if delay is None:
+            return self._post_once(url, headers, payload, timeout, False)
+        delay = max(delay, LLM_HEDGE_MIN_DELAY_SECS)
+
+        primary = self._hedge_pool.submit(self._post_once, url, headers, payload, timeout, False)
+        done, _ = wait([primary], timeout=delay)
+        if done:
+            return primary.result()
+
+        stats["hedged"] = stats.get("hedged", 0) + 1
+        hedge = self._hedge_pool.submit(self._post_once, url, headers, payload, timeout, False)
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    response = future.result()
+                except Exception as e:
+                    error = e
+                    continue
+                if future is hedge:
+                    stats["hedge_wins"] = stats.get("hedge_wins", 0) + 1
+                # The slower duplicate finishes in the background; drop its reply.
+                for other in pending:
+                    other.add_done_callback(_close_response)
+                return response
+        raise error
+
+    def post(self, url: str, headers: dict, payload: dict, timeout: float, stats: dict, stream: bool = False):
+        """
+        Return a successful requests.Response or raise. Streaming calls are only
+        retried before the response starts, and are never hedged.
+        """
+        stats["calls"] = stats.get("calls", 0) + 1
+        if not self.breaker.allow():
+            stats["circuit_open"] = stats.get("circuit_open", 0) + 1
+            raise CircuitOpenError("LLM provider circuit breaker is open")
+
+        attempt = 0
+        while True:
+            try:
+                if LLM_HEDGE_REQUESTS and not stream:
+                    response = self._post_hedged(url, headers, payload, timeout, stats)
+                else:
+                    response = self._post_once(url, headers, payload, timeout, stream)
+                self.breaker.record_success()
+                return response
+            except (RetryableStatusError, requests.ConnectionError, requests.Timeout) as e:
+                if attempt >= LLM_MAX_RETRIES:
+                    self.breaker.record_failure()
+                    stats["failures"] = stats.get("failures", 0) + 1
+                    raise
+                attempt += 1
+                stats["retries"] = stats.get("retries", 0) + 1
+                time.sleep(self._retry_delay(attempt, e))
+            except requests.HTTPError:
+                # 4xx other than 429 means a bad request, not an unhealthy provider.
+                stats["failures"] = stats.get("failures", 0) + 1
+                self.breaker.record_success()
+                raise
+            except Exception:
+                stats["failures"] = stats.get("failures", 0) + 1
+                self.breaker.record_failure()
+                raise
+
+    def _retry_delay(self, attempt: int, error: Exception) -> float:
+        response = getattr(error, "response", None)
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after:
+            try:
+                return min(float(retry_after), LLM_RETRY_MAX_DELAY_SECS)
+            except ValueError:
+                pass
+        # Full jitter keeps concurrent requests from retrying in lockstep.
+        return random.uniform(0, min(LLM_RETRY_MAX_DELAY_SECS, LLM_RETRY_BASE_DELAY_SECS * (2 ** attempt)))
+
+
+_CLIENTS = {}
+_clients_lock = threading.Lock()
+
+
+def get_llm_client(key: str, session: requests.Session) -> ResilientLLMClient:
+    """One client (and so one breaker and latency window) per provider key."""
+    with _clients_lock:
+        client = _CLIENTS.get(key)
+        if client is None:
+            client = ResilientLLMClient(session)
+            _CLIENTS[key] = client
+        return client
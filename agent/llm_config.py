@@ -2,22 +2,38 @@ import os
 
 # SiliconFlow API Configuration
 SILICONFLOW_API_KEY = os.getenv("SILICONFLOW_API_KEY", "your_api_key_here")
-SILICONFLOW_BASE_URL = "https://api.siliconflow.cn/v1"
+SILICONFLOW_BASE_URL = os.getenv("SILICONFLOW_BASE_URL", "https://api.siliconflow.cn/v1")
 
 # SerpAPI Configuration
 SERPAPI_API_KEY = os.getenv("SERPAPI_API_KEY", "your_serpapi_key_here")
 
 # Model Configuration
 MODEL_NAME = "Pro/MiniMaxAI/MiniMax-M2.5" # Need a text model with tool-calling capabilities
+# Optional small, fast model for the short single-shot tasks (chat titles,
+# email drafts). Unset, everything goes to MODEL_NAME.
+FAST_MODEL_NAME = os.getenv("FAST_MODEL_NAME", "")
 TEMPERATURE = 0.7
 MAX_TOKENS = 4096
 
+# Entries are tried in order for each task class they list under "tasks":
+# summarize, email, tool_planning and final. The model router skips entries
+# whose recent error rate or latency has degraded. An optional "max_p95_secs"
+# sets an entry's latency budget. Rounds routed as final may still be offered
+# tools, so entries serving "final" need tool calling too.
 LLM_CONFIG = {
     "config_list": [
+        *([{
+            "model": FAST_MODEL_NAME,
+            "api_key": SILICONFLOW_API_KEY,
+            "base_url": SILICONFLOW_BASE_URL,
+            "tasks": ["summarize", "email"],
+            "max_p95_secs": 10,
+        }] if FAST_MODEL_NAME else []),
         {
             "model": MODEL_NAME,
             "api_key": SILICONFLOW_API_KEY,
             "base_url": SILICONFLOW_BASE_URL,
+            "tasks": ["summarize", "email", "tool_planning", "final"],
         }
     ],
     "temperature": TEMPERATURE,
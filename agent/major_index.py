@@ -0,0 +1,93 @@
+import os
+import threading
+import time
+from cache import TTLCache
+from parse_scripts import load_parse_script
+
+# Program slugs come from parse/script_populate_programs.py; use its slugify so
+# both sides agree on the same form.
+slugify = load_parse_script("script_populate_programs").slugify
+
+MAJOR_REQUIREMENT_COLLECTION = "major_graduation_requirement"
+MAJOR_INDEX_TTL_SECS = int(os.getenv("AGENT_MAJOR_INDEX_TTL_SECS", "3600"))
+# A miss reloads the index early, but at most this often, so a newly added
+# major is found without letting misses trigger a scan each.
+MAJOR_INDEX_MISS_RELOAD_SECS = int(os.getenv("AGENT_MAJOR_INDEX_MISS_RELOAD_SECS", "300"))
+
+_REQUIREMENT_CACHE = TTLCache(256, MAJOR_INDEX_TTL_SECS)
+
+
+def _normalize(value) -> str:
+    return " ".join(str(value or "").lower().replace("_", " ").replace("-", " ").split())
+
+
+def _keys(value) -> set:
+    keys = {_normalize(value), slugify(str(value or ""))}
+    keys.discard("")
+    return keys
+
+
+class MajorRequirementIndex:
+    """Maps normalized and slugified major, majorName and doc id values to doc ids."""
+
+    def __init__(self):
+        self._keys = {}
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def _load(self, db):
+        keys = {}
+        docs = db.collection(MAJOR_REQUIREMENT_COLLECTION).select(["major", "majorName"]).stream()
+        for doc in docs:
+            data = doc.to_dict() or {}
+            # Doc ids win over names when two documents share a key.
+            for value in (data.get("majorName"), data.get("major"), doc.id):
+                for key in _keys(value):
+                    keys[key] = doc.id
+        self._keys = keys
+        self._loaded_at = time.monotonic()
+        print(f"Major requirement index loaded {len(keys)} keys.")
+
+    def _age(self):
+        return None if self._loaded_at is None else time.monotonic() - self._loaded_at
+
+    def resolve(self, db, requested: str):
+        """The doc id for a major slug, code or name, or None."""
+        age = self._age()
+        if age is None or age > MAJOR_INDEX_TTL_SECS:
+            with self._lock:
+                age = self._age()
+                if age is None or age > MAJOR_INDEX_TTL_SECS:
+                    self._load(db)
+        doc_id = self._lookup(requested)
+        if doc_id is None and self._age() > MAJOR_INDEX_MISS_RELOAD_SECS:
+            with self._lock:
+                if self._age() > MAJOR_INDEX_MISS_RELOAD_SECS:
+                    self._load(db)
+            doc_id = self._lookup(requested)
+        return doc_id
+
+    def _lookup(self, requested: str):
+        for key in _keys(requested):
+            if key in self._keys:
+                return self._keys[key]
+        return None
+
+
+_INDEX = MajorRequirementIndex()
+
+
+def get_major_requirement(db, requested: str):
+    """
+    Return (doc_id, payload) for a major, or (None, None). Payloads are cached
+    and shared across requests, so treat them as read-only.
+    """
+    doc_id = _INDEX.resolve(db, requested)
+    if doc_id is None:
+        return None, None
+    found, payload = _REQUIREMENT_CACHE.lookup(doc_id)
+    if not found:
+        doc = db.collection(MAJOR_REQUIREMENT_COLLECTION).document(doc_id).get()
+        payload = (doc.to_dict() or {}) if doc.exists else None
+        _REQUIREMENT_CACHE.set(doc_id, payload)
+    return (doc_id, payload) if payload is not None else (None, None)
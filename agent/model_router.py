@@ -0,0 +1,90 @@
+import os
+import threading
+import time
+from collections import deque
+from llm_config import LLM_CONFIG
+
+TASK_SUMMARIZE = "summarize"
+TASK_EMAIL = "email"
+TASK_TOOL_PLANNING = "tool_planning"
+TASK_FINAL = "final"
+
+# An endpoint counts as degraded when too many of its recent calls failed, or
+# when its recent p95 latency exceeds the entry's optional "max_p95_secs".
+# Samples age out after the window, so a degraded endpoint is tried again once
+# its bad samples have expired.
+ROUTER_WINDOW_SECS = int(os.getenv("AGENT_ROUTER_WINDOW_SECS", "300"))
+ROUTER_MAX_ERROR_RATE = float(os.getenv("AGENT_ROUTER_MAX_ERROR_RATE", "0.3"))
+ROUTER_MIN_SAMPLES = int(os.getenv("AGENT_ROUTER_MIN_SAMPLES", "5"))
+ROUTER_MAX_SAMPLES = 200
+
+
+def endpoint_key(entry: dict) -> str:
+    return f"{entry['model']}@{entry['base_url']}"
+
+
+class _EndpointHealth:
+    def __init__(self):
+        self.samples = deque(maxlen=ROUTER_MAX_SAMPLES)
+
+    def _prune(self, now: float):
+        while self.samples and now - self.samples[0][0] > ROUTER_WINDOW_SECS:
+            self.samples.popleft()
+
+    def snapshot(self, now: float) -> dict:
+        self._prune(now)
+        count = len(self.samples)
+        if not count:
+            return {"samples": 0, "error_rate": 0.0, "p95_secs": None}
+        errors = sum(1 for _, ok, _ in self.samples if not ok)
+        latencies = sorted(latency for _, ok, latency in self.samples if ok)
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] if latencies else None
+        return {"samples": count, "error_rate": errors / count, "p95_secs": p95}
+
+
+class ModelRouter:
+    """
+    Chooses config_list entries per task class. Each entry may list the tasks it
+    serves in "tasks", and entries without that key serve every task. Candidates
+    keep their config order, which is the preference order. Healthy endpoints
+    come before degraded ones, so a call fails over to the next entry.
+    """
+
+    def __init__(self, config_list: list):
+        self.config_list = list(config_list)
+        self._health = {endpoint_key(entry): _EndpointHealth() for entry in self.config_list}
+        self._lock = threading.Lock()
+
+    def _degraded(self, entry: dict, now: float) -> bool:
+        stats = self._health[endpoint_key(entry)].snapshot(now)
+        if stats["samples"] < ROUTER_MIN_SAMPLES:
+            return False
+        if stats["error_rate"] > ROUTER_MAX_ERROR_RATE:
+            return True
+        max_p95 = entry.get("max_p95_secs")
+        return bool(max_p95 and stats["p95_secs"] is not None and stats["p95_secs"] > max_p95)
+
+    def candidates(self, task: str) -> list:
+        """Entries to try for task, best first."""
+        matching = [e for e in self.config_list if task in e.get("tasks", [task])] or self.config_list
+        now = time.monotonic()
+        with self._lock:
+            healthy = [e for e in matching if not self._degraded(e, now)]
+            degraded = [e for e in matching if e not in healthy]
+        return healthy + degraded
+
+    def record(self, entry: dict, ok: bool, latency_secs: float):
+        with self._lock:
+            self._health[endpoint_key(entry)].samples.append((time.monotonic(), ok, latency_secs))
+
+    def health(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            return {key: health.snapshot(now) for key, health in self._health.items()}
+
+
+_ROUTER = ModelRouter(LLM_CONFIG["config_list"])
+
+
+def get_model_router() -> ModelRouter:
+    return _ROUTER
@@ -0,0 +1,142 @@
+from parse_scripts import load_parse_script
+
+# parse/meeting_times.py is shared with the scraper, which stores its output as
+# section["meetings"].
+_meetings_module = load_parse_script("meeting_times")
+parse_meetings = _meetings_module.parse_meetings
+mask_to_days = _meetings_module.mask_to_days
+
+# A week is one integer bitmask: each day has SLOTS_PER_DAY bits, one per
+# 5-minute slot, so two meeting patterns overlap exactly when their masks AND
+# to a non-zero value. Section times are on 5-minute boundaries; an odd minute
+# rounds outward, which can only report a conflict, never hide one.
+DAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+SLOT_MINUTES = 5
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+_DAY_SLOT_MASK = (1 << SLOTS_PER_DAY) - 1
+
+
+def meeting_fields(meetings: list) -> dict:
+    """Timetable fields for a section's first meeting; zero times and no days when it has none."""
+    if not meetings:
+        return {"startHour": 0, "startMinute": 0, "endHour": 0, "endMinute": 0, "days": []}
+    meeting = meetings[0]
+    return {
+        "startHour": meeting["start"] // 60,
+        "startMinute": meeting["start"] % 60,
+        "endHour": meeting["end"] // 60,
+        "endMinute": meeting["end"] % 60,
+        "days": mask_to_days(meeting["days"])
+    }
+
+
+def section_entry(term: str, course_code: str, course_data: dict, section: dict) -> dict:
+    """The timetable course entry for one section of a courses/{doc_id} payload."""
+    meetings = section.get("meetings")
+    if meetings is None:
+        meetings = parse_meetings(section.get("time_date", ""))
+    t_info = meeting_fields(meetings)
+    return {
+        "code": str(course_code),
+        "title": str(course_data.get("title", "")),
+        "term": str(term),
+        "units": str(course_data.get("units", "0.5")),
+        "classNumber": str(section.get("class", "")),
+        "component": str(section.get("component", "")),
+        "days": t_info["days"],
+        "startHour": int(t_info["startHour"]),
+        "startMinute": int(t_info["startMinute"]),
+        "endHour": int(t_info["endHour"]),
+        "endMinute": int(t_info["endMinute"]),
+        "location": str(section.get("location", ""))
+    }
+
+
+def week_mask(days: list, start_minute: int, end_minute: int) -> int:
+    """Bitmask of the slots from start_minute to end_minute on each of days."""
+    if not days or end_minute <= start_minute:
+        return 0
+    first = max(0, start_minute // SLOT_MINUTES)
+    last = min(SLOTS_PER_DAY, -(-end_minute // SLOT_MINUTES))
+    day_bits = ((1 << (last - first)) - 1) << first
+    mask = 0
+    for day in days:
+        if day in DAYS:
+            mask |= day_bits << (DAYS.index(day) * SLOTS_PER_DAY)
+    return mask
+
+
+def course_mask(course: dict) -> int:
+    """Mask of a timetable course entry (days, startHour, ..., endMinute)."""
+    start = int(course.get("startHour", 0) or 0) * 60 + int(course.get("startMinute", 0) or 0)
+    end = int(course.get("endHour", 0) or 0) * 60 + int(course.get("endMinute", 0) or 0)
+    return week_mask(course.get("days") or [], start, end)
+
+
+def mask_days(mask: int) -> list:
+    return [day for i, day in enumerate(DAYS) if (mask >> (i * SLOTS_PER_DAY)) & _DAY_SLOT_MASK]
+
+
+def format_time(course: dict) -> str:
+    return (
+        f"{int(course.get('startHour', 0) or 0):02d}:{int(course.get('startMinute', 0) or 0):02d}-"
+        f"{int(course.get('endHour', 0) or 0):02d}:{int(course.get('endMinute', 0) or 0):02d}"
+    )
+
+
+class Occupancy:
+    """
+    The occupied slots of a set of timetable entries. `mask` is the union of
+    every entry, so a free candidate is rejected or accepted with one AND; the
+    entries are only scanned to name what a conflicting candidate hits.
+    """
+
+    def __init__(self, courses: list = ()):
+        self.entries = []
+        self.mask = 0
+        for course in courses:
+            self.add(course)
+
+    def add(self, course: dict, mask: int = None):
+        mask = course_mask(course) if mask is None else mask
+        self.entries.append((course, mask))
+        self.mask |= mask
+
+    def remove(self, predicate):
+        """Drop the entries for which predicate(course) is true."""
+        kept = [(course, mask) for course, mask in self.entries if not predicate(course)]
+        if len(kept) != len(self.entries):
+            self.entries = kept
+            self.mask = 0
+            for _, mask in kept:
+                self.mask |= mask
+
+    def conflicts(self, mask: int, ignore=None) -> list:
+        """(course, overlap mask) for each entry that mask overlaps, skipping ignore(course)."""
+        if not mask & self.mask:
+            return []
+        return [
+            (course, mask & other)
+            for course, other in self.entries
+            if mask & other and not (ignore and ignore(course))
+        ]
+
+
+def term_occupancy(courses: list, term) -> Occupancy:
+    """
+    Occupancy of a timetable's entries in term. A timetable holds tens of
+    entries at most, so this is rebuilt from the stored courses on each call
+    rather than persisted next to them, where every edit from another device
+    would have to invalidate it.
+    """
+    term = str(term)
+    return Occupancy(c for c in courses if str(c.get("term", "")) == term)
+
+
+def replaces(course_code: str, term: str, component: str):
+    """
+    Predicate for the entries that adding component of course_code replaces:
+    the same course and component type, such as an earlier LEC of that course.
+    """
+    prefix = component.split(" ")[0] if " " in component else component
+    return lambda c: c.get("code") == course_code and c.get("term") == term and c.get("component", "").startswith(prefix)
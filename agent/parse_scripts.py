@@ -0,0 +1,19 @@
+import importlib.util
+import os
+import sys
+
+# parse/ is a folder of scripts shared with the scraper, not a package, so the
+# agent loads the ones it needs by path. Each script is loaded once per process.
+PARSE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "parse")
+
+
+def load_parse_script(name: str):
+    """The module for parse/<name>.py."""
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    spec = importlib.util.spec_from_file_location(name, os.path.join(PARSE_DIR, f"{name}.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    sys.modules[name] = module
+    return module
@@ -0,0 +1,136 @@
+import io
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, wait
+
+# Documents with at least this many pages are split across a process pool.
+# Smaller ones are faster to extract inline than to ship to another process.
+PDF_PARALLEL_PAGE_THRESHOLD = int(os.getenv("AGENT_PDF_PARALLEL_PAGE_THRESHOLD", "8"))
+PDF_WORKERS = int(os.getenv("AGENT_PDF_WORKERS", str(min(4, os.cpu_count() or 1))))
+PDF_MAX_PAGES = int(os.getenv("AGENT_PDF_MAX_PAGES", "50"))
+PDF_TIME_BUDGET_SECS = float(os.getenv("AGENT_PDF_TIME_BUDGET_SECS", "10"))
+# Small tasks let a time budget keep every page finished so far.
+PDF_PAGES_PER_TASK = 4
+# Workers read the document from a temp file written once per extraction, so
+# the bytes are not pickled into every task.
+PDF_TEMP_DIR = os.getenv("AGENT_PDF_TEMP_DIR") or None
+
+_POOL = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _POOL
+    with _pool_lock:
+        if _POOL is None:
+            # spawn, not fork: forking a process that already runs gRPC or gevent
+            # threads can deadlock the child.
+            _POOL = ProcessPoolExecutor(
+                max_workers=max(1, PDF_WORKERS),
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _POOL
+
+
+def _extract_pages(path: str, start: int, stop: int, deadline: float = None) -> list:
+    """
+    Worker entry point: text of pages [start, stop), one string per page. Stops
+    before the next page once time.time() passes deadline, so the list may be
+    short. A task still running at the deadline thus overruns it by at most one
+    page, and the parent has already stopped waiting for its result.
+    """
+    import pypdf
+    reader = pypdf.PdfReader(path)
+    pages = []
+    for i in range(start, stop):
+        if deadline is not None and time.time() >= deadline:
+            break
+        pages.append(reader.pages[i].extract_text() or "")
+    return pages
+
+
+def _page_chunks(page_count: int, workers: int) -> list:
+    # At least two chunks per worker keep the pool busy when pages differ in cost.
+    chunk_count = min(page_count, max(workers * 2, -(-page_count // PDF_PAGES_PER_TASK)))
+    size, extra = divmod(page_count, chunk_count)
+    chunks, start = [], 0
+    for i in range(chunk_count):
+        stop = start + size + (1 if i < extra else 0)
+        chunks.append((start, stop))
+        start = stop
+    return chunks
+
+
+def extract_pdf_text(data: bytes, max_pages: int = PDF_MAX_PAGES, time_budget_secs: float = PDF_TIME_BUDGET_SECS, parallel: bool = None):
+    """
+    Return (text, info) for a PDF. Pages are joined in page order. At most
+    max_pages pages are read, and extraction stops at the time budget. Either
+    limit leaves a marker in the text, so the model knows the text is partial.
+    info has page_count, pages_extracted, truncated, timed_out and parallel.
+    """
+    import pypdf
+    deadline = time.monotonic() + time_budget_secs if time_budget_secs else None
+    reader = pypdf.PdfReader(io.BytesIO(data))
+    page_count = len(reader.pages)
+    target = min(page_count, max_pages) if max_pages else page_count
+    if parallel is None:
+        parallel = PDF_WORKERS > 1 and target >= PDF_PARALLEL_PAGE_THRESHOLD
+
+    pages = [None] * target
+    if parallel:
+        remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+        # Workers compare against wall-clock time, which they share with this process.
+        worker_deadline = None if remaining is None else time.time() + remaining
+        with tempfile.NamedTemporaryFile(prefix="agent-pdf-", suffix=".pdf", dir=PDF_TEMP_DIR, delete=False) as f:
+            f.write(data)
+        try:
+            futures = {
+                _get_pool().submit(_extract_pages, f.name, start, stop, worker_deadline): start
+                for start, stop in _page_chunks(target, PDF_WORKERS)
+            }
+            done, not_done = wait(futures, timeout=remaining)
+            # Queued tasks are cancelled. A task that already started stops at its
+            # next page check, and one that starts after the file is removed fails
+            # at once; either way its result is dropped.
+            for future in not_done:
+                future.cancel()
+            for future in done:
+                start = futures[future]
+                for offset, text in enumerate(future.result()):
+                    pages[start + offset] = text
+        finally:
+            os.unlink(f.name)
+    else:
+        for i in range(target):
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            pages[i] = reader.pages[i].extract_text() or ""
+
+    extracted = sum(1 for page in pages if page is not None)
+    timed_out = extracted < target
+    parts = []
+    missing_from = None
+    for i, page in enumerate(pages + [""]):
+        if page is None:
+            missing_from = i if missing_from is None else missing_from
+            continue
+        if missing_from is not None:
+            span = f"{missing_from + 1}" if missing_from == i - 1 else f"{missing_from + 1}-{i}"
+            parts.append(f"[Pages {span} not extracted: time budget exceeded.]")
+            missing_from = None
+        if page.strip():
+            parts.append(page.strip())
+    if target < page_count:
+        parts.append(f"[Extraction stopped after {target} of {page_count} pages.]")
+
+    info = {
+        "page_count": page_count,
+        "pages_extracted": extracted,
+        "truncated": target < page_count,
+        "timed_out": timed_out,
+        "parallel": parallel
+    }
+    return "\n".join(parts), info
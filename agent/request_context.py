@@ -0,0 +1,146 @@
+import copy
+import threading
+from firebase_admin import firestore
+from user_doc import apply_user_mutations
+
+
+class RequestContext:
+    """
+    State shared by everything that runs on behalf of one chat request.
+
+    The users/{uid} document is read at most once per request. Progress messages
+    and read-only tools see the same snapshot. Mutation tools record what they
+    committed, so later reads see the new state without another round trip.
+
+    Within a unit of work, mutation tools only stage their changes on the
+    snapshot. commit_unit_of_work() then replays them on a fresh read inside one
+    Firestore transaction and writes users/{uid} once.
+    """
+
+    def __init__(self, uid: str, db=None):
+        self.uid = uid
+        self._db = db
+        self._lock = threading.Lock()
+        self._user_exists = False
+        self._user_data = None
+        self.user_doc_reads = 0
+        self._staged_mutations = None
+        self._unit_of_work_base = None
+        self._search_cache_counts = {}
+
+    @property
+    def db(self):
+        if self._db is None:
+            self._db = firestore.client()
+        return self._db
+
+    @property
+    def user_ref(self):
+        return self.db.collection("users").document(self.uid)
+
+    def _ensure_user_loaded(self):
+        with self._lock:
+            if self._user_data is not None:
+                return
+            doc = self.user_ref.get()
+            self.user_doc_reads += 1
+            self._user_exists = doc.exists
+            self._user_data = (doc.to_dict() or {}) if doc.exists else {}
+
+    def user_exists(self) -> bool:
+        self._ensure_user_loaded()
+        return self._user_exists
+
+    def user_data(self) -> dict:
+        """The shared snapshot of users/{uid}. Callers must not mutate it."""
+        self._ensure_user_loaded()
+        return self._user_data
+
+    def user_data_copy(self) -> dict:
+        """A private deep copy that a mutation tool may edit freely."""
+        self._ensure_user_loaded()
+        with self._lock:
+            return copy.deepcopy(self._user_data)
+
+    def record_user_write(self, fields: dict):
+        """Apply fields that were just committed with set(..., merge=True)."""
+        self._ensure_user_loaded()
+        with self._lock:
+            self._user_data = {**self._user_data, **copy.deepcopy(fields)}
+            self._user_exists = True
+
+    def record_search_cache(self, outcome: str):
+        with self._lock:
+            self._search_cache_counts[outcome] = self._search_cache_counts.get(outcome, 0) + 1
+
+    def search_cache_metrics(self) -> dict:
+        with self._lock:
+            hits = self._search_cache_counts.get("hit", 0)
+            stale_hits = self._search_cache_counts.get("stale_hit", 0)
+            misses = self._search_cache_counts.get("miss", 0)
+        lookups = hits + stale_hits + misses
+        return {
+            "hits": hits,
+            "stale_hits": stale_hits,
+            "misses": misses,
+            "hit_rate": round((hits + stale_hits) / lookups, 3) if lookups else None
+        }
+
+    def begin_unit_of_work(self):
+        with self._lock:
+            self._staged_mutations = []
+            self._unit_of_work_base = None
+
+    def in_unit_of_work(self) -> bool:
+        return self._staged_mutations is not None
+
+    def staged_mutation_count(self) -> int:
+        return len(self._staged_mutations or [])
+
+    def stage_user_mutation(self, mutate) -> dict:
+        """
+        Apply mutate(exists, data) -> (result, fields) to the snapshot and queue it
+        for commit. Mutations that change nothing are not queued.
+        """
+        self._ensure_user_loaded()
+        with self._lock:
+            data = copy.deepcopy(self._user_data)
+            result, fields = mutate(self._user_exists, data)
+            if not fields:
+                return result
+            if self._unit_of_work_base is None:
+                self._unit_of_work_base = (self._user_exists, self._user_data)
+            self._staged_mutations.append(mutate)
+            self._user_exists = True
+            self._user_data = data
+            return result
+
+    def commit_unit_of_work(self) -> list:
+        """
+        Write every staged mutation in one transaction and end the unit of work.
+
+        Mutations are replayed against the document as read inside the transaction,
+        so edits made concurrently by another device are preserved. Returns the
+        replayed results in staging order. On failure the snapshot is rolled back
+        and the exception propagates.
+        """
+        with self._lock:
+            staged = self._staged_mutations or []
+            base = self._unit_of_work_base
+            self._staged_mutations = None
+            self._unit_of_work_base = None
+        if not staged:
+            return []
+
+        try:
+            exists, data, results = apply_user_mutations(self.db, self.uid, staged)
+        except Exception:
+            with self._lock:
+                self._user_exists, self._user_data = base
+            raise
+
+        with self._lock:
+            self.user_doc_reads += 1
+            self._user_exists = exists
+            self._user_data = data
+        return results
@@ -0,0 +1,54 @@
+import hashlib
+import json
+import os
+from cache import TTLCache
+
+# Content-addressed cache for the single-shot LLM endpoints (/summarize and
+# /generate_email). Keys hash the normalized prompt inputs together with the
+# model config, so a prompt or model change never serves an old answer.
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("AGENT_RESPONSE_CACHE_MAX_ENTRIES", "1024"))
+RESPONSE_CACHE_TTL_SECS = int(os.getenv("AGENT_RESPONSE_CACHE_TTL_SECS", "86400"))
+
+# Clients opt out per request with "Cache-Control: no-cache" (or no-store), or
+# with "X-Agent-Cache: bypass".
+BYPASS_HEADER = "X-Agent-Cache"
+
+# Responses report how they were served in their own header: hit, miss or bypass.
+STATUS_HEADER = "X-Agent-Cache-Status"
+
+_RESPONSE_CACHE = TTLCache(RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_TTL_SECS)
+
+
+def normalize_text(text, casefold: bool = False) -> str:
+    text = " ".join(str(text or "").split())
+    return text.casefold() if casefold else text
+
+
+def response_cache_key(service: str, model_config: dict, inputs: dict) -> str:
+    payload = json.dumps(
+        {"service": service, "model": model_config, "inputs": inputs},
+        sort_keys=True,
+        ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def cache_bypassed(headers) -> bool:
+    cache_control = (headers.get("Cache-Control") or "").lower()
+    if "no-cache" in cache_control or "no-store" in cache_control:
+        return True
+    return (headers.get(BYPASS_HEADER) or "").strip().lower() == "bypass"
+
+
+def get_cached_response(key: str):
+    """Return the cached response dict, or None on a miss."""
+    found, value = _RESPONSE_CACHE.lookup(key)
+    return value if found else None
+
+
+def store_response(key: str, value: dict):
+    _RESPONSE_CACHE.set(key, value)
+
+
+def response_cache_stats() -> dict:
+    return _RESPONSE_CACHE.stats()
@@ -1,7 +1,7 @@
 import os
 import json
 from agent import Agent # Adjust import path as needed
-from tools import read_uploaded_file, browse_online, query_database_readonly, create_timetable, add_course_to_timetable, delete_course_from_timetable, clear_timetable, show_timetable_button, TOOLS_SCHEMA
+from tools import read_uploaded_file, browse_online, browse_uwflow, query_database_readonly, search_courses, check_conflicts, generate_schedules, create_timetable, add_course_to_timetable, delete_course_from_timetable, clear_timetable, show_timetable_button, TOOLS_SCHEMA
 
 def main():
     """
@@ -67,8 +67,16 @@ def main():
                 try:
                     if func_name == "browse_online":
                         tool_response = browse_online(**args)
+                    elif func_name == "browse_uwflow":
+                        tool_response = browse_uwflow(**args)
                     elif func_name == "query_database_readonly":
                         tool_response = query_database_readonly(**args)
+                    elif func_name == "search_courses":
+                        tool_response = search_courses(**args)
+                    elif func_name == "check_conflicts":
+                        tool_response = check_conflicts(**args)
+                    elif func_name == "generate_schedules":
+                        tool_response = generate_schedules(**args)
                     elif func_name == "create_timetable":
                         tool_response = create_timetable(**args)
                     elif func_name == "add_course_to_timetable":
@@ -77,6 +85,8 @@ def main():
                         tool_response = delete_course_from_timetable(**args)
                     elif func_name == "clear_timetable":
                         tool_response = clear_timetable(**args)
+                    elif func_name == "show_timetable_button":
+                        tool_response = show_timetable_button(**args)
                     else:
                         tool_response = f"Warning: Function {func_name} not recognized."
                 except Exception as e:
@@ -0,0 +1,188 @@
+import itertools
+import os
+from course_cache import get_courses
+from course_catalog import course_doc_id
+from occupancy import course_mask, section_entry
+
+try:
+    from gevent import get_hub
+    from gevent.monkey import is_module_patched
+except ImportError:
+    get_hub = None
+
+SCHEDULE_DEFAULT_RESULTS = int(os.getenv("AGENT_SCHEDULE_DEFAULT_RESULTS", "5"))
+SCHEDULE_MAX_RESULTS = int(os.getenv("AGENT_SCHEDULE_MAX_RESULTS", "50"))
+# Caps the search itself, so a wishlist with no conflict-free schedule cannot
+# keep a worker busy. Each node is one partial schedule that was extended.
+SCHEDULE_MAX_NODES = int(os.getenv("AGENT_SCHEDULE_MAX_NODES", "200000"))
+SCHEDULE_MAX_COURSES = 12
+
+# Tests (TST) are one-off exam slots rather than weekly meetings, so they are
+# left out of generated schedules.
+SKIPPED_COMPONENTS = {"TST"}
+
+
+def component_type(component: str) -> str:
+    return (component or "").split(" ")[0]
+
+
+def normalize_course_code(code: str):
+    """("CS 136", "CS", "136") for "cs136", "CS 136" or "cs  136", else None."""
+    compact = "".join(str(code or "").split()).upper()
+    i = len(compact) - len(compact.lstrip("ABCDEFGHIJKLMNOPQRSTUVWXYZ"))
+    subject, catalog = compact[:i], compact[i:]
+    if not subject or not catalog or not catalog[0].isdigit():
+        return None
+    return f"{subject} {catalog}", subject, catalog
+
+
+class _Slot:
+    """
+    One component type of one course, such as the LECs of CS 136. Sections
+    that meet at exactly the same times are interchangeable for conflicts, so
+    they share one option; the first is scheduled and the rest are listed as
+    equivalents.
+    """
+
+    def __init__(self, course_code: str, component: str, entries: list):
+        self.course_code = course_code
+        self.component = component
+        by_mask = {}
+        for entry in entries:
+            by_mask.setdefault(course_mask(entry), []).append(entry)
+        self.options = list(by_mask.items())
+
+
+def course_slots(term: str, code: str, course_data: dict) -> list:
+    """The slots of one courses/{doc_id} payload, one per component type."""
+    by_component = {}
+    for section in course_data.get("sections", []):
+        kind = component_type(section.get("component", ""))
+        if kind and kind not in SKIPPED_COMPONENTS:
+            by_component.setdefault(kind, []).append(section_entry(term, code, course_data, section))
+    return [_Slot(code, kind, entries) for kind, entries in by_component.items()]
+
+
+def load_course_slots(db, term: str, course_codes: list):
+    """
+    Read the wishlist's courses in one batched read. Returns
+    ({course_code: [slots]}, not_found), keeping the wishlist order.
+    """
+    parsed = []
+    not_found = []
+    for raw in course_codes:
+        normalized = normalize_course_code(raw)
+        if normalized is None:
+            not_found.append(str(raw))
+        elif normalized[0] not in [p[0] for p in parsed]:
+            parsed.append(normalized)
+    courses = get_courses(db, [course_doc_id(term, subject, catalog) for _, subject, catalog in parsed])
+
+    slots_by_course = {}
+    for code, subject, catalog in parsed:
+        course_data = courses.get(course_doc_id(term, subject, catalog))
+        if not course_data or not course_data.get("sections"):
+            not_found.append(code)
+            continue
+        slots_by_course[code] = course_slots(term, code, course_data)
+    return slots_by_course, not_found
+
+
+class SearchBudgetExceeded(Exception):
+    pass
+
+
+def _search(slots: list, stats: dict, max_nodes: int):
+    """
+    Depth-first search over slots, most constrained first. After each choice,
+    every remaining slot must still have an option that fits, otherwise the
+    branch is dropped before it is explored.
+    """
+    slots = sorted(slots, key=lambda s: (len(s.options), s.course_code, s.component))
+    count = len(slots)
+    chosen = [None] * count
+
+    def extend(depth: int, occupied: int):
+        stats["nodes"] += 1
+        if stats["nodes"] > max_nodes:
+            raise SearchBudgetExceeded()
+        if depth == count:
+            yield [(slots[i], chosen[i]) for i in range(count)]
+            return
+        for mask, entries in slots[depth].options:
+            if mask & occupied:
+                continue
+            combined = occupied | mask
+            if any(all(m & combined for m, _ in slots[j].options) for j in range(depth + 1, count)):
+                stats["pruned"] += 1
+                continue
+            chosen[depth] = entries
+            yield from extend(depth + 1, combined)
+
+    yield from extend(0, 0)
+
+
+def _off_event_loop(iterator):
+    """
+    Yield the items of iterator. In a gevent worker each item is computed on
+    the hub's pool of native threads, so a long search leaves the event loop
+    free to run other requests, streaming chats included. The thread gives up
+    the GIL every few milliseconds. Elsewhere the iterator runs inline.
+    """
+    if get_hub is None or not is_module_patched("threading"):
+        yield from iterator
+        return
+    threadpool = get_hub().threadpool
+    done = object()
+    while True:
+        item = threadpool.apply(next, (iterator, done))
+        if item is done:
+            return
+        yield item
+
+
+def iter_schedules(slots_by_course: dict, subset_size: int = None, max_nodes: int = SCHEDULE_MAX_NODES, stats: dict = None):
+    """
+    Lazily yield conflict-free schedules. Each one is a list of timetable
+    entries, one per component of every course in a subset of subset_size
+    courses (all courses by default). Subsets are tried in wishlist order, as
+    the app does. Stops quietly once max_nodes search nodes have been used, and
+    then stats["exhausted"] is False. Under gevent the search runs off the
+    event loop (see _off_event_loop).
+    """
+    stats = {} if stats is None else stats
+    return _off_event_loop(_iter_schedules(slots_by_course, subset_size, max_nodes, stats))
+
+
+def _iter_schedules(slots_by_course: dict, subset_size: int, max_nodes: int, stats: dict):
+    stats.update({"nodes": 0, "pruned": 0, "exhausted": True})
+    codes = list(slots_by_course)
+    size = len(codes) if not subset_size else max(1, min(int(subset_size), len(codes)))
+    try:
+        for subset in itertools.combinations(codes, size):
+            slots = [slot for code in subset for slot in slots_by_course[code]]
+            for choice in _search(slots, stats, max_nodes):
+                schedule = []
+                for slot, entries in choice:
+                    entry = dict(entries[0])
+                    if len(entries) > 1:
+                        entry["equivalentComponents"] = [e["component"] for e in entries[1:]]
+                    schedule.append(entry)
+                schedule.sort(key=lambda e: (e["code"], e["component"]))
+                yield schedule
+    except SearchBudgetExceeded:
+        stats["exhausted"] = False
+
+
+def find_schedules(db, term: str, course_codes: list, subset_size: int = None, max_results: int = SCHEDULE_DEFAULT_RESULTS):
+    """Return (schedules, not_found, stats) with at most max_results schedules."""
+    max_results = max(1, min(int(max_results or SCHEDULE_DEFAULT_RESULTS), SCHEDULE_MAX_RESULTS))
+    course_codes = list(course_codes or [])
+    slots_by_course, not_found = load_course_slots(db, term, course_codes[:SCHEDULE_MAX_COURSES])
+    stats = {}
+    if len(course_codes) > SCHEDULE_MAX_COURSES:
+        stats["courses_ignored"] = [str(c) for c in course_codes[SCHEDULE_MAX_COURSES:]]
+    schedules = list(itertools.islice(iter_schedules(slots_by_course, subset_size, stats=stats), max_results))
+    if len(schedules) == max_results:
+        stats["exhausted"] = False
+    return schedules, not_found, stats
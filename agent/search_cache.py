@@ -0,0 +1,137 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from sqlite_store import connection
+
+HIT = "hit"
+STALE_HIT = "stale_hit"
+MISS = "miss"
+
+# Search results change slowly: course reviews and prerequisite pages are
+# updated a few times per term. Past its TTL, an entry is still served for
+# SEARCH_CACHE_STALE_SECS while one background refresh fetches a new copy.
+SEARCH_CACHE_TTL_SECS = {
+    "browse_online": int(os.getenv("AGENT_SEARCH_CACHE_TTL_ONLINE_SECS", str(6 * 3600))),
+    "browse_uwflow": int(os.getenv("AGENT_SEARCH_CACHE_TTL_UWFLOW_SECS", str(24 * 3600))),
+}
+SEARCH_CACHE_DEFAULT_TTL_SECS = 6 * 3600
+SEARCH_CACHE_STALE_SECS = int(os.getenv("AGENT_SEARCH_CACHE_STALE_SECS", str(7 * 24 * 3600)))
+SEARCH_CACHE_REFRESH_WORKERS = int(os.getenv("AGENT_SEARCH_CACHE_REFRESH_WORKERS", "2"))
+
+
+def normalize_query(query) -> str:
+    return " ".join(str(query or "").split()).casefold()
+
+
+class SQLiteSearchCache:
+    """
+    Disk-backed cache of search tool results, so popular queries survive
+    restarts and are shared by every worker process on the node.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._refreshing = set()
+        self._refresh_lock = threading.Lock()
+        self._refresh_pool = ThreadPoolExecutor(
+            max_workers=max(1, SEARCH_CACHE_REFRESH_WORKERS),
+            thread_name_prefix="search-refresh"
+        )
+        with connection(self.path) as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS search_cache ("
+                "tool TEXT, query TEXT, result TEXT, fetched_at REAL, PRIMARY KEY (tool, query))"
+            )
+
+    def _load(self, tool: str, query: str):
+        with connection(self.path) as conn:
+            row = conn.execute(
+                "SELECT result, fetched_at FROM search_cache WHERE tool = ? AND query = ?",
+                (tool, query)
+            ).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def _store(self, tool: str, query: str, result: str, now: float):
+        with connection(self.path) as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO search_cache (tool, query, result, fetched_at) VALUES (?, ?, ?, ?)",
+                (tool, query, result, now)
+            )
+            conn.execute(
+                "DELETE FROM search_cache WHERE fetched_at < ?",
+                (now - max(SEARCH_CACHE_TTL_SECS.values()) - SEARCH_CACHE_STALE_SECS,)
+            )
+
+    def _fetch_and_store(self, tool: str, query: str, fetch, raw_query: str) -> str:
+        result = fetch(raw_query)
+        # Errors are transient (timeouts, quota), so they always go back to SerpAPI.
+        if not result.startswith("Error"):
+            try:
+                self._store(tool, query, result, time.time())
+            except sqlite3.Error as e:
+                print(f"Search cache write failed: {e}")
+        return result
+
+    def _refresh_in_background(self, tool: str, query: str, fetch, raw_query: str):
+        key = (tool, query)
+        with self._refresh_lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def _refresh():
+            try:
+                self._fetch_and_store(tool, query, fetch, raw_query)
+            except Exception as e:
+                print(f"Search cache refresh failed for {tool} {query!r}: {e}")
+            finally:
+                with self._refresh_lock:
+                    self._refreshing.discard(key)
+
+        self._refresh_pool.submit(_refresh)
+
+    def get_or_fetch(self, tool: str, raw_query: str, fetch):
+        """Return (result, outcome), where outcome is HIT, STALE_HIT or MISS."""
+        query = normalize_query(raw_query)
+        try:
+            cached = self._load(tool, query)
+        except sqlite3.Error as e:
+            print(f"Search cache read failed: {e}")
+            return fetch(raw_query), MISS
+
+        if cached is not None:
+            result, fetched_at = cached
+            age = time.time() - fetched_at
+            ttl = SEARCH_CACHE_TTL_SECS.get(tool, SEARCH_CACHE_DEFAULT_TTL_SECS)
+            if age < ttl:
+                return result, HIT
+            if age < ttl + SEARCH_CACHE_STALE_SECS:
+                self._refresh_in_background(tool, query, fetch, raw_query)
+                return result, STALE_HIT
+
+        return self._fetch_and_store(tool, query, fetch, raw_query), MISS
+
+
+_SEARCH_CACHE = None
+_search_cache_lock = threading.Lock()
+
+
+def get_search_cache() -> SQLiteSearchCache:
+    global _SEARCH_CACHE
+    if _SEARCH_CACHE is None:
+        with _search_cache_lock:
+            if _SEARCH_CACHE is None:
+                path = os.getenv("AGENT_SEARCH_CACHE_DB_PATH") or os.path.join(tempfile.gettempdir(), "agent_search_cache.sqlite3")
+                _SEARCH_CACHE = SQLiteSearchCache(path)
+    return _SEARCH_CACHE
+
+
+def cached_search(tool: str, query: str, fetch, context=None) -> str:
+    """Run fetch(query) through the search cache and count the outcome on the request context."""
+    result, outcome = get_search_cache().get_or_fetch(tool, query, fetch)
+    if context is not None:
+        context.record_search_cache(outcome)
+    return result
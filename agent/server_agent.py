@@ -6,15 +6,29 @@ import tempfile
 import uuid
 import re
 import time
-from collections import defaultdict, deque
-from agent import Agent
-from tools import read_uploaded_file, browse_online, browse_uwflow, query_database_readonly, create_timetable, add_course_to_timetable, delete_course_from_timetable, clear_timetable, show_timetable_button, TOOLS_SCHEMA
+from concurrent.futures import ThreadPoolExecutor
+from agent import Agent, LLM_ERROR_CONTENT
+from model_router import TASK_SUMMARIZE, TASK_EMAIL, TASK_TOOL_PLANNING, TASK_FINAL, get_model_router
+from course_cache import course_cache_stats, get_course
+from course_catalog import warm_course_catalog
+from request_context import RequestContext
+from usage_store import create_usage_store, RATE_LIMITED, QUOTA_EXCEEDED
+from conversation_store import ConversationStore
+from context_budget import compact_messages
+from transcript_ingest import prepare_attachment_text
+from response_cache import STATUS_HEADER, cache_bypassed, get_cached_response, normalize_text, response_cache_key, response_cache_stats, store_response
+from schedule_generator import SCHEDULE_DEFAULT_RESULTS, SCHEDULE_MAX_COURSES, SCHEDULE_MAX_RESULTS, iter_schedules, load_course_slots
+from tools import extract_uploaded_bytes, browse_online, browse_uwflow, query_database_readonly, search_courses, check_conflicts, generate_schedules, create_timetable, add_course_to_timetable, delete_course_from_timetable, clear_timetable, show_timetable_button, TOOLS_SCHEMA
+import firebase_admin
 from firebase_admin import auth, firestore
 from typing import Optional, Tuple
 
 app = Flask(__name__)
 
 MUTATION_TOOLS = {"create_timetable", "add_course_to_timetable", "delete_course_from_timetable", "clear_timetable"}
+READ_ONLY_TOOLS = {"query_database_readonly", "search_courses", "check_conflicts", "generate_schedules", "browse_online", "browse_uwflow"}
+UID_SCOPED_TOOLS = {"query_database_readonly", "check_conflicts"} | MUTATION_TOOLS
+CONTEXT_TOOLS = UID_SCOPED_TOOLS | {"browse_online", "browse_uwflow"}
 _SYSTEM_PROMPT_CACHE = None
 
 
@@ -33,6 +47,24 @@ RATE_LIMIT_MAX_REQUESTS = _env_int("AGENT_RATE_LIMIT_MAX_REQUESTS", 20)
 DAILY_QUOTA_MAX_COST = _env_int("AGENT_DAILY_QUOTA_MAX_COST", 200)
 MAX_TOOL_CALLS_PER_REQUEST = _env_int("AGENT_MAX_TOOL_CALLS_PER_REQUEST", 12)
 
+# Uploads are checked against this decoded size before any base64 or PDF work.
+# Request bodies are capped too, leaving room for the base64 overhead, the
+# message and history.
+MAX_ATTACHMENT_BYTES = _env_int("AGENT_MAX_ATTACHMENT_BYTES", 10 * 1024 * 1024)
+app.config["MAX_CONTENT_LENGTH"] = MAX_ATTACHMENT_BYTES * 4 // 3 + _env_int("AGENT_MAX_REQUEST_OVERHEAD_BYTES", 4 * 1024 * 1024)
+
+# Read-only tools from one LLM round run concurrently on this pool. Mutation tools
+# always run one at a time, in the order the model asked for them.
+PARALLEL_TOOL_CALLS = _env_int("AGENT_PARALLEL_TOOL_CALLS", 1) == 1
+TOOL_WORKER_POOL_SIZE = _env_int("AGENT_TOOL_WORKER_POOL_SIZE", 4)
+
+# Forward LLM tokens to /chat_stream clients as "delta" events while they are generated.
+STREAM_LLM_TOKENS = _env_int("AGENT_STREAM_LLM_TOKENS", 1) == 1
+
+# Stage every timetable mutation of one LLM round in memory and commit them in a
+# single Firestore transaction before the tool results go back to the model.
+BATCH_TIMETABLE_WRITES = _env_int("AGENT_BATCH_TIMETABLE_WRITES", 1) == 1
+
 # Cost units are deliberately abstract. Tune them in Railway without code changes
 # as provider pricing, model choice, and product limits evolve.
 AGENT_USAGE_COSTS = {
@@ -40,10 +72,36 @@ AGENT_USAGE_COSTS = {
     "generate_email": _env_int("AGENT_COST_GENERATE_EMAIL", 2),
     "chat": _env_int("AGENT_COST_CHAT", 5),
     "chat_stream": _env_int("AGENT_COST_CHAT_STREAM", 5),
+    "generate_schedules": _env_int("AGENT_COST_GENERATE_SCHEDULES", 0),
 }
 
-_rate_limit_hits = defaultdict(deque)
-_daily_usage = {}
+# "memory" enforces limits per worker process. "sqlite" shares one WAL-mode file,
+# so every worker on the node enforces the same limits.
+_USAGE_STORE = create_usage_store(
+    os.getenv("AGENT_USAGE_BACKEND", "memory"),
+    RATE_LIMIT_WINDOW_SECS,
+    RATE_LIMIT_MAX_REQUESTS,
+    DAILY_QUOTA_MAX_COST,
+    db_path=os.getenv("AGENT_USAGE_DB_PATH")
+)
+
+# Past turns are compacted once the estimated prompt exceeds this budget. The
+# last AGENT_CONTEXT_KEEP_RECENT_TURNS turns are always sent verbatim.
+CONTEXT_BUDGET_TOKENS = _env_int("AGENT_CONTEXT_BUDGET_TOKENS", 12000)
+CONTEXT_KEEP_RECENT_TURNS = _env_int("AGENT_CONTEXT_KEEP_RECENT_TURNS", 3)
+
+# Clients that send a session_id get their history from here instead of
+# re-uploading it on every turn. Point AGENT_SESSION_DIR at storage shared by
+# all workers.
+_CONVERSATIONS = ConversationStore(
+    os.getenv("AGENT_SESSION_DIR") or os.path.join(tempfile.gettempdir(), "agent_sessions"),
+    max_sessions_in_memory=_env_int("AGENT_SESSION_MAX_IN_MEMORY", 256),
+    idle_secs=_env_int("AGENT_SESSION_IDLE_SECS", 600),
+    ttl_secs=_env_int("AGENT_SESSION_TTL_SECS", 7 * 24 * 3600),
+    max_tokens=CONTEXT_BUDGET_TOKENS
+)
+MAX_SESSION_ID_LENGTH = 128
+_TOOL_EXECUTOR = ThreadPoolExecutor(max_workers=max(1, TOOL_WORKER_POOL_SIZE), thread_name_prefix="agent-tool")
 
 
 def _json_error(message: str, status_code: int):
@@ -71,32 +129,35 @@ def _require_uid():
     return uid, None
 
 
-def _usage_day() -> str:
-    return time.strftime("%Y-%m-%d", time.gmtime())
+def _check_usage(uid: str, service: str, cost: int = None):
+    outcome = _USAGE_STORE.check(uid, AGENT_USAGE_COSTS[service] if cost is None else cost)
+    if outcome == RATE_LIMITED:
+        return False, _json_error("Too many requests. Please wait a moment and try again.", 429)
+    if outcome == QUOTA_EXCEEDED:
+        return False, _json_error("Daily AI usage limit reached. Please try again tomorrow.", 429)
+    return True, None
 
 
-def _check_usage(uid: str, service: str):
-    cost = AGENT_USAGE_COSTS[service]
-    now = time.time()
-    hits = _rate_limit_hits[uid]
-    while hits and now - hits[0] > RATE_LIMIT_WINDOW_SECS:
-        hits.popleft()
+def _chat_round(tool_calls_used: int) -> Tuple[str, Optional[list]]:
+    """
+    (task, tools) for the next LLM round. The first round plans tool calls.
+    Rounds that follow tool results usually write the answer, so they route as
+    final, but they are still offered tools while the request has tool budget
+    left, so lookups can chain. Once the budget is spent the round is offered no
+    tools and can only answer.
+    """
+    task = TASK_FINAL if tool_calls_used else TASK_TOOL_PLANNING
+    tools = TOOLS_SCHEMA if tool_calls_used < MAX_TOOL_CALLS_PER_REQUEST else None
+    return task, tools
 
-    if len(hits) >= RATE_LIMIT_MAX_REQUESTS:
-        return False, _json_error("Too many requests. Please wait a moment and try again.", 429)
-    hits.append(now)
 
-    day = _usage_day()
-    usage = _daily_usage.get(uid)
-    if usage is None or usage["day"] != day:
-        usage = {"day": day, "cost": 0}
-        _daily_usage[uid] = usage
+def _model_config(agent: Agent) -> dict:
+    return {"model": agent.model, "temperature": agent.temperature, "max_tokens": agent.max_tokens}
 
-    if usage["cost"] + cost > DAILY_QUOTA_MAX_COST:
-        return False, _json_error("Daily AI usage limit reached. Please try again tomorrow.", 429)
 
-    usage["cost"] += cost
-    return True, None
+def _cache_header(response, status: str):
+    response.headers[STATUS_HEADER] = status
+    return response
 
 
 def _check_tool_budget(tool_count: int) -> Optional[dict]:
@@ -140,6 +201,36 @@ def _normalize_advisor_response(text: str) -> str:
 
     return "\n".join(normalized_lines)
 
+
+class _AdvisorStreamNormalizer:
+    """
+    Applies _normalize_advisor_response to streamed text one complete line at a
+    time. Each line's "\n" is sent with the line after it, so the concatenated
+    output equals _normalize_advisor_response of the whole text, blank lines and
+    missing trailing newline included.
+    """
+
+    def __init__(self):
+        self._pending = ""
+        self._started = False
+
+    def _line(self, line: str) -> str:
+        out = ("\n" if self._started else "") + _normalize_advisor_response(line)
+        self._started = True
+        return out
+
+    def feed(self, text: str) -> str:
+        self._pending += text
+        if "\n" not in self._pending:
+            return ""
+        *complete, self._pending = self._pending.split("\n")
+        return "".join(self._line(line) for line in complete)
+
+    def flush(self) -> str:
+        rest, self._pending = self._pending, ""
+        return self._line(rest) if rest else ""
+
+
 def _is_tool_error_response(tool_response) -> bool:
     if isinstance(tool_response, dict):
         return bool(tool_response.get("error"))
@@ -147,12 +238,47 @@ def _is_tool_error_response(tool_response) -> bool:
     return text.startswith("error")
 
 
-def _build_base_messages(system_prompt: str, history: list, user_message: str) -> list:
+def _build_base_messages(system_prompt: str, history: list, user_message: str) -> Tuple[list, dict]:
     messages = [{"role": "system", "content": system_prompt}]
     for msg in history:
-        messages.append({"role": msg.get("role"), "content": msg.get("content")})
+        copied = {"role": msg.get("role"), "content": msg.get("content")}
+        # Server-side sessions keep tool calls and results so later turns can reuse them.
+        for key in ("tool_calls", "tool_call_id", "name"):
+            if msg.get(key) is not None:
+                copied[key] = msg[key]
+        messages.append(copied)
     messages.append({"role": "user", "content": user_message})
-    return messages
+    return compact_messages(messages, CONTEXT_BUDGET_TOKENS, CONTEXT_KEEP_RECENT_TURNS)
+
+
+def _resolve_session(uid: str, data: dict):
+    """
+    Return (session_id, history, error). Requests that include a session_id key
+    use the server-side conversation store, and an empty id starts a new
+    session. Requests without the key keep sending their full history.
+    """
+    if "session_id" not in data:
+        return None, data.get("history", []), None
+    session_id = str(data.get("session_id") or "").strip() or str(uuid.uuid4())
+    if len(session_id) > MAX_SESSION_ID_LENGTH:
+        return None, None, _json_error("session_id is too long.", 400)
+    return session_id, _CONVERSATIONS.load(uid, session_id), None
+
+
+def _save_session_turn(uid: str, session_id: Optional[str], turn_messages: list, completed: bool = True):
+    """
+    Persist the messages added by one turn. A turn stopped by the tool budget
+    leaves tool_calls without results, and the provider rejects those on replay.
+    For such a turn, keep only the user message and the stop notice.
+    """
+    if not session_id:
+        return
+    if not completed:
+        turn_messages = [turn_messages[0], {"role": "assistant", "content": turn_messages[-1]}]
+    try:
+        _CONVERSATIONS.append(uid, session_id, turn_messages)
+    except Exception as e:
+        print(f"Failed to save session {session_id}: {e}")
 
 
 def _load_system_prompt() -> str:
@@ -170,20 +296,31 @@ def _load_system_prompt() -> str:
     return system_prompt
 
 
-def _prepare_attached_content(file_name: str, file_bytes_base64: Optional[str]) -> Optional[str]:
+def _check_attachment_size(file_bytes_base64: Optional[str]):
+    """Reject oversized uploads from the base64 length alone, before decoding anything."""
     if not file_bytes_base64:
         return None
+    if not isinstance(file_bytes_base64, str):
+        return _json_error("file_bytes must be a base64 string.", 400)
+    decoded_size = len(file_bytes_base64) * 3 // 4
+    if decoded_size > MAX_ATTACHMENT_BYTES:
+        return _json_error(
+            f"Attached file is too large. The limit is {MAX_ATTACHMENT_BYTES // (1024 * 1024)} MB.",
+            413
+        )
+    return None
+
+
+def _prepare_attached_content(file_name: str, file_bytes_base64: Optional[str]) -> Tuple[Optional[str], dict]:
+    """Return (content for the prompt, attachment metrics). Transcripts are sent as compact JSON."""
+    if not file_bytes_base64:
+        return None, {}
     try:
         file_data = base64.b64decode(file_bytes_base64)
-        ext = os.path.splitext(file_name)[1] if file_name else ".txt"
-        temp_path = os.path.join(tempfile.gettempdir(), f"upload_{uuid.uuid4()}{ext}")
-        with open(temp_path, "wb") as f:
-            f.write(file_data)
-        attached_content = read_uploaded_file(temp_path)
-        os.remove(temp_path)
-        return attached_content
+        text = extract_uploaded_bytes(file_name or "upload.txt", file_data)
     except Exception as e:
-        return f"Error reading attached file: {e}"
+        return f"Error reading attached file: {e}", {}
+    return prepare_attachment_text(text)
 
 
 def _parse_course_code(course_code: str) -> Optional[Tuple[str, str]]:
@@ -203,22 +340,20 @@ def _lookup_course_title(term: str, course_code: str) -> str:
     try:
         db = firestore.client()
         doc_id = f"{term}_{subject}_{catalog}"
-        doc = db.collection("courses").document(doc_id).get()
-        if doc.exists:
-            title = (doc.to_dict() or {}).get("title", "")
+        course_data = get_course(db, doc_id)
+        if course_data is not None:
+            title = course_data.get("title", "")
             return title if str(title).strip() else "Unknown course"
     except Exception:
         pass
     return "Unknown course"
 
 
-def _lookup_active_timetable_name(uid: str) -> str:
+def _lookup_active_timetable_name(context: RequestContext) -> str:
     try:
-        db = firestore.client()
-        user_doc = db.collection("users").document(uid).get()
-        if not user_doc.exists:
+        if not context.user_exists():
             return "Current timetable"
-        data = user_doc.to_dict() or {}
+        data = context.user_data()
         active_id = data.get("activeTimetableId")
         timetables = data.get("timetables", [])
         for t in timetables:
@@ -257,20 +392,29 @@ def _format_term_label(term: str) -> str:
     return f"{season} {2000 + yy}"
 
 
-def _tool_progress_message(uid: str, func_name: str, args: dict) -> str:
+def _tool_progress_message(context: RequestContext, func_name: str, args: dict) -> str:
     if func_name == "query_database_readonly":
         return "Querying database..."
+    if func_name == "check_conflicts":
+        term = _format_term_label(args.get("term", "Unknown term"))
+        return f"Checking for time conflicts in \"{term}\""
+    if func_name == "generate_schedules":
+        term = _format_term_label(args.get("term", "Unknown term"))
+        return f"Generating schedules for \"{term}\""
+    if func_name == "search_courses":
+        query = args.get("query", "")
+        return f"Searching courses for \"{query}\""
     if func_name == "add_course_to_timetable":
         course_code = args.get("course_code", "Unknown course")
         term = args.get("term", "")
         course_name = _lookup_course_title(term, course_code)
-        timetable_name = _lookup_active_timetable_name(uid)
+        timetable_name = _lookup_active_timetable_name(context)
         return f"Adding \"{course_code}: {course_name}\" to timetable \"{timetable_name}\""
     if func_name == "delete_course_from_timetable":
         course_code = args.get("course_code", "Unknown course")
         term = args.get("term", "")
         course_name = _lookup_course_title(term, course_code)
-        timetable_name = _lookup_active_timetable_name(uid)
+        timetable_name = _lookup_active_timetable_name(context)
         return f"Removing \"{course_code}: {course_name}\" from timetable \"{timetable_name}\""
     if func_name == "browse_online":
         query = args.get("query", "")
@@ -284,21 +428,255 @@ def _tool_progress_message(uid: str, func_name: str, args: dict) -> str:
         return f"Creating timetable \"{title}\" for term \"{term}\""
     if func_name == "clear_timetable":
         term = _format_term_label(args.get("term", "Unknown term"))
-        timetable_name = _lookup_active_timetable_name(uid)
+        timetable_name = _lookup_active_timetable_name(context)
         return f"Clearing timetable \"{timetable_name}\" for term \"{term}\""
     if func_name == "show_timetable_button":
         return "Preparing your new timetable..."
     return "Working on your request..."
 
 
+def _parse_tool_call(t_call: dict) -> Tuple[str, dict]:
+    func_name = t_call["function"]["name"]
+    try:
+        args = json.loads(t_call["function"]["arguments"])
+    except Exception:
+        args = {}
+    return func_name, args
+
+
+def _execute_tool(func_name: str, args: dict):
+    """Run a single tool and return (tool_response, duration_ms)."""
+    tool_response = "Error: Tool execution failed"
+    tool_start = time.perf_counter()
+    try:
+        if func_name == "browse_online":
+            tool_response = browse_online(**args)
+        elif func_name == "browse_uwflow":
+            tool_response = browse_uwflow(**args)
+        elif func_name == "query_database_readonly":
+            tool_response = query_database_readonly(**args)
+        elif func_name == "search_courses":
+            tool_response = search_courses(**args)
+        elif func_name == "check_conflicts":
+            tool_response = check_conflicts(**args)
+        elif func_name == "generate_schedules":
+            tool_response = generate_schedules(**args)
+        elif func_name == "create_timetable":
+            tool_response = create_timetable(**args)
+        elif func_name == "add_course_to_timetable":
+            tool_response = add_course_to_timetable(**args)
+        elif func_name == "delete_course_from_timetable":
+            tool_response = delete_course_from_timetable(**args)
+        elif func_name == "clear_timetable":
+            tool_response = clear_timetable(**args)
+        elif func_name == "show_timetable_button":
+            tool_response = show_timetable_button(**args)
+        else:
+            tool_response = f"Warning: Function {func_name} not recognized."
+    except Exception as e:
+        tool_response = f"Error executing {func_name}: {e}"
+    return tool_response, round((time.perf_counter() - tool_start) * 1000, 1)
+
+
+def _tool_call_batches(parsed_calls: list) -> list:
+    """
+    Group consecutive read-only calls into one batch so they can run in parallel.
+    Every other call is a batch of its own, which keeps writes ordered and makes
+    reads issued after a write observe that write.
+    """
+    batches = []
+    for call in parsed_calls:
+        func_name = call[1]
+        if (
+            PARALLEL_TOOL_CALLS
+            and func_name in READ_ONLY_TOOLS
+            and batches
+            and batches[-1][-1][1] in READ_ONLY_TOOLS
+        ):
+            batches[-1].append(call)
+        else:
+            batches.append([call])
+    return batches
+
+
+def _iter_tool_round(context: RequestContext, tool_calls: list, tool_stats: list):
+    """
+    Execute the tool calls from one LLM round, yielding progress events.
+
+    Returns (tool_messages, show_button, budget_error). Tool messages are in the
+    same order as tool_calls regardless of which calls ran concurrently.
+    """
+    remaining = max(MAX_TOOL_CALLS_PER_REQUEST - len(tool_stats), 0)
+    budget_error = _check_tool_budget(len(tool_stats) + len(tool_calls))
+    runnable = tool_calls[:remaining] if budget_error else tool_calls
+
+    parsed_calls = [(t_call, *_parse_tool_call(t_call)) for t_call in runnable]
+    tool_messages = []
+    show_button = False
+    staged_messages = []
+    button_messages = []
+    finished = False
+    if BATCH_TIMETABLE_WRITES:
+        context.begin_unit_of_work()
+
+    try:
+        for batch in _tool_call_batches(parsed_calls):
+            for _, func_name, args in batch:
+                yield {
+                    "type": "tool",
+                    "tool_name": func_name,
+                    "message": _tool_progress_message(context, func_name, args)
+                }
+                if func_name in UID_SCOPED_TOOLS:
+                    args["uid"] = context.uid
+                if func_name in CONTEXT_TOOLS:
+                    args["context"] = context
+                if func_name == "show_timetable_button":
+                    show_button = True
+
+            staged_before = context.staged_mutation_count()
+            if len(batch) > 1:
+                outcomes = list(_TOOL_EXECUTOR.map(lambda call: _execute_tool(call[1], call[2]), batch))
+            else:
+                outcomes = [_execute_tool(batch[0][1], batch[0][2])]
+            if context.staged_mutation_count() > staged_before:
+                # Mutations run alone in their batch, so this is the message about to be appended.
+                staged_messages.append(len(tool_messages))
+
+            for (t_call, func_name, _), (tool_response, tool_elapsed_ms) in zip(batch, outcomes):
+                tool_stats.append({
+                    "name": func_name,
+                    "duration_ms": tool_elapsed_ms,
+                    "ok": not _is_tool_error_response(tool_response)
+                })
+
+                print(f"Tool '{func_name}' response: {tool_response}")
+
+                if isinstance(tool_response, dict):
+                    tool_response = json.dumps(tool_response, ensure_ascii=False)
+
+                if func_name == "show_timetable_button":
+                    button_messages.append(len(tool_messages))
+                tool_messages.append({
+                    "role": "tool",
+                    "tool_call_id": t_call["id"],
+                    "name": func_name,
+                    "content": str(tool_response)
+                })
+        finished = True
+    finally:
+        # Also runs when /chat_stream closes this generator because the client
+        # went away. Mutations already staged were reported to the model as
+        # done, so they are committed rather than dropped, as they would have
+        # been without batching.
+        if context.in_unit_of_work():
+            if not finished:
+                print(f"Tool round for {context.uid} stopped early; committing {context.staged_mutation_count()} staged timetable change(s).")
+            if not _commit_staged_mutations(context, staged_messages, tool_messages, tool_stats):
+                show_button = False
+                for message_idx in button_messages:
+                    tool_messages[message_idx]["content"] = json.dumps({
+                        "error": "Timetable changes from this round could not be saved, so the timetable button was not shown."
+                    }, ensure_ascii=False)
+                    tool_stats[len(tool_stats) - len(tool_messages) + message_idx]["ok"] = False
+
+    return tool_messages, show_button, budget_error
+
+
+def _commit_staged_mutations(context: RequestContext, staged_messages: list, tool_messages: list, tool_stats: list) -> bool:
+    """
+    Commit the round's staged timetable mutations and reconcile the tool messages
+    with what was actually written. Replaying on the latest document can change
+    a result, for example a new conflict with a course added from another
+    device. If the whole commit fails, every staged call reports the error and
+    False is returned.
+    """
+    round_stats = tool_stats[len(tool_stats) - len(tool_messages):]
+    committed = True
+    try:
+        results = context.commit_unit_of_work()
+    except Exception as e:
+        print(f"Timetable commit failed for {context.uid}: {e}")
+        results = [{"error": f"Could not save timetable changes: {e}"}] * len(staged_messages)
+        committed = False
+
+    for message_idx, result in zip(staged_messages, results):
+        content = json.dumps(result, ensure_ascii=False)
+        if tool_messages[message_idx]["content"] != content:
+            print(f"Tool '{tool_messages[message_idx]['name']}' result changed on commit: {content}")
+            tool_messages[message_idx]["content"] = content
+            round_stats[message_idx]["ok"] = not _is_tool_error_response(result)
+    return committed
+
+
+def _drain_events(events, on_event=None):
+    """Run an event generator to completion, forwarding events, and return its result."""
+    while True:
+        try:
+            event = next(events)
+        except StopIteration as stop:
+            return stop.value
+        if on_event:
+            on_event(event)
+
+
+def _iter_llm_deltas(agent: Agent, messages: list, attached_content: Optional[str], round_index: int, tool_calls_used: int):
+    """
+    Stream one LLM round, yielding normalized "delta" events, and return the
+    assembled assistant message. Deltas from a round that ends in tool calls are
+    interim text; the "final" event remains the authoritative answer.
+    """
+    normalizer = _AdvisorStreamNormalizer()
+    task, tools = _chat_round(tool_calls_used)
+    deltas = agent.iter_chat_stream(
+        messages,
+        attached_file_content=attached_content,
+        tools=tools,
+        task=task
+    )
+    while True:
+        try:
+            text = next(deltas)
+        except StopIteration as stop:
+            response_msg = stop.value
+            break
+        cleaned = normalizer.feed(text)
+        if cleaned:
+            yield {"type": "delta", "round": round_index, "text": cleaned}
+
+    tail = normalizer.flush()
+    if tail:
+        yield {"type": "delta", "round": round_index, "text": tail}
+    return response_msg
+
+
+def _forward_events(events, transform):
+    """
+    Re-yield events through transform and return the wrapped generator's
+    result. Closing this generator closes the wrapped one too, so its cleanup
+    runs when a streaming client disconnects.
+    """
+    try:
+        while True:
+            try:
+                event = next(events)
+            except StopIteration as stop:
+                return stop.value
+            yield transform(event)
+    finally:
+        events.close()
+
+
 def _run_chat(uid: str, user_message: str, history: list, file_name: str, file_bytes_base64: Optional[str], on_event=None):
     total_start = time.perf_counter()
     agent = Agent()
 
     system_prompt = _load_system_prompt()
 
-    messages = _build_base_messages(system_prompt, history, user_message)
-    attached_content = _prepare_attached_content(file_name, file_bytes_base64)
+    messages, context_stats = _build_base_messages(system_prompt, history, user_message)
+    turn_start = len(messages) - 1
+    attached_content, attachment_stats = _prepare_attached_content(file_name, file_bytes_base64)
+    context = RequestContext(uid)
 
     show_button = False
     llm_round_ms = []
@@ -307,7 +685,8 @@ def _run_chat(uid: str, user_message: str, history: list, file_name: str, file_b
 
     while True:
         llm_start = time.perf_counter()
-        response_msg = agent.chat(messages, attached_file_content=attached_content, tools=TOOLS_SCHEMA)
+        task, tools = _chat_round(len(tool_stats))
+        response_msg = agent.chat(messages, attached_file_content=attached_content, tools=tools, task=task)
         llm_round_ms.append(round((time.perf_counter() - llm_start) * 1000, 1))
         loop_count += 1
         attached_content = None
@@ -317,83 +696,35 @@ def _run_chat(uid: str, user_message: str, history: list, file_name: str, file_b
         if not tool_calls:
             break
 
-        for t_call in tool_calls:
-            budget_error = _check_tool_budget(len(tool_stats) + 1)
-            if budget_error:
-                return {
-                    "response": budget_error["error"],
-                    "history": messages,
-                    "show_button": show_button,
-                    "metrics": {
-                        "total_ms": round((time.perf_counter() - total_start) * 1000, 1),
-                        "llm_rounds": len(llm_round_ms),
-                        "llm_round_ms": llm_round_ms,
-                        "tool_calls": len(tool_stats),
-                        "tool_stats": tool_stats,
-                        "loop_count": loop_count,
-                        "stopped_by_tool_budget": True
-                    }
-                }
-
-            func_name = t_call["function"]["name"]
-            try:
-                args = json.loads(t_call["function"]["arguments"])
-            except Exception:
-                args = {}
-
-            if on_event:
-                on_event({
-                    "type": "tool",
-                    "tool_name": func_name,
-                    "message": _tool_progress_message(uid, func_name, args)
-                })
-
-            if func_name in ["query_database_readonly", "create_timetable", "add_course_to_timetable", "delete_course_from_timetable", "clear_timetable"]:
-                args["uid"] = uid
-
-            tool_response = "Error: Tool execution failed"
-            tool_start = time.perf_counter()
-            try:
-                if func_name == "browse_online":
-                    tool_response = browse_online(**args)
-                elif func_name == "browse_uwflow":
-                    tool_response = browse_uwflow(**args)
-                elif func_name == "query_database_readonly":
-                    tool_response = query_database_readonly(**args)
-                elif func_name == "create_timetable":
-                    tool_response = create_timetable(**args)
-                elif func_name == "add_course_to_timetable":
-                    tool_response = add_course_to_timetable(**args)
-                elif func_name == "delete_course_from_timetable":
-                    tool_response = delete_course_from_timetable(**args)
-                elif func_name == "clear_timetable":
-                    tool_response = clear_timetable(**args)
-                elif func_name == "show_timetable_button":
-                    show_button = True
-                    tool_response = show_timetable_button(**args)
-                else:
-                    tool_response = f"Warning: Function {func_name} not recognized."
-            except Exception as e:
-                tool_response = f"Error executing {func_name}: {e}"
-
-            tool_elapsed_ms = round((time.perf_counter() - tool_start) * 1000, 1)
-            tool_stats.append({
-                "name": func_name,
-                "duration_ms": tool_elapsed_ms,
-                "ok": not _is_tool_error_response(tool_response)
-            })
-
-            print(f"Tool '{func_name}' response: {tool_response}")
-
-            if isinstance(tool_response, dict):
-                tool_response = json.dumps(tool_response, ensure_ascii=False)
+        tool_messages, round_show_button, budget_error = _drain_events(
+            _iter_tool_round(context, tool_calls, tool_stats),
+            on_event
+        )
+        messages.extend(tool_messages)
+        show_button = show_button or round_show_button
 
-            messages.append({
-                "role": "tool",
-                "tool_call_id": t_call["id"],
-                "name": func_name,
-                "content": str(tool_response)
-            })
+        if budget_error:
+            return {
+                "response": budget_error["error"],
+                "history": messages,
+                "show_button": show_button,
+                "metrics": {
+                    "total_ms": round((time.perf_counter() - total_start) * 1000, 1),
+                    "llm_rounds": len(llm_round_ms),
+                    "llm_round_ms": llm_round_ms,
+                    "tool_calls": len(tool_stats),
+                    "tool_stats": tool_stats,
+                    "loop_count": loop_count,
+                    "user_doc_reads": context.user_doc_reads,
+                    "search_cache": context.search_cache_metrics(),
+                    "llm_client": agent.client_stats,
+                    "llm_routes": agent.route_stats,
+                    **context_stats,
+                    **attachment_stats,
+                    "stopped_by_tool_budget": True
+                },
+                "turn_start": turn_start
+            }
 
     final_response = _normalize_advisor_response(response_msg.get("content", ""))
     metrics = {
@@ -402,13 +733,20 @@ def _run_chat(uid: str, user_message: str, history: list, file_name: str, file_b
         "llm_round_ms": llm_round_ms,
         "tool_calls": len(tool_stats),
         "tool_stats": tool_stats,
-        "loop_count": loop_count
+        "loop_count": loop_count,
+        "user_doc_reads": context.user_doc_reads,
+        "search_cache": context.search_cache_metrics(),
+        "llm_client": agent.client_stats,
+        "llm_routes": agent.route_stats,
+        **context_stats,
+        **attachment_stats
     }
     return {
         "response": final_response,
         "history": messages,
         "show_button": show_button,
-        "metrics": metrics
+        "metrics": metrics,
+        "turn_start": turn_start
     }
 
 
@@ -448,9 +786,6 @@ def generate_email():
     uid, auth_error = _require_uid()
     if auth_error:
         return auth_error
-    ok, usage_error = _check_usage(uid, service="generate_email")
-    if not ok:
-        return usage_error
 
     data = request.json or {}
     issue = (data.get("issue") or "").strip()
@@ -464,7 +799,7 @@ def generate_email():
         return jsonify({"error": "issue is required"}), 400
 
     total_start = time.perf_counter()
-    agent = Agent()
+    agent = Agent(task=TASK_EMAIL)
     system_prompt = (
         "You are an academic-email drafting assistant. Write professional advisor emails that strictly preserve "
         "the user's intent and facts. You must not invent details, assumptions, timelines, course codes, policy claims, "
@@ -500,6 +835,39 @@ def generate_email():
         "Example format: {\"subject\":\"...\",\"body\":\"...\"}"
     )
 
+    # Client retries resend identical fields. Serve them from the cache; a hit
+    # still counts toward the rate limit but costs nothing against the daily
+    # quota. Drafts carry student details, so keys are scoped per uid.
+    use_cache = not cache_bypassed(request.headers)
+    cache_status = "miss" if use_cache else "bypass"
+    cache_key = response_cache_key("generate_email", _model_config(agent), {
+        "uid": uid,
+        "system_prompt": system_prompt,
+        "issue": normalize_text(issue),
+        "advisor_name": normalize_text(advisor_name),
+        "program_name": normalize_text(program_name),
+        "year_level": normalize_text(year_level),
+        "student_name": normalize_text(student_name),
+        "student_id": normalize_text(student_id)
+    })
+    cached = get_cached_response(cache_key) if use_cache else None
+    if cached:
+        ok, usage_error = _check_usage(uid, service="generate_email", cost=0)
+        if not ok:
+            return usage_error
+        return _cache_header(jsonify({
+            **cached,
+            "metrics": {
+                "total_ms": round((time.perf_counter() - total_start) * 1000, 1),
+                "llm_ms": 0.0,
+                "cache_hit": True
+            }
+        }), "hit"), 200
+
+    ok, usage_error = _check_usage(uid, service="generate_email")
+    if not ok:
+        return usage_error
+
     try:
         llm_start = time.perf_counter()
         response_msg = agent.chat([
@@ -514,14 +882,18 @@ def generate_email():
             subject = str(parsed.get("subject", "")).strip()
             body = str(parsed.get("body", "")).strip()
             if subject and body:
-                return jsonify({
+                if use_cache:
+                    store_response(cache_key, {"subject": subject, "body": body})
+                return _cache_header(jsonify({
                     "subject": subject,
                     "body": body,
                     "metrics": {
                         "total_ms": round((time.perf_counter() - total_start) * 1000, 1),
-                        "llm_ms": llm_ms
+                        "llm_ms": llm_ms,
+                        "llm_routes": agent.route_stats,
+                        "cache_hit": False
                     }
-                }), 200
+                }), cache_status), 200
 
         # Fallback if model returns non-JSON or incomplete JSON
         fallback_body = (
@@ -535,14 +907,17 @@ def generate_email():
             f"{student_name or '[Your Name]'}"
             + (f"\n{student_id}" if student_id else "\n[Student ID]")
         )
-        return jsonify({
+        # The fallback is never cached, so a retry gets another chance at a real draft.
+        return _cache_header(jsonify({
             "subject": "Request for Academic Advising Assistance",
             "body": fallback_body,
             "metrics": {
                 "total_ms": round((time.perf_counter() - total_start) * 1000, 1),
-                "llm_ms": llm_ms
+                "llm_ms": llm_ms,
+                "llm_routes": agent.route_stats,
+                "cache_hit": False
             }
-        }), 200
+        }), cache_status), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -557,14 +932,29 @@ def chat():
 
     data = request.json or {}
     user_message = data.get("message")
-    history = data.get("history", [])
     file_name = data.get("file_name", "")
     file_bytes_base64 = data.get("file_bytes")  # Base64 string from Android if any
 
     if not user_message:
         return jsonify({"error": "message is required"}), 400
 
+    size_error = _check_attachment_size(file_bytes_base64)
+    if size_error:
+        return size_error
+
+    session_id, history, session_error = _resolve_session(uid, data)
+    if session_error:
+        return session_error
+
     result = _run_chat(uid, user_message, history, file_name, file_bytes_base64)
+    turn_start = result.pop("turn_start")
+    if session_id:
+        # Return only this turn's messages; the rest already lives on the server.
+        turn_messages = result.pop("history")[turn_start:]
+        completed = not result["metrics"].get("stopped_by_tool_budget")
+        _save_session_turn(uid, session_id, turn_messages if completed else [turn_messages[0], result["response"]], completed)
+        result["session_id"] = session_id
+        result["messages"] = turn_messages
     return jsonify(result)
 
 
@@ -579,13 +969,20 @@ def chat_stream():
 
     data = request.json or {}
     user_message = data.get("message")
-    history = data.get("history", [])
     file_name = data.get("file_name", "")
     file_bytes_base64 = data.get("file_bytes")
 
     if not user_message:
         return jsonify({"error": "message is required"}), 400
 
+    size_error = _check_attachment_size(file_bytes_base64)
+    if size_error:
+        return size_error
+
+    session_id, history, session_error = _resolve_session(uid, data)
+    if session_error:
+        return session_error
+
     def generate():
         def emit(event: dict):
             payload = json.dumps(event, ensure_ascii=False)
@@ -596,8 +993,10 @@ def chat_stream():
             agent = Agent()
             system_prompt = _load_system_prompt()
 
-            messages = _build_base_messages(system_prompt, history, user_message)
-            attached_content = _prepare_attached_content(file_name, file_bytes_base64)
+            messages, context_stats = _build_base_messages(system_prompt, history, user_message)
+            turn_start = len(messages) - 1
+            attached_content, attachment_stats = _prepare_attached_content(file_name, file_bytes_base64)
+            context = RequestContext(uid)
 
             show_button = False
             llm_round_ms = []
@@ -606,7 +1005,14 @@ def chat_stream():
 
             while True:
                 llm_start = time.perf_counter()
-                response_msg = agent.chat(messages, attached_file_content=attached_content, tools=TOOLS_SCHEMA)
+                if STREAM_LLM_TOKENS:
+                    response_msg = yield from _forward_events(
+                        _iter_llm_deltas(agent, messages, attached_content, loop_count + 1, len(tool_stats)),
+                        emit
+                    )
+                else:
+                    task, tools = _chat_round(len(tool_stats))
+                    response_msg = agent.chat(messages, attached_file_content=attached_content, tools=tools, task=task)
                 llm_round_ms.append(round((time.perf_counter() - llm_start) * 1000, 1))
                 loop_count += 1
                 attached_content = None
@@ -616,108 +1022,158 @@ def chat_stream():
                 if not tool_calls:
                     break
 
-                for t_call in tool_calls:
-                    budget_error = _check_tool_budget(len(tool_stats) + 1)
-                    if budget_error:
-                        yield emit({"type": "error", "message": budget_error["error"]})
-                        return
-
-                    func_name = t_call["function"]["name"]
-                    try:
-                        args = json.loads(t_call["function"]["arguments"])
-                    except Exception:
-                        args = {}
-
-                    yield emit({
-                        "type": "tool",
-                        "tool_name": func_name,
-                        "message": _tool_progress_message(uid, func_name, args)
-                    })
-
-                    if func_name in ["query_database_readonly", "create_timetable", "add_course_to_timetable", "delete_course_from_timetable", "clear_timetable"]:
-                        args["uid"] = uid
-
-                    tool_response = "Error: Tool execution failed"
-                    tool_start = time.perf_counter()
-                    try:
-                        if func_name == "browse_online":
-                            tool_response = browse_online(**args)
-                        elif func_name == "browse_uwflow":
-                            tool_response = browse_uwflow(**args)
-                        elif func_name == "query_database_readonly":
-                            tool_response = query_database_readonly(**args)
-                        elif func_name == "create_timetable":
-                            tool_response = create_timetable(**args)
-                        elif func_name == "add_course_to_timetable":
-                            tool_response = add_course_to_timetable(**args)
-                        elif func_name == "delete_course_from_timetable":
-                            tool_response = delete_course_from_timetable(**args)
-                        elif func_name == "clear_timetable":
-                            tool_response = clear_timetable(**args)
-                        elif func_name == "show_timetable_button":
-                            show_button = True
-                            tool_response = show_timetable_button(**args)
-                        else:
-                            tool_response = f"Warning: Function {func_name} not recognized."
-                    except Exception as e:
-                        tool_response = f"Error executing {func_name}: {e}"
-
-                    tool_elapsed_ms = round((time.perf_counter() - tool_start) * 1000, 1)
-                    tool_stats.append({
-                        "name": func_name,
-                        "duration_ms": tool_elapsed_ms,
-                        "ok": not _is_tool_error_response(tool_response)
-                    })
-
-                    print(f"Tool '{func_name}' response: {tool_response}")
-
-                    if isinstance(tool_response, dict):
-                        tool_response = json.dumps(tool_response, ensure_ascii=False)
-
-                    messages.append({
-                        "role": "tool",
-                        "tool_call_id": t_call["id"],
-                        "name": func_name,
-                        "content": str(tool_response)
-                    })
+                tool_messages, round_show_button, budget_error = yield from _forward_events(
+                    _iter_tool_round(context, tool_calls, tool_stats),
+                    emit
+                )
+                messages.extend(tool_messages)
+                show_button = show_button or round_show_button
+
+                if budget_error:
+                    _save_session_turn(uid, session_id, [messages[turn_start], budget_error["error"]], completed=False)
+                    yield emit({"type": "error", "message": budget_error["error"], "session_id": session_id})
+                    return
 
             final_response = _normalize_advisor_response(response_msg.get("content", ""))
+            _save_session_turn(uid, session_id, messages[turn_start:])
 
             yield emit({
                 "type": "final",
                 "response": final_response,
                 "show_button": show_button,
+                "session_id": session_id,
                 "metrics": {
                     "total_ms": round((time.perf_counter() - total_start) * 1000, 1),
                     "llm_rounds": len(llm_round_ms),
                     "llm_round_ms": llm_round_ms,
                     "tool_calls": len(tool_stats),
                     "tool_stats": tool_stats,
-                    "loop_count": loop_count
+                    "loop_count": loop_count,
+                    "user_doc_reads": context.user_doc_reads,
+                    "search_cache": context.search_cache_metrics(),
+                    "llm_client": agent.client_stats,
+                    "llm_routes": agent.route_stats,
+                    **context_stats,
+                    **attachment_stats
                 }
             })
         except Exception as e:
-            yield emit({"type": "error", "message": str(e)})
+            yield emit({"type": "error", "message": str(e), "session_id": session_id})
 
     return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
 
-@app.route('/summarize', methods=['POST'])
-def summarize():
+@app.route('/generate_schedules', methods=['POST'])
+def generate_schedules_endpoint():
+    """
+    Conflict-free schedules for a wishlist: {"term", "course_codes",
+    "subset_size"?, "max_results"?, "stream"?}. Each schedule is a list of
+    timetable course entries. With "stream": true the schedules are sent as
+    NDJSON "schedule" events as they are found, then a "final" event.
+    """
     uid, auth_error = _require_uid()
     if auth_error:
         return auth_error
-    ok, usage_error = _check_usage(uid, service="summarize")
+    ok, usage_error = _check_usage(uid, service="generate_schedules")
     if not ok:
         return usage_error
 
+    data = request.json or {}
+    term = str(data.get("term") or "").strip()
+    course_codes = data.get("course_codes")
+    if not term or not isinstance(course_codes, list) or not course_codes:
+        return jsonify({"error": "term and a non-empty course_codes list are required"}), 400
+    if len(course_codes) > SCHEDULE_MAX_COURSES:
+        return jsonify({"error": f"At most {SCHEDULE_MAX_COURSES} courses can be scheduled at once"}), 400
+    try:
+        max_results = max(1, min(int(data.get("max_results") or SCHEDULE_DEFAULT_RESULTS), SCHEDULE_MAX_RESULTS))
+        subset_size = int(data["subset_size"]) if data.get("subset_size") else None
+    except (TypeError, ValueError):
+        return jsonify({"error": "max_results and subset_size must be integers"}), 400
+
+    total_start = time.perf_counter()
+    try:
+        slots_by_course, not_found = load_course_slots(firestore.client(), term, course_codes)
+    except Exception as e:
+        return _json_error(f"Could not load courses: {e}", 500)
+    stats = {}
+    schedules = iter_schedules(slots_by_course, subset_size, stats=stats)
+
+    def metrics(count: int) -> dict:
+        return {
+            "total_ms": round((time.perf_counter() - total_start) * 1000, 1),
+            "schedules": count,
+            "search_nodes": stats.get("nodes", 0),
+            "pruned_branches": stats.get("pruned", 0),
+            "more_may_exist": count >= max_results or not stats.get("exhausted", True)
+        }
+
+    if not data.get("stream"):
+        found = [schedule for _, schedule in zip(range(max_results), schedules)]
+        return jsonify({"schedules": found, "not_found": not_found, "metrics": metrics(len(found))}), 200
+
+    def generate():
+        count = 0
+        try:
+            for schedule in schedules:
+                yield json.dumps({"type": "schedule", "index": count, "courses": schedule}, ensure_ascii=False) + "\n"
+                count += 1
+                if count >= max_results:
+                    break
+            yield json.dumps({"type": "final", "not_found": not_found, "metrics": metrics(count)}, ensure_ascii=False) + "\n"
+        except Exception as e:
+            yield json.dumps({"type": "error", "message": str(e)}, ensure_ascii=False) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+@app.route('/stats', methods=['GET'])
+def stats():
+    """Cache counters and per-endpoint LLM health for this worker process."""
+    uid, auth_error = _require_uid()
+    if auth_error:
+        return auth_error
+    return jsonify({
+        "course_cache": course_cache_stats(),
+        "response_cache": response_cache_stats(),
+        "model_routes": get_model_router().health()
+    }), 200
+
+
+@app.route('/summarize', methods=['POST'])
+def summarize():
+    uid, auth_error = _require_uid()
+    if auth_error:
+        return auth_error
+
     data = request.json or {}
     user_message = data.get("message")
     
     if not user_message:
         return jsonify({"summary": "Chat"}), 200
 
-    agent = Agent()
+    agent = Agent(task=TASK_SUMMARIZE)
     system_prompt = "You are an AI that generates a concise, 2-6 word title for a user's initial prompt to start a chat session. Do not include quotes. Do not say 'Here is the title:'. Just provide the title."
+
+    # Opening prompts repeat a lot across users ("help me plan my winter term"),
+    # and a title depends only on the prompt, so this cache is shared.
+    normalized_message = normalize_text(user_message, casefold=True)
+    use_cache = not cache_bypassed(request.headers)
+    cache_status = "miss" if use_cache else "bypass"
+    cache_key = response_cache_key(
+        "summarize",
+        _model_config(agent),
+        {"system_prompt": system_prompt, "message": normalized_message}
+    )
+    cached = get_cached_response(cache_key) if use_cache else None
+    if cached:
+        ok, usage_error = _check_usage(uid, service="summarize", cost=0)
+        if not ok:
+            return usage_error
+        return _cache_header(jsonify(cached), "hit"), 200
+
+    ok, usage_error = _check_usage(uid, service="summarize")
+    if not ok:
+        return usage_error
     
     messages = [
         {"role": "system", "content": system_prompt},
@@ -725,9 +1181,14 @@ def summarize():
     ]
     
     response_msg = agent.chat(messages)
-    title = response_msg.get("content", "Chat Session").strip('"\'\n\r \t')
-    return jsonify({"summary": title}), 200
+    content = response_msg.get("content")
+    title = (content or "Chat Session").strip('"\'\n\r \t')
+    if use_cache and content and content != LLM_ERROR_CONTENT:
+        store_response(cache_key, {"summary": title})
+    return _cache_header(jsonify({"summary": title}), cache_status), 200
 
 if __name__ == '__main__':
+    if firebase_admin._apps:
+        warm_course_catalog(firestore.client())
     port = int(os.environ.get("PORT", "5000"))
     app.run(host='0.0.0.0', port=port)
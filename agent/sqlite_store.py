@@ -0,0 +1,31 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# One connection per SQLite file for the whole process. Under gevent,
+# threading.local is per greenlet, so per-thread connections meant a new
+# connection (and PRAGMA round trip) for every request. Each connection is
+# guarded by its own lock, so a transaction never interleaves with another
+# greenlet or thread using the same file.
+_CONNECTIONS = {}
+_connections_lock = threading.Lock()
+
+
+def _open(path: str):
+    with _connections_lock:
+        entry = _CONNECTIONS.get(path)
+        if entry is None:
+            conn = sqlite3.connect(path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            entry = (conn, threading.Lock())
+            _CONNECTIONS[path] = entry
+        return entry
+
+
+@contextmanager
+def connection(path: str):
+    """Hold the shared connection for path until the block exits."""
+    conn, lock = _open(path)
+    with lock:
+        yield conn
@@ -0,0 +1,20 @@
+import os
+import sys
+
+AGENT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, AGENT_DIR)
+
+import firebase_admin
+from firebase_admin import credentials
+from google.auth.credentials import AnonymousCredentials
+
+
+class _TestCredential(credentials.Base):
+    def get_credential(self):
+        return AnonymousCredentials()
+
+
+# tools.py initializes Firebase on import; give it a placeholder app, as
+# bench_serving.py does, so modules import without a service account.
+if not firebase_admin._apps:
+    firebase_admin.initialize_app(_TestCredential(), {"projectId": "test"})
@@ -0,0 +1,34 @@
+import os
+
+from context_budget import estimate_total_tokens
+from conversation_store import ConversationStore
+
+
+def _turn(i: int) -> list:
+    return [
+        {"role": "user", "content": f"question {i} " + "x" * 400},
+        {"role": "assistant", "content": f"answer {i} " + "y" * 400},
+    ]
+
+
+def test_stored_session_is_trimmed_to_the_token_budget(tmp_path):
+    store = ConversationStore(str(tmp_path), max_tokens=1000)
+    for i in range(20):
+        store.append("uid", "s1", _turn(i))
+
+    stored = store.load("uid", "s1")
+    assert estimate_total_tokens(stored) <= 1000
+    assert stored[0]["role"] == "user"
+    assert stored[-1]["content"].startswith("answer 19")
+
+    # A fresh store reads the trimmed file, not a cached copy.
+    assert ConversationStore(str(tmp_path)).load("uid", "s1") == stored
+    assert [name for name in os.listdir(tmp_path) if not name.endswith(".jsonl")] == []
+
+
+def test_newest_turn_is_kept_even_if_it_alone_is_over_budget(tmp_path):
+    store = ConversationStore(str(tmp_path), max_tokens=50)
+    store.append("uid", "s1", _turn(0))
+    store.append("uid", "s1", _turn(1))
+
+    assert store.load("uid", "s1") == _turn(1)
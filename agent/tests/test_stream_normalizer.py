@@ -0,0 +1,38 @@
+import pytest
+
+from server_agent import _AdvisorStreamNormalizer, _normalize_advisor_response
+
+PLAN = "Here is your plan:\n\n- CS 136\n- MATH 136\n\nGood luck!"
+
+
+def _stream(chunks):
+    normalizer = _AdvisorStreamNormalizer()
+    return "".join(normalizer.feed(chunk) for chunk in chunks) + normalizer.flush()
+
+
+@pytest.mark.parametrize("chunks", [
+    ["Here is your plan:\n\n- CS 136\n", "- MATH 136\n\nGood luck!"],
+    ["Here is your plan:\n", "\n- CS 136\n- MATH 136\n", "\nGood luck!"],
+    ["Here is your plan:\n\n", "- CS 136\n- MATH 136\n\n", "Good luck!"],
+    ["Here is your plan:", "\n", "\n", "- CS 136\n- MATH 136", "\n\nGood luck!"],
+    [PLAN],
+])
+def test_stream_matches_whole_text_around_blank_lines(chunks):
+    assert "".join(chunks) == PLAN
+    assert _stream(chunks) == _normalize_advisor_response(PLAN)
+
+
+@pytest.mark.parametrize("text", [
+    PLAN,
+    "\n\nLeading blank lines",
+    "Trailing newline\n",
+    "Trailing blank lines\n\n\n",
+    "- *Take CS 136 next term* (English)\n\n*Check the prerequisites.*\nA → B",
+    "Windows\r\nline endings\r\n\r\nhere",
+    "",
+])
+def test_stream_matches_whole_text_for_every_split(text):
+    expected = _normalize_advisor_response(text)
+    for i in range(len(text) + 1):
+        assert _stream([text[:i], text[i:]]) == expected
+    assert _stream(list(text)) == expected
@@ -0,0 +1,38 @@
+from tool_output import _dumps, cap_result, tabulate
+
+
+def _sections(count: int) -> list:
+    return [
+        {"class": str(4000 + i), "component": f"LEC {i:03d}", "time_date": "10:00-11:20TTh", "location": "MC 2065 and a long room note"}
+        for i in range(count)
+    ]
+
+
+def test_capped_table_keeps_whole_rows_and_says_how_many_were_omitted():
+    result = {"course": {"title": "CS 136", "sections": tabulate(_sections(399))}}
+    capped = cap_result(result, max_chars=4000)
+
+    table = capped["course"]["sections"]
+    kept = len(table["rows"])
+    assert 0 < kept < 399
+    assert all(len(row) == len(table["columns"]) for row in table["rows"])
+    assert table["omitted"] == f"{399 - kept} more rows omitted"
+    assert capped["truncated"] == [{"path": "course.sections.rows", "kept": kept, "total": 399}]
+    assert len(_dumps(capped)) <= 4000
+    # As many rows as fit are kept, not just a power-of-two fraction.
+    assert len(_dumps(cap_result(result, max_chars=len(_dumps(capped)) + 200)["course"]["sections"]["rows"])) > len(_dumps(table["rows"]))
+
+
+def test_row_cells_are_never_cut():
+    wide = [{"code": f"C{i}", "days": ["Mon", "Tue", "Wed", "Thu", "Fri"] * 40} for i in range(3)]
+    capped = cap_result({"schedules": tabulate(wide)}, max_chars=1000)
+
+    table = capped["schedules"]
+    assert all(len(row) == len(table["columns"]) for row in table["rows"])
+    assert table["rows"][0][0] == "C0"
+    assert len(_dumps(capped)) <= 1000
+
+
+def test_small_results_are_returned_unchanged():
+    result = {"course": {"sections": tabulate(_sections(3))}}
+    assert cap_result(result, max_chars=10000) is result
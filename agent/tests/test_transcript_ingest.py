@@ -0,0 +1,98 @@
+import json
+import os
+import re
+
+import pytest
+
+from pdf_extract import extract_pdf_text
+from transcript_ingest import compact_transcript, parse_transcript, prepare_attachment_text
+
+SAMPLE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "parse", "test_file")
+COURSE_LINE = re.compile(r"^([A-Z]{2,6}) +(\d{1,3}[A-Za-z]?) [A-Z]")
+
+
+def _transcript_text(name: str) -> str:
+    with open(os.path.join(SAMPLE_DIR, name), "rb") as f:
+        text, _ = extract_pdf_text(f.read(), parallel=False)
+    return text
+
+
+def _source_course_codes(text: str) -> list:
+    """Codes of the lines that start a course in the term tables, read straight from the text."""
+    codes = []
+    for line in text.split("\n"):
+        line = line.strip()
+        if line == "Milestones":
+            break
+        match = COURSE_LINE.match(line)
+        if match:
+            codes.append(f"{match.group(1)} {match.group(2)}")
+    return codes
+
+
+def _compact(text: str) -> dict:
+    return json.loads(json.dumps(compact_transcript(parse_transcript(text))))
+
+
+@pytest.mark.parametrize("name, course_count", [
+    ("SSR_TSRPT_anonymous.pdf", 36),
+    ("SSR_TSRPT_oreo.pdf", 5),
+])
+def test_every_source_course_reaches_the_model(name, course_count):
+    text = _transcript_text(name)
+    source = _source_course_codes(text)
+    assert len(source) == course_count
+
+    compact = _compact(text)
+    sent = [row[0] for term in compact["Terms"].values() for row in term.get("Courses", [])]
+    assert sent == source
+    assert "Unparsed" not in compact
+
+
+def test_compact_form_is_sent_only_when_it_is_smaller():
+    text = _transcript_text("SSR_TSRPT_anonymous.pdf")
+    content, stats = prepare_attachment_text(text)
+    assert stats["attachment_kind"] == "transcript"
+    assert stats["attachment_tokens_saved"] > 0
+    assert json.loads(content.split("\n", 1)[1]) == _compact(text)
+
+    # A short transcript is cheaper to send as its raw text.
+    text = _transcript_text("SSR_TSRPT_oreo.pdf")
+    content, stats = prepare_attachment_text(text)
+    assert content == text
+    assert stats["attachment_kind"] == "text"
+    assert stats["attachment_tokens_saved"] == 0
+
+
+def test_in_progress_and_wrapped_courses_are_kept():
+    courses = {c["Code"]: c for c in parse_transcript(_transcript_text("SSR_TSRPT_anonymous.pdf"))["CoursesTaken"]}
+
+    assert courses["CS 341"]["Term"] == "Winter 2020"
+    assert courses["CS 341"]["Grade"] is None
+    assert courses["MSCI 261"]["Description"] == "Engineering Economics: Financial Management for Engineers"
+    assert (courses["MSCI 261"]["Earned"], courses["MSCI 261"]["Grade"]) == ("0.50", "87")
+    assert courses["PD 20"]["Description"] == "Engineering Workplace Skills I: Developing Reasoned Conclusions"
+
+
+def test_terms_programs_and_trailing_sections_are_kept():
+    compact = _compact(_transcript_text("SSR_TSRPT_anonymous.pdf"))
+    terms = compact["Terms"]
+
+    assert terms["Fall 2017"]["Program"] == "Software Engineering, Honours, Co-operative Program"
+    assert "Program" not in terms["Winter 2018"]
+    assert terms["Winter 2020"]["Program"] == "Computer Science, Honours"
+    assert terms["Fall 2019"]["CumulativeGPA"] == "83.58"
+    assert terms["Spring 2019"]["Standing"] == "Excellent standing"
+    assert "SMF 213: Degree Requirement, Not in Average" in terms["Fall 2018"]["Notes"]
+    assert any("MSCI 261=AFM 121" in note for note in terms["Spring 2019"]["Notes"])
+    assert "CHEM 123L Chemical Reactions Lab 2 0.25" in compact["TransferCredits"]
+    assert "12/31/2019 Work Term 3 Completed" in compact["Milestones"]
+    assert compact["Awards"] == ["2018 University of Waterloo President's Scholarship"]
+
+
+def test_unreadable_course_lines_are_sent_alongside():
+    # A grade line after a course that already has its grade cannot be placed.
+    text = _transcript_text("SSR_TSRPT_anonymous.pdf").replace("\nECE  105", "\n0.50 0.50 91\nECE  105", 1)
+    compact = _compact(text)
+    assert compact["Unparsed"] == ["0.50 0.50 91"]
+    assert len([row for term in compact["Terms"].values() for row in term.get("Courses", [])]) == 36
@@ -0,0 +1,159 @@
+import json
+import os
+
+# Hard cap on one serialized tool result. Longer results have their largest
+# lists trimmed, and the result says what was cut.
+TOOL_RESULT_MAX_CHARS = int(os.getenv("AGENT_TOOL_RESULT_MAX_CHARS", "12000"))
+
+# Lists of at least this many dicts are sent as {"columns", "rows"} tables,
+# so the keys are written once instead of once per record.
+TABULAR_MIN_ROWS = 2
+
+ALL_FIELDS = "*"
+
+
+def _field_tree(fields: list) -> dict:
+    """["sections.class", "title"] -> {"sections": {"class": {}}, "title": {}}"""
+    tree = {}
+    for path in fields:
+        node = tree
+        for part in str(path).split("."):
+            part = part.strip()
+            if part:
+                node = node.setdefault(part, {})
+    return tree
+
+
+def _apply_tree(value, tree: dict):
+    if not tree:
+        return value
+    if isinstance(value, list):
+        return [_apply_tree(item, tree) for item in value]
+    if isinstance(value, dict):
+        return {key: _apply_tree(value[key], sub) for key, sub in tree.items() if key in value}
+    return value
+
+
+def project(doc, fields):
+    """
+    Keep only the dotted field paths of doc. A path through a list applies to
+    every element, so "sections.class" keeps the class of each section. None,
+    an empty list or "*" keeps the whole document. Returns new containers and
+    never modifies doc.
+    """
+    if isinstance(fields, str):
+        fields = [f for f in fields.split(",")]
+    if not fields or ALL_FIELDS in fields:
+        return doc
+    return _apply_tree(doc, _field_tree(fields))
+
+
+def tabulate(value):
+    """Recursively turn lists of dicts into {"columns": [...], "rows": [[...]]}."""
+    if isinstance(value, dict):
+        return {key: tabulate(item) for key, item in value.items()}
+    if not isinstance(value, list):
+        return value
+    items = [tabulate(item) for item in value]
+    if len(items) < TABULAR_MIN_ROWS or not all(isinstance(item, dict) for item in items):
+        return items
+    columns = []
+    for item in items:
+        for key in item:
+            if key not in columns:
+                columns.append(key)
+    return {"columns": columns, "rows": [[item.get(c) for c in columns] for item in items]}
+
+
+def _dumps(value) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+def _is_table(value) -> bool:
+    return isinstance(value, dict) and isinstance(value.get("columns"), list) and isinstance(value.get("rows"), list)
+
+
+def _lists(value, path=(), table=None):
+    """
+    Yield (path, list, table) for every list cap_result may shorten, where
+    table is the {"columns", "rows"} dict that owns a rows list. A table's
+    columns and each of its rows are never yielded, so rows are only ever
+    dropped whole.
+    """
+    if _is_table(value):
+        yield path + ("rows",), value["rows"], value
+        for i, row in enumerate(value["rows"]):
+            for j, cell in enumerate(row if isinstance(row, list) else [row]):
+                yield from _lists(cell, path + ("rows", i, j))
+        for key, child in value.items():
+            if key not in ("columns", "rows"):
+                yield from _lists(child, path + (key,))
+    elif isinstance(value, dict):
+        for key, child in value.items():
+            yield from _lists(child, path + (key,))
+    elif isinstance(value, list):
+        yield path, value, None
+        for i, child in enumerate(value):
+            yield from _lists(child, path + (i,))
+
+
+def cap_result(result, max_chars: int = TOOL_RESULT_MAX_CHARS):
+    """
+    Trim result until it serializes within max_chars. The largest list is cut
+    to as many leading items as fit, keeping at least one while any other list
+    can still be cut. Tables lose whole rows and say so with an "omitted"
+    marker such as "12 more rows omitted". A "truncated" entry records every
+    cut as {"path", "kept", "total"}. result is not modified.
+    """
+    if not isinstance(result, dict) or not max_chars or len(_dumps(result)) <= max_chars:
+        return result
+    result = json.loads(_dumps(result))
+    cuts = {}
+
+    def cut(path, items, table, keep, full):
+        key = ".".join(str(p) for p in path)
+        items[:] = full[:keep]
+        cuts[key] = {"path": key, "kept": keep, "total": cuts[key]["total"] if key in cuts else len(full)}
+        if table is not None:
+            table["omitted"] = f"{cuts[key]['total'] - keep} more rows omitted"
+        result["truncated"] = list(cuts.values())
+        return len(_dumps(result)) <= max_chars
+
+    for min_keep in (1, 0):
+        while len(_dumps(result)) > max_chars:
+            candidates = [
+                (len(_dumps(items)), path, items, table)
+                for path, items, table in _lists({k: v for k, v in result.items() if k != "truncated"})
+                if len(items) > min_keep
+            ]
+            if not candidates:
+                break
+            _, path, items, table = max(candidates, key=lambda c: c[0])
+            full = list(items)
+            # Largest number of leading items that fits, or min_keep if none does.
+            low, high = min_keep, len(full) - 1
+            while low < high:
+                mid = (low + high + 1) // 2
+                if cut(path, items, table, mid, full):
+                    low = mid
+                else:
+                    high = mid - 1
+            cut(path, items, table, low, full)
+    if len(_dumps(result)) > max_chars:
+        return {
+            "truncated": True,
+            "message": "Result exceeded the size limit. Narrow the query or request fewer fields."
+        }
+    return result
+
+
+def shape_result(result: dict, doc_key: str, fields, default_fields, compact: bool = True):
+    """
+    Project result[doc_key] to fields (or default_fields when fields is not
+    given), tabulate lists of records when compact, then apply the size cap.
+    """
+    if isinstance(result, dict) and isinstance(result.get(doc_key), (dict, list)):
+        result = dict(result)
+        doc = project(result[doc_key], fields if fields else default_fields)
+        result[doc_key] = tabulate(doc) if compact else doc
+    return cap_result(result)
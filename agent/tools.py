@@ -1,14 +1,52 @@
 import os
 import json
+import hashlib
 import requests
 import base64
 import firebase_admin
 from firebase_admin import credentials, firestore
 from llm_config import SERPAPI_API_KEY
+from course_cache import get_course, get_courses
+from course_alias import get_course_alias_store
+from major_index import get_major_requirement
+from occupancy import Occupancy, course_mask, format_time, mask_days, replaces, section_entry, term_occupancy
+from schedule_generator import find_schedules, SCHEDULE_DEFAULT_RESULTS
+from course_catalog import get_course_catalog, SEARCH_DEFAULT_LIMIT, SEARCH_MAX_LIMIT
+from user_doc import apply_user_mutations
+from search_cache import cached_search
+from cache import TTLCache
+from pdf_extract import extract_pdf_text
+from tool_output import shape_result, cap_result, tabulate
 
 _HTTP_SESSION = requests.Session()
 _SERPAPI_TIMEOUT_SECS = 20
 
+# Students re-attach the same transcript on later turns. Extracted text is
+# cached by SHA-256 of the file bytes, so repeats skip PDF parsing entirely.
+_ATTACHMENT_TEXT_CACHE = TTLCache(
+    int(os.getenv("AGENT_ATTACHMENT_CACHE_MAX_ENTRIES", "64")),
+    int(os.getenv("AGENT_ATTACHMENT_CACHE_TTL_SECS", "3600"))
+)
+
+# Fields returned by query_database_readonly when the caller does not pass
+# `fields`. Enrolment, waitlist and campus columns are left out of course_info
+# by default; they can be requested explicitly, e.g. "sections.enrl_tot".
+DEFAULT_QUERY_FIELDS = {
+    "course_info": [
+        "subject", "catalog", "title", "units", "term",
+        "sections.class", "sections.component", "sections.time_date", "sections.location"
+    ],
+    "user_schedule": None,
+    "user_assistant": None,
+    "major_graduation_requirement": None
+}
+_QUERY_RESULT_DOC_KEYS = {
+    "course_info": "course_data",
+    "user_schedule": "timetables",
+    "user_assistant": "assistant_data",
+    "major_graduation_requirement": "major_graduation_requirement"
+}
+
 # Initialize firebase admin if not already initialized
 if not firebase_admin._apps:
     service_account_json = os.getenv("FIREBASE_SERVICE_ACCOUNT_JSON")
@@ -31,20 +69,29 @@ def read_uploaded_file(file_path: str) -> str:
     
     if not os.path.exists(file_path):
         return f"Error: File {file_path} not found."
-        
-    ext = os.path.splitext(file_path)[1].lower()
-    
+
+    with open(file_path, 'rb') as f:
+        return extract_uploaded_bytes(file_path, f.read())
+
+
+def extract_uploaded_bytes(file_name: str, data: bytes) -> str:
+    """
+    Extract text from an uploaded file's bytes without touching disk. The file
+    name only selects the parser (.pdf or plain text).
+    """
+    ext = os.path.splitext(file_name or "")[1].lower()
+    cache_key = (hashlib.sha256(data).hexdigest(), ext == '.pdf')
+    cached = _ATTACHMENT_TEXT_CACHE.get(cache_key)
+    if cached is not None:
+        return cached
+
     if ext == '.pdf':
         try:
-            import pypdf
-            text = ""
-            with open(file_path, 'rb') as f:
-                reader = pypdf.PdfReader(f)
-                for page in reader.pages:
-                    extracted = page.extract_text()
-                    if extracted:
-                        text += extracted + "\n"
-            return text.strip() if text else "No text found in PDF."
+            text, info = extract_pdf_text(data)
+            text = text or "No text found in PDF."
+            if info["timed_out"]:
+                # A later upload may finish within the budget, so keep partial text out of the cache.
+                return text
         except ImportError:
             return "Error: The 'pypdf' library is required to parse PDF files. Install with 'pip install pypdf'."
         except Exception as e:
@@ -52,15 +99,22 @@ def read_uploaded_file(file_path: str) -> str:
     else:
         # Default to standard text reading
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                return f.read()
+            text = data.decode('utf-8')
         except UnicodeDecodeError:
             return "Error: File format is not supported or cannot be read as standard text."
 
-def browse_online(query: str) -> str:
+    _ATTACHMENT_TEXT_CACHE.set(cache_key, text)
+    return text
+
+def browse_online(query: str, context=None) -> str:
     """
     Browses the web for missing prerequisite or course info using SerpAPI.
+    Results are served from the search cache when possible.
     """
+    return cached_search("browse_online", query, _fetch_online, context)
+
+
+def _fetch_online(query: str) -> str:
     print(f"Browsing online for: {query}")
     if not SERPAPI_API_KEY or SERPAPI_API_KEY == "your_serpapi_key_here":
         return "Error: SERPAPI_API_KEY is not configured."
@@ -83,11 +137,16 @@ def browse_online(query: str) -> str:
         return f"Error searching online: {e}"
 
 
-def browse_uwflow(query: str) -> str:
+def browse_uwflow(query: str, context=None) -> str:
     """
     Searches UW Flow specifically for course/professor review information.
     Returns concise results with title, link, and snippet.
+    Results are served from the search cache when possible.
     """
+    return cached_search("browse_uwflow", query, _fetch_uwflow, context)
+
+
+def _fetch_uwflow(query: str) -> str:
     print(f"Browsing UW Flow for: {query}")
     if not SERPAPI_API_KEY or SERPAPI_API_KEY == "your_serpapi_key_here":
         return "Error: SERPAPI_API_KEY is not configured."
@@ -119,7 +178,37 @@ def browse_uwflow(query: str) -> str:
     except Exception as e:
         return f"Error searching UW Flow: {e}"
 
-def query_database_readonly(uid: str, query_type: str, target_id: str = None) -> dict:
+def _load_user_data(db, uid: str, context=None):
+    """
+    Return (exists, data) for users/{uid}. With a request context the snapshot is
+    shared across the request and data is a private copy that is safe to edit.
+    """
+    if context is not None:
+        return context.user_exists(), context.user_data_copy()
+    doc = db.collection("users").document(uid).get()
+    return doc.exists, (doc.to_dict() or {}) if doc.exists else {}
+
+
+def _record_user_write(context, fields: dict):
+    if context is not None:
+        context.record_user_write(fields)
+
+
+def query_database_readonly(uid: str, query_type: str, target_id: str = None, fields: list = None, compact: bool = True, context=None) -> dict:
+    """
+    Run _query_database_readonly and shape its result for the prompt: the
+    document is projected to `fields` (dotted paths, or the query type's
+    default projection), lists of records become column/row tables unless
+    compact is false, and the result is capped at TOOL_RESULT_MAX_CHARS.
+    """
+    result = _query_database_readonly(uid, query_type, target_id, context)
+    doc_key = _QUERY_RESULT_DOC_KEYS.get(query_type)
+    if doc_key is None:
+        return cap_result(result)
+    return shape_result(result, doc_key, fields, DEFAULT_QUERY_FIELDS.get(query_type), compact)
+
+
+def _query_database_readonly(uid: str, query_type: str, target_id: str = None, context=None) -> dict:
     """
     Accesses the database with read-only permissions.
     - query_type='course_info': Reads from the global 'courses' collection. 'target_id' is the course doc id (e.g., '1255_ACTSC_221').
@@ -172,25 +261,11 @@ def query_database_readonly(uid: str, query_type: str, target_id: str = None) ->
 
                 return candidates
 
-            candidates = _course_doc_id_candidates(target_id)
-            for candidate in candidates:
-                doc = db.collection("courses").document(candidate).get()
-                if doc.exists:
-                    return {"course_data": doc.to_dict(), "resolved_target_id": candidate}
-
-            doc = db.collection("courses").document(target_id).get()
-            if doc.exists:
-                return {"course_data": doc.to_dict()}
-            else:
-                return {
-                    "error": f"Course document {target_id} not found.",
-                    "tried_target_ids": candidates
-                }
+            return _resolve_course_info(db, target_id, _course_doc_id_candidates(target_id))
                 
         elif query_type == "user_schedule":
-            doc = db.collection("users").document(uid).get()
-            if doc.exists:
-                data = doc.to_dict() or {}
+            exists, data = _load_user_data(db, uid, context)
+            if exists:
                 # Return the timetables specifically so the agent can see active timetables and their courses
                 timetables = data.get("timetables", [])
                 active_id = data.get("activeTimetableId")
@@ -208,9 +283,13 @@ def query_database_readonly(uid: str, query_type: str, target_id: str = None) ->
             
         elif query_type == "user_assistant":
             if not target_id:
-                # Without term, retrieve all terms they generated for
+                # Without a term, list what exists per term rather than every
+                # generated schedule; the model asks for one term next.
                 docs = db.collection("users").document(uid).collection("assistant").stream()
-                return {"assistant_data": {d.id: d.to_dict() for d in docs}}
+                return {
+                    "assistant_terms": {d.id: _summarize_assistant_doc(d.to_dict() or {}) for d in docs},
+                    "message": "Summary only. Query again with target_id set to a term for its wishlist and generated schedules."
+                }
             
             doc = db.collection("users").document(uid).collection("assistant").document(target_id).get()
             if doc.exists:
@@ -218,8 +297,7 @@ def query_database_readonly(uid: str, query_type: str, target_id: str = None) ->
             return {"message": "No assistant data found. The collection for this term is currently empty.", "assistant_data": {}}
 
         elif query_type == "major_graduation_requirement":
-            user_doc = db.collection("users").document(uid).get()
-            user_data = user_doc.to_dict() or {} if user_doc.exists else {}
+            _, user_data = _load_user_data(db, uid, context)
 
             # Always prioritize the user's saved major to avoid invalid program IDs
             # being passed by model-generated tool arguments.
@@ -232,33 +310,12 @@ def query_database_readonly(uid: str, query_type: str, target_id: str = None) ->
                     "major_graduation_requirement": {}
                 }
 
-            collection = db.collection("major_graduation_requirement")
-            candidates = [requested]
-            normalized = requested.lower().replace("_", " ").strip()
-            if normalized != requested:
-                candidates.append(normalized)
-
-            # 1) Direct doc-id lookup attempts.
-            for candidate in candidates:
-                doc = collection.document(candidate).get()
-                if doc.exists:
-                    return {
-                        "major_graduation_requirement": doc.to_dict(),
-                        "resolved_target_id": doc.id
-                    }
-
-            # 2) Fallback scan against common name fields.
-            all_docs = collection.stream()
-            for d in all_docs:
-                payload = d.to_dict() or {}
-                major_field = str(payload.get("major", "")).strip().lower()
-                major_name_field = str(payload.get("majorName", "")).strip().lower()
-                doc_id_field = d.id.strip().lower()
-                if normalized in {major_field, major_name_field, doc_id_field}:
-                    return {
-                        "major_graduation_requirement": payload,
-                        "resolved_target_id": d.id
-                    }
+            doc_id, payload = get_major_requirement(db, requested)
+            if doc_id is not None:
+                return {
+                    "major_graduation_requirement": payload,
+                    "resolved_target_id": doc_id
+                }
 
             return {
                 "message": f"No major graduation requirement found for '{requested}'.",
@@ -271,7 +328,109 @@ def query_database_readonly(uid: str, query_type: str, target_id: str = None) ->
     except Exception as e:
         return {"error": str(e)}
 
-def create_timetable(uid: str, title: str, term: str) -> dict:
+def search_courses(query: str, term: str = None, limit: int = SEARCH_DEFAULT_LIMIT) -> dict:
+    """
+    Search the in-memory course catalog by course code ("CS136", "cs 13"),
+    subject ("MATH") or title words, returning canonical course_info doc ids.
+    """
+    if not str(query or "").strip():
+        return {"error": "query is required."}
+    if not firebase_admin._apps:
+        return {"error": "Firebase Admin SDK is not initialized."}
+    try:
+        limit = max(1, min(int(limit or SEARCH_DEFAULT_LIMIT), SEARCH_MAX_LIMIT))
+        catalog = get_course_catalog(firestore.client())
+        if catalog is None:
+            return {"error": "The course catalog is still loading. Try again shortly, or use query_database_readonly course_info with an exact course id."}
+        matches = catalog.search(query, term=term, limit=limit)
+    except Exception as e:
+        return {"error": f"Course search failed: {e}"}
+    if not matches:
+        return {"message": f"No courses matched '{query}'.", "courses": []}
+    return {"courses": tabulate(matches)}
+
+
+def _resolve_course_info(db, target_id: str, candidates: list) -> dict:
+    """
+    Resolve a model-supplied course id. A remembered alias is tried first, then
+    every candidate id in one batched read, then an exact code match in the
+    course catalog. Whatever resolves is remembered for the raw spelling.
+    """
+    aliases = get_course_alias_store()
+    alias = aliases.get(target_id)
+    if alias:
+        course_data = get_course(db, alias)
+        if course_data is not None:
+            return {"course_data": course_data, "resolved_target_id": alias}
+        aliases.forget(target_id)
+
+    # "/" is a path separator in Firestore and cannot appear in a document id.
+    lookups = [c for c in candidates if "/" not in c]
+    found = get_courses(db, lookups) if lookups else {}
+    for candidate in lookups:
+        if found.get(candidate) is not None:
+            if candidate != target_id:
+                aliases.set(target_id, candidate)
+            return {"course_data": found[candidate], "resolved_target_id": candidate}
+
+    try:
+        catalog = get_course_catalog(db)
+        matches = catalog.lookup_code(target_id) if catalog is not None else []
+    except Exception as e:
+        print(f"Course catalog lookup failed: {e}")
+        matches = []
+    if matches:
+        course_data = get_course(db, matches[0]["doc_id"])
+        if course_data is not None:
+            result = {"course_data": course_data, "resolved_target_id": matches[0]["doc_id"]}
+            if len(matches) > 1:
+                result["other_terms"] = [m["doc_id"] for m in matches[1:]]
+            if matches[0]["term"] in target_id:
+                # Without a term the newest offering wins, which changes as terms are added.
+                aliases.set(target_id, matches[0]["doc_id"])
+            return result
+
+    return {
+        "error": f"Course document {target_id} not found. Use search_courses to find the exact doc id.",
+        "tried_target_ids": candidates
+    }
+
+
+def _summarize_assistant_doc(data: dict) -> dict:
+    wishlist = data.get("wishlist") or {}
+    return {
+        "wishlist_courses": sorted(wishlist) if isinstance(wishlist, dict) else [],
+        "generated_schedule_count": len(data.get("generatedSchedules") or [])
+    }
+
+
+def _select_target_timetable(timetables: list, active_id) -> int:
+    """Index of the active timetable, falling back to the most recent one, or -1."""
+    for i, t in enumerate(timetables):
+        if t.get("id") == active_id:
+            return i
+    return len(timetables) - 1
+
+
+def _write_user_mutation(db, uid: str, context, mutate) -> dict:
+    """
+    Apply mutate(exists, data) -> (result, fields) to users/{uid}.
+
+    Inside a unit of work (see RequestContext.begin_unit_of_work) the change is
+    staged and committed with the rest of the LLM round. Otherwise it runs in
+    its own transaction against the latest document. A mutate that returns no
+    fields made no change and writes nothing.
+    """
+    if context is not None and context.in_unit_of_work():
+        return context.stage_user_mutation(mutate)
+
+    exists, data, results = apply_user_mutations(db, uid, [mutate])
+    if exists:
+        _record_user_write(context, {k: data[k] for k in ("timetables", "activeTimetableId") if k in data})
+    return results[0]
+
+
+def create_timetable(uid: str, title: str, term: str, context=None) -> dict:
     """
     Creates a new timetable for the user.
     """
@@ -282,110 +441,146 @@ def create_timetable(uid: str, title: str, term: str) -> dict:
         
     try:
         db = firestore.client()
-        user_ref = db.collection("users").document(uid)
-        doc = user_ref.get()
-        data = doc.to_dict() or {} if doc.exists else {}
-        
-        timetables = data.get("timetables", [])
         new_id = str(uuid.uuid4())
-        
-        new_tt = {
-            "id": new_id,
-            "name": title,
-            "term": term,
-            "courses": []
-        }
-        timetables.append(new_tt)
-        
-        user_ref.set({"timetables": timetables, "activeTimetableId": new_id}, merge=True)
 
-        # Read back immediately to ensure the write persisted before reporting success.
-        verify_doc = user_ref.get()
-        verify_data = verify_doc.to_dict() or {} if verify_doc.exists else {}
-        verify_timetables = verify_data.get("timetables", [])
-        if any(t.get("id") == new_id for t in verify_timetables):
+        def mutate(exists, data):
+            timetables = data.setdefault("timetables", [])
+            new_tt = {
+                "id": new_id,
+                "name": title,
+                "term": term,
+                "courses": []
+            }
+            timetables.append(new_tt)
+            data["activeTimetableId"] = new_id
             return {
                 "message": f"Successfully created new timetable '{title}' for term {term}.",
                 "timetable_id": new_id
-            }
-        return {"error": "Timetable creation could not be confirmed after write."}
+            }, {"timetables": timetables, "activeTimetableId": new_id}
+
+        return _write_user_mutation(db, uid, context, mutate)
     except Exception as e:
         return {"error": str(e)}
 
-def add_course_to_timetable(uid: str, term: str, course_code: str, sections: list) -> dict:
+def check_conflicts(uid: str, term: str, candidates: list, include_timetable: bool = True, context=None) -> dict:
     """
-    Adds a course's specific sections to the user's timetable in the database.
+    Check a whole candidate set of course sections for time conflicts, against
+    each other and (by default) against the user's active timetable for term,
+    without writing anything. candidates is a list of
+    {"course_code": "CS 136", "sections": ["LEC 001", "TUT 101"]}.
     """
-    import re
-    def parse_time_date(time_str):
-        if not time_str or time_str.strip() == "" or time_str.strip() == "TBA":
-            return {"startHour": 0, "startMinute": 0, "endHour": 0, "endMinute": 0, "days": []}
-            
-        match = re.search(r"(\d{1,2}):(\d{2})-(\d{1,2}):(\d{2})", time_str)
-        if not match:
-            return {"startHour": 0, "startMinute": 0, "endHour": 0, "endMinute": 0, "days": []}
-            
-        start_h, start_m, end_h, end_m = [int(g) for g in match.groups()]
-        
-        if start_h < 8: start_h += 12
-        if end_h < 8: end_h += 12
-        if end_h < start_h: end_h += 12
-            
-        rest = time_str[match.end():].strip()
-        days_letters = ""
-        for c in rest:
-            if c.isalpha():
-                days_letters += c
-            else:
-                break
-                
-        days = []
-        i = 0
-        while i < len(days_letters):
-            if days_letters[i] == 'M': days.append("Mon"); i += 1
-            elif days_letters[i] == 'T':
-                if i + 1 < len(days_letters) and days_letters[i+1] == 'h':
-                    days.append("Thu"); i += 2
-                else: days.append("Tue"); i += 1
-            elif days_letters[i] == 'W': days.append("Wed"); i += 1
-            elif days_letters[i] == 'F': days.append("Fri"); i += 1
-            elif days_letters[i] == 'S':
-                if i + 1 < len(days_letters) and days_letters[i+1] == 'u':
-                    days.append("Sun")
-                else: days.append("Sat")
-                i += 1
-            else: i += 1
-                
-        return {"startHour": start_h, "startMinute": start_m, "endHour": end_h, "endMinute": end_m, "days": days}
-
-    def to_minutes(hour_val, minute_val):
-        return int(hour_val) * 60 + int(minute_val)
-
-    def has_time_conflict(existing_course, candidate_course):
-        existing_days = set(existing_course.get("days", []) or [])
-        candidate_days = set(candidate_course.get("days", []) or [])
-        if not existing_days or not candidate_days:
-            return False
-
-        overlap_days = existing_days.intersection(candidate_days)
-        if not overlap_days:
-            return False
-
-        existing_start = to_minutes(existing_course.get("startHour", 0), existing_course.get("startMinute", 0))
-        existing_end = to_minutes(existing_course.get("endHour", 0), existing_course.get("endMinute", 0))
-        candidate_start = to_minutes(candidate_course.get("startHour", 0), candidate_course.get("startMinute", 0))
-        candidate_end = to_minutes(candidate_course.get("endHour", 0), candidate_course.get("endMinute", 0))
+    print(f"Checking conflicts - User: {uid}, Term: {term}, Candidates: {candidates}")
+    if not firebase_admin._apps:
+        return {"error": "Firebase Admin SDK is not initialized."}
+    if not isinstance(candidates, list) or not candidates:
+        return {"error": "candidates must be a non-empty list of {course_code, sections}."}
 
-        if existing_end <= existing_start or candidate_end <= candidate_start:
-            return False
+    try:
+        db = firestore.client()
+        requested = []
+        for candidate in candidates:
+            course_code = " ".join(str((candidate or {}).get("course_code", "")).split()).upper()
+            parts = course_code.split(" ")
+            if len(parts) < 2:
+                return {"error": f"Invalid course_code '{course_code}'. Expecting e.g. 'CS 136'"}
+            doc_id = f"{term}_{parts[0]}_{' '.join(parts[1:])}"
+            requested.append((course_code, doc_id, list(candidate.get("sections") or [])))
+        courses = get_courses(db, [doc_id for _, doc_id, _ in requested])
+
+        occupied = Occupancy()
+        if include_timetable:
+            _, data = _load_user_data(db, uid, context)
+            timetables = data.get("timetables", [])
+            target_idx = _select_target_timetable(timetables, data.get("activeTimetableId"))
+            if target_idx != -1:
+                occupied = term_occupancy(timetables[target_idx].get("courses", []), term)
+
+        conflicts = []
+        not_found = []
+        checked = 0
+        for course_code, doc_id, sections in requested:
+            course_data = courses.get(doc_id)
+            if course_data is None:
+                not_found.append(course_code)
+                continue
+            section_map = {sec.get("component"): sec for sec in course_data.get("sections", [])}
+            for component in sections:
+                if component not in section_map:
+                    not_found.append(f"{course_code} {component}")
+                    continue
+                entry = section_entry(term, course_code, course_data, section_map[component])
+                mask = course_mask(entry)
+                replaced = replaces(course_code, str(term), component)
+                for existing, overlap in occupied.conflicts(mask, ignore=replaced):
+                    conflicts.append({
+                        "section": f"{course_code} {component}",
+                        "section_time": f"{entry['days']} {format_time(entry)}",
+                        "conflicts_with": f"{existing.get('code', 'Unknown')} {existing.get('component', '')}",
+                        "conflicts_with_time": f"{existing.get('days', [])} {format_time(existing)}",
+                        "days": mask_days(overlap)
+                    })
+                occupied.remove(replaced)
+                occupied.add(entry, mask)
+                checked += 1
+
+        result = {"conflict_free": not conflicts and not not_found, "sections_checked": checked, "conflicts": conflicts}
+        if not_found:
+            result["not_found"] = not_found
+        return result
+    except Exception as e:
+        return {"error": str(e)}
 
-        return candidate_start < existing_end and existing_start < candidate_end
 
+def generate_schedules(term: str, course_codes: list, subset_size: int = None, max_results: int = SCHEDULE_DEFAULT_RESULTS) -> dict:
+    """
+    Generate conflict-free schedules for a wishlist of courses in a term. Each
+    schedule has one section of every component (LEC, TUT, LAB, ...) of each
+    course; subset_size picks that many of the courses instead of all of them.
+    """
+    print(f"Generating schedules - Term: {term}, Courses: {course_codes}, Subset: {subset_size}")
+    if not firebase_admin._apps:
+        return {"error": "Firebase Admin SDK is not initialized."}
+    if not isinstance(course_codes, list) or not course_codes:
+        return {"error": "course_codes must be a non-empty list such as ['CS 136', 'MATH 136']."}
+    try:
+        schedules, not_found, stats = find_schedules(firestore.client(), term, course_codes, subset_size, max_results)
+    except Exception as e:
+        return {"error": f"Schedule generation failed: {e}"}
+
+    rows = [
+        tabulate([
+            {
+                "code": e["code"],
+                "component": e["component"],
+                "days": e["days"],
+                "time": format_time(e),
+                "location": e["location"],
+                "equivalent": e.get("equivalentComponents", [])
+            }
+            for e in schedule
+        ])
+        for schedule in schedules
+    ]
+    result = {"schedules": rows, "more_may_exist": not stats.get("exhausted", True)}
+    if not schedules:
+        result["message"] = "No conflict-free schedule found for these courses."
+    if not_found:
+        result["not_found"] = not_found
+    if stats.get("courses_ignored"):
+        result["courses_ignored"] = stats["courses_ignored"]
+    return cap_result(result)
+
+
+def add_course_to_timetable(uid: str, term: str, course_code: str, sections: list, context=None) -> dict:
+    """
+    Adds a course's specific sections to the user's timetable in the database.
+    """
     print(f"Adding course to timetable - User: {uid}, Term: {term}, Course: {course_code}, Sections: {sections}")
     if not firebase_admin._apps:
         return {"error": "Firebase Admin SDK is not initialized."}
     
     try:
+        import uuid
         db = firestore.client()
         parts = course_code.split(" ")
         if len(parts) >= 2:
@@ -395,100 +590,70 @@ def add_course_to_timetable(uid: str, term: str, course_code: str, sections: lis
             return {"error": "Invalid course_code format. Expecting e.g. 'CS 136'"}
 
         doc_id = f"{term}_{subject}_{catalog}"
-        course_doc = db.collection("courses").document(doc_id).get()
-        if not course_doc.exists:
+        course_data = get_course(db, doc_id)
+        if course_data is None:
             return {"error": f"Course {course_code} not found in database for term {term}. Does this course exist?"}
             
-        course_data = course_doc.to_dict()
         available_sections = course_data.get("sections", [])
         
         # map for matching
         section_map = {s["component"]: s for s in available_sections}
-        
-        user_ref = db.collection("users").document(uid)
-        doc = user_ref.get()
-        data = doc.to_dict() or {} if doc.exists else {}
-        
-        timetables = data.get("timetables", [])
-        active_id = data.get("activeTimetableId")
-        target_idx = -1
-        
-        for i, t in enumerate(timetables):
-            if t.get("id") == active_id:
-                target_idx = i
-                break
+        new_id = str(uuid.uuid4())
+
+        def mutate(exists, data):
+            # Work on a copy of the list and touch data only once every section
+            # fits, so a failed add leaves nothing behind for later mutations
+            # committed in the same transaction.
+            timetables = list(data.get("timetables", []))
+            fields = {}
+            target_idx = _select_target_timetable(timetables, data.get("activeTimetableId"))
+            if target_idx == -1:
+                timetables.append({"id": new_id, "name": "My Timetable", "term": term, "courses": []})
+                target_idx = 0
+                fields["activeTimetableId"] = new_id
                 
-        if target_idx == -1 and len(timetables) > 0:
-            target_idx = len(timetables) - 1
+            scheduled_courses = timetables[target_idx].get("courses", [])
+            occupied = term_occupancy(scheduled_courses, term)
             
-        if target_idx == -1:
-            import uuid
-            new_id = str(uuid.uuid4())
-            new_tt = {"id": new_id, "name": "My Timetable", "term": term, "courses": []}
-            timetables.append(new_tt)
-            target_idx = 0
-            user_ref.set({"activeTimetableId": new_id}, merge=True)
-            
-        scheduled_courses = timetables[target_idx].get("courses", [])
-        
-        added_count = 0
-        added_components = []
-        for sec_req in sections:
-            if sec_req in section_map:
-                sec_data = section_map[sec_req]
-                t_info = parse_time_date(sec_data.get("time_date", ""))
-                
-                new_course = {
-                    "code": str(course_code),
-                    "title": str(course_data.get("title", "")),
-                    "term": str(term),
-                    "units": str(course_data.get("units", "0.5")),
-                    "classNumber": str(sec_data.get("class", "")),
-                    "component": str(sec_data.get("component", "")),
-                    "days": t_info["days"],
-                    "startHour": int(t_info["startHour"]),
-                    "startMinute": int(t_info["startMinute"]),
-                    "endHour": int(t_info["endHour"]),
-                    "endMinute": int(t_info["endMinute"]),
-                    "location": str(sec_data.get("location", ""))
-                }
-                
-                prefix = sec_req.split(" ")[0] if " " in sec_req else sec_req
-                filtered_courses = [
-                    c for c in scheduled_courses 
-                    if not (c.get("code") == course_code and c.get("term") == term and c.get("component", "").startswith(prefix))
-                ]
-
-                for existing in filtered_courses:
-                    if str(existing.get("term", "")) != str(term):
-                        continue
-                    if has_time_conflict(existing, new_course):
-                        conflict_time = (
-                            f"{existing.get('startHour', 0):02d}:{existing.get('startMinute', 0):02d}-"
-                            f"{existing.get('endHour', 0):02d}:{existing.get('endMinute', 0):02d}"
-                        )
+            added_count = 0
+            added_components = []
+            for sec_req in sections:
+                if sec_req in section_map:
+                    new_course = section_entry(term, course_code, course_data, section_map[sec_req])
+                    
+                    # Re-adding a component type of the same course replaces it.
+                    replaced = replaces(course_code, str(term), sec_req)
+                    new_mask = course_mask(new_course)
+                    hits = occupied.conflicts(new_mask, ignore=replaced)
+                    if hits:
+                        existing = hits[0][0]
                         return {
                             "error": (
                                 f"Time conflict detected when adding {course_code} {sec_req}. "
                                 f"Conflicts with {existing.get('code', 'Unknown')} {existing.get('component', '')} "
-                                f"on {existing.get('days', [])} at {conflict_time}."
+                                f"on {existing.get('days', [])} at {format_time(existing)}."
                             )
-                        }
-
-                filtered_courses.append(new_course)
-                scheduled_courses = filtered_courses
-                added_count += 1
-                added_components.append(sec_req)
-            else:
-                return {"error": f"Section component '{sec_req}' not found for course {course_code}. Available components: {list(section_map.keys())}"}
-                
-        timetables[target_idx]["courses"] = scheduled_courses
-        user_ref.set({"timetables": timetables}, merge=True)
-        return {"message": f"Successfully added/updated sections: {', '.join(added_components)} for {course_code} in term {term}."}
+                        }, None
+
+                    scheduled_courses = [c for c in scheduled_courses if not replaced(c)]
+                    occupied.remove(replaced)
+                    scheduled_courses.append(new_course)
+                    occupied.add(new_course, new_mask)
+                    added_count += 1
+                    added_components.append(sec_req)
+                else:
+                    return {"error": f"Section component '{sec_req}' not found for course {course_code}. Available components: {list(section_map.keys())}"}, None
+                    
+            timetables[target_idx] = {**timetables[target_idx], "courses": scheduled_courses}
+            fields["timetables"] = timetables
+            data.update(fields)
+            return {"message": f"Successfully added/updated sections: {', '.join(added_components)} for {course_code} in term {term}."}, fields
+
+        return _write_user_mutation(db, uid, context, mutate)
     except Exception as e:
         return {"error": str(e)}
 
-def delete_course_from_timetable(uid: str, term: str, course_code: str) -> dict:
+def delete_course_from_timetable(uid: str, term: str, course_code: str, context=None) -> dict:
     """
     Deletes a specific course from the user's timetable.
     """
@@ -498,41 +663,32 @@ def delete_course_from_timetable(uid: str, term: str, course_code: str) -> dict:
     
     try:
         db = firestore.client()
-        user_ref = db.collection("users").document(uid)
-        doc = user_ref.get()
-        
-        if not doc.exists:
-            return {"message": "User document not found."}
-            
-        data = doc.to_dict() or {}
-        timetables = data.get("timetables", [])
-        active_id = data.get("activeTimetableId")
-        target_idx = -1
-        for i, t in enumerate(timetables):
-            if t.get("id") == active_id:
-                target_idx = i
-                break
-        if target_idx == -1 and len(timetables) > 0:
-            target_idx = len(timetables) - 1
+
+        def mutate(exists, data):
+            if not exists:
+                return {"message": "User document not found."}, None
+                
+            timetables = data.get("timetables", [])
+            target_idx = _select_target_timetable(timetables, data.get("activeTimetableId"))
+            if target_idx == -1:
+                return {"message": "You don't have any existing timetables."}, None
+                
+            scheduled_courses = timetables[target_idx].get("courses", [])
             
-        if target_idx == -1:
-            return {"message": "You don't have any existing timetables."}
+            original_length = len(scheduled_courses)
+            scheduled_courses = [c for c in scheduled_courses if not (str(c.get("term")) == str(term) and c.get("code") == course_code)]
             
-        scheduled_courses = timetables[target_idx].get("courses", [])
-        
-        original_length = len(scheduled_courses)
-        scheduled_courses = [c for c in scheduled_courses if not (str(c.get("term")) == str(term) and c.get("code") == course_code)]
-        
-        if len(scheduled_courses) == original_length:
-            return {"message": f"Course {course_code} for term {term} is not present in the timetable."}
-            
-        timetables[target_idx]["courses"] = scheduled_courses
-        user_ref.set({"timetables": timetables}, merge=True)
-        return {"message": f"Successfully deleted {course_code} from timetable for term {term}."}
+            if len(scheduled_courses) == original_length:
+                return {"message": f"Course {course_code} for term {term} is not present in the timetable."}, None
+                
+            timetables[target_idx]["courses"] = scheduled_courses
+            return {"message": f"Successfully deleted {course_code} from timetable for term {term}."}, {"timetables": timetables}
+
+        return _write_user_mutation(db, uid, context, mutate)
     except Exception as e:
         return {"error": str(e)}
 
-def clear_timetable(uid: str, term: str) -> dict:
+def clear_timetable(uid: str, term: str, context=None) -> dict:
     """
     Clears the user's timetable for a specific term.
     """
@@ -542,33 +698,24 @@ def clear_timetable(uid: str, term: str) -> dict:
     
     try:
         db = firestore.client()
-        user_ref = db.collection("users").document(uid)
-        doc = user_ref.get()
-        
-        if not doc.exists:
-            return {"message": "User document not found."}
-            
-        data = doc.to_dict() or {}
-        timetables = data.get("timetables", [])
-        active_id = data.get("activeTimetableId")
-        target_idx = -1
-        for i, t in enumerate(timetables):
-            if t.get("id") == active_id:
-                target_idx = i
-                break
-        if target_idx == -1 and len(timetables) > 0:
-            target_idx = len(timetables) - 1
+
+        def mutate(exists, data):
+            if not exists:
+                return {"message": "User document not found."}, None
+                
+            timetables = data.get("timetables", [])
+            target_idx = _select_target_timetable(timetables, data.get("activeTimetableId"))
+            if target_idx == -1:
+                return {"message": "You don't have any existing timetables."}, None
+                
+            scheduled_courses = timetables[target_idx].get("courses", [])
             
-        if target_idx == -1:
-            return {"message": "You don't have any existing timetables."}
+            scheduled_courses = [c for c in scheduled_courses if str(c.get("term")) != str(term)]
             
-        scheduled_courses = timetables[target_idx].get("courses", [])
-        
-        scheduled_courses = [c for c in scheduled_courses if str(c.get("term")) != str(term)]
-        
-        timetables[target_idx]["courses"] = scheduled_courses
-        user_ref.set({"timetables": timetables}, merge=True)
-        return {"message": f"Successfully cleared timetable for term {term}."}
+            timetables[target_idx]["courses"] = scheduled_courses
+            return {"message": f"Successfully cleared timetable for term {term}."}, {"timetables": timetables}
+
+        return _write_user_mutation(db, uid, context, mutate)
     except Exception as e:
         return {"error": str(e)}
 
@@ -628,13 +775,108 @@ TOOLS_SCHEMA = [
                     },
                     "target_id": {
                         "type": "string",
-                        "description": "The specific document ID. Required for 'course_info' (e.g. '1255_ACTSC_221'). For 'user_assistant', it is the term code (e.g., '1255'). For 'major_graduation_requirement', pass major slug/name (optional if user profile already has a major). Optional/ignored for 'user_schedule'."
+                        "description": "The specific document ID. Required for 'course_info' (e.g. '1255_ACTSC_221'). For 'user_assistant', it is the term code (e.g., '1255'); without it only a per-term summary is returned. For 'major_graduation_requirement', pass major slug/name (optional if user profile already has a major). Optional/ignored for 'user_schedule'."
+                    },
+                    "fields": {
+                        "type": "array",
+                        "items": { "type": "string" },
+                        "description": "Optional dotted field paths to return, e.g. ['title', 'sections.class', 'sections.enrl_cap', 'sections.enrl_tot']. 'course_info' omits campus, enrolment and waitlist fields unless requested here. Pass ['*'] for the whole document."
+                    },
+                    "compact": {
+                        "type": "boolean",
+                        "description": "Defaults to true: lists of records (such as sections) are returned as {columns, rows} tables. Set false for one object per record."
                     }
                 },
                 "required": ["query_type"]
             }
         }
     },
+    {
+        "type": "function",
+        "function": {
+            "name": "search_courses",
+            "description": "Searches the course catalog by course code, subject or title words and returns canonical course doc ids (e.g. '1261_CS_136') for query_database_readonly course_info. Use it whenever the exact course code or term is not certain.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "query": {
+                        "type": "string",
+                        "description": "A course code or prefix ('CS136', 'cs 13', 'MATH'), or title words ('linear algebra')."
+                    },
+                    "term": {
+                        "type": "string",
+                        "description": "Optional term code to restrict results to (e.g. '1261')."
+                    },
+                    "limit": {
+                        "type": "integer",
+                        "description": "Maximum number of results (default 10, at most 50)."
+                    }
+                },
+                "required": ["query"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "check_conflicts",
+            "description": "Checks a whole set of course sections for time conflicts with each other and with the user's active timetable for a term, without changing anything. Use it to validate a plan before adding courses.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "term": { "type": "string", "description": "The term code (e.g., '1261')." },
+                    "candidates": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "course_code": { "type": "string", "description": "The course code (e.g., 'CS 136')." },
+                                "sections": {
+                                    "type": "array",
+                                    "items": { "type": "string" },
+                                    "description": "Exact section component names (e.g., 'LEC 001', 'TUT 101')."
+                                }
+                            },
+                            "required": ["course_code", "sections"]
+                        },
+                        "description": "The courses and sections to check together."
+                    },
+                    "include_timetable": {
+                        "type": "boolean",
+                        "description": "Also check against the user's active timetable (default true). Sections of a course already in the timetable replace that course's sections of the same type."
+                    }
+                },
+                "required": ["term", "candidates"]
+            }
+        }
+    },
+    {
+        "type": "function",
+        "function": {
+            "name": "generate_schedules",
+            "description": "Generates conflict-free schedules for a wishlist of courses in a term, choosing one section of every component (LEC, TUT, LAB, ...) of each course. Sections with identical times are listed as equivalents.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "term": { "type": "string", "description": "The term code (e.g., '1261')." },
+                    "course_codes": {
+                        "type": "array",
+                        "items": { "type": "string" },
+                        "description": "The wishlist course codes (e.g., ['CS 136', 'MATH 136', 'STAT 230'])."
+                    },
+                    "subset_size": {
+                        "type": "integer",
+                        "description": "Optional number of wishlist courses each schedule must contain. Defaults to all of them."
+                    },
+                    "max_results": {
+                        "type": "integer",
+                        "description": "Maximum number of schedules to return (default 5)."
+                    }
+                },
+                "required": ["term", "course_codes"]
+            }
+        }
+    },
     {
         "type": "function",
         "function": {
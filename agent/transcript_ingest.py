@@ -0,0 +1,82 @@
+import json
+from context_budget import estimate_text_tokens
+from parse_scripts import load_parse_script
+
+parse_transcript = load_parse_script("parse_transcript").parse_transcript
+
+TRANSCRIPT_MARKERS = ("Unofficial Transcript", "Course Description Attempted Earned Grade")
+COURSE_COLUMNS = ["Code", "Description", "Attempted", "Earned", "Grade"]
+TERM_FIELDS = ["Program", "Level", "Load", "FormOfStudy", "TermGPA", "CumulativeGPA", "Standing", "Notes"]
+SECTION_FIELDS = ["Milestones", "Awards", "TransferCredits", "Unparsed"]
+
+
+def looks_like_transcript(text: str) -> bool:
+    return all(marker in (text or "") for marker in TRANSCRIPT_MARKERS)
+
+
+def compact_transcript(parsed: dict) -> dict:
+    """
+    Group courses by term as rows, so keys are not repeated for every course.
+    Each term keeps its level, GPAs, standing and notes, plus its program on
+    the first term and whenever it changes. The sections after the last term
+    are kept as parsed. Empty fields are left out.
+    """
+    terms = {}
+    program = None
+    for term in parsed.get("Terms", []):
+        entry = terms.setdefault(term.get("Term") or "Unknown term", {})
+        entry.update({field: term[field] for field in TERM_FIELDS if term.get(field)})
+        if program and entry.get("Program") == program:
+            entry.pop("Program")
+        program = term.get("Program") or program
+    for course in parsed.get("CoursesTaken", []):
+        entry = terms.setdefault(course.get("Term") or "Unknown term", {})
+        entry.setdefault("Courses", []).append([course.get(c) for c in COURSE_COLUMNS])
+    compact = {
+        "Name": parsed.get("Name"),
+        "SID": parsed.get("SID"),
+        "Program": parsed.get("Program"),
+        "CourseColumns": COURSE_COLUMNS,
+        "Terms": terms
+    }
+    compact.update({field: parsed[field] for field in SECTION_FIELDS if parsed.get(field)})
+    return compact
+
+
+def prepare_attachment_text(text: str):
+    """
+    Return (content, stats) for extracted attachment text. A UWaterloo
+    transcript is replaced by its parsed, compact JSON when that is smaller.
+    Course-table lines the parser could not read are sent with it under
+    "Unparsed". Anything else, a transcript without any parsed course, or one
+    whose compact form would not save tokens, is passed through as raw text.
+    """
+    raw_tokens = estimate_text_tokens(text)
+    stats = {"attachment_kind": "text", "attachment_tokens": raw_tokens, "attachment_tokens_saved": 0}
+    if not looks_like_transcript(text):
+        return text, stats
+
+    try:
+        parsed = parse_transcript(text)
+    except Exception as e:
+        print(f"Transcript parsing failed, sending raw text: {e}")
+        return text, stats
+    if not parsed.get("CoursesTaken"):
+        return text, stats
+
+    content = (
+        "Parsed University of Waterloo unofficial transcript (structured from the attached PDF; "
+        "courses grouped by term; a null Grade means the course is in progress):\n"
+        + json.dumps(compact_transcript(parsed), ensure_ascii=False, separators=(",", ":"))
+    )
+    tokens = estimate_text_tokens(content)
+    if tokens >= raw_tokens:
+        return text, stats
+    stats.update({
+        "attachment_kind": "transcript",
+        "attachment_tokens": tokens,
+        "attachment_tokens_saved": raw_tokens - tokens,
+        "transcript_courses": len(parsed["CoursesTaken"]),
+        "transcript_unparsed_lines": len(parsed.get("Unparsed", []))
+    })
+    return content, stats
@@ -0,0 +1,148 @@
+import os
+import tempfile
+import threading
+import time
+from sqlite_store import connection
+
+ALLOWED = "allowed"
+RATE_LIMITED = "rate_limited"
+QUOTA_EXCEEDED = "quota_exceeded"
+
+# How often stores sweep out uids that have no live rate window and no usage today.
+EVICT_INTERVAL_SECS = 300
+
+
+def usage_day(now: float) -> str:
+    return time.strftime("%Y-%m-%d", time.gmtime(now))
+
+
+def _evaluate(state, now: float, cost: int, window_secs: int, max_requests: int, daily_max_cost: int):
+    """
+    Apply one request to a uid's usage state and return (outcome, new_state).
+
+    state is (window_idx, window_count, prev_window_count, day, day_cost), or
+    None for a new uid. The rate limit is a sliding-window counter. The previous
+    fixed window is weighted by how much of it still overlaps the sliding window.
+    That needs O(1) memory per uid, unlike a deque of timestamps.
+    """
+    window_idx = int(now // window_secs)
+    day = usage_day(now)
+    if state is None:
+        state = (window_idx, 0, 0, day, 0)
+    last_idx, count, prev_count, last_day, day_cost = state
+
+    if window_idx != last_idx:
+        prev_count = count if window_idx == last_idx + 1 else 0
+        count = 0
+    if day != last_day:
+        day_cost = 0
+
+    elapsed_fraction = (now - window_idx * window_secs) / window_secs
+    estimated = prev_count * (1 - elapsed_fraction) + count
+    if estimated >= max_requests:
+        return RATE_LIMITED, (window_idx, count, prev_count, day, day_cost)
+    count += 1
+
+    if day_cost + cost > daily_max_cost:
+        return QUOTA_EXCEEDED, (window_idx, count, prev_count, day, day_cost)
+    return ALLOWED, (window_idx, count, prev_count, day, day_cost + cost)
+
+
+class InMemoryUsageStore:
+    """Per-process usage store. Limits are enforced per worker process."""
+
+    def __init__(self, window_secs: int, max_requests: int, daily_max_cost: int):
+        self.window_secs = window_secs
+        self.max_requests = max_requests
+        self.daily_max_cost = daily_max_cost
+        self._states = {}
+        self._lock = threading.Lock()
+        self._next_evict = 0.0
+
+    def check(self, uid: str, cost: int, now: float = None) -> str:
+        now = time.time() if now is None else now
+        with self._lock:
+            outcome, state = _evaluate(
+                self._states.get(uid), now, cost,
+                self.window_secs, self.max_requests, self.daily_max_cost
+            )
+            self._states[uid] = state
+            if now >= self._next_evict:
+                self._evict_idle(now)
+            return outcome
+
+    def _evict_idle(self, now: float):
+        self._next_evict = now + EVICT_INTERVAL_SECS
+        oldest_live_window = int(now // self.window_secs) - 1
+        today = usage_day(now)
+        idle = [
+            uid for uid, (window_idx, _, _, day, day_cost) in self._states.items()
+            if window_idx < oldest_live_window and (day != today or day_cost == 0)
+        ]
+        for uid in idle:
+            del self._states[uid]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._states)
+
+
+class SQLiteUsageStore:
+    """
+    Usage store that is shared by every worker process on a node through one
+    SQLite file in WAL mode. Each check is a short BEGIN IMMEDIATE transaction,
+    so concurrent workers see one consistent count per uid.
+    """
+
+    def __init__(self, path: str, window_secs: int, max_requests: int, daily_max_cost: int):
+        self.path = path
+        self.window_secs = window_secs
+        self.max_requests = max_requests
+        self.daily_max_cost = daily_max_cost
+        self._next_evict = 0.0
+        with connection(self.path) as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS usage ("
+                "uid TEXT PRIMARY KEY, window_idx INTEGER, window_count INTEGER, "
+                "prev_window_count INTEGER, day TEXT, day_cost INTEGER)"
+            )
+
+    def check(self, uid: str, cost: int, now: float = None) -> str:
+        now = time.time() if now is None else now
+        with connection(self.path) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT window_idx, window_count, prev_window_count, day, day_cost FROM usage WHERE uid = ?",
+                    (uid,)
+                ).fetchone()
+                outcome, state = _evaluate(
+                    tuple(row) if row else None, now, cost,
+                    self.window_secs, self.max_requests, self.daily_max_cost
+                )
+                conn.execute(
+                    "INSERT OR REPLACE INTO usage "
+                    "(uid, window_idx, window_count, prev_window_count, day, day_cost) VALUES (?, ?, ?, ?, ?, ?)",
+                    (uid, *state)
+                )
+                if now >= self._next_evict:
+                    self._next_evict = now + EVICT_INTERVAL_SECS
+                    conn.execute(
+                        "DELETE FROM usage WHERE window_idx < ? AND (day != ? OR day_cost = 0)",
+                        (int(now // self.window_secs) - 1, usage_day(now))
+                    )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return outcome
+
+
+def create_usage_store(backend: str, window_secs: int, max_requests: int, daily_max_cost: int, db_path: str = None):
+    backend = (backend or "memory").strip().lower()
+    if backend == "memory":
+        return InMemoryUsageStore(window_secs, max_requests, daily_max_cost)
+    if backend == "sqlite":
+        path = db_path or os.path.join(tempfile.gettempdir(), "agent_usage.sqlite3")
+        return SQLiteUsageStore(path, window_secs, max_requests, daily_max_cost)
+    raise ValueError(f"AGENT_USAGE_BACKEND must be 'memory' or 'sqlite', got {backend!r}")
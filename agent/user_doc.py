@@ -0,0 +1,38 @@
+import os
+from firebase_admin import firestore
+
+# Firestore retries a transaction when another writer touched users/{uid}
+# between our read and commit. This caps those retries per write.
+USER_TXN_MAX_ATTEMPTS = int(os.getenv("AGENT_USER_TXN_MAX_ATTEMPTS", "5"))
+
+
+def apply_user_mutations(db, uid: str, mutations: list):
+    """
+    Read users/{uid} inside a transaction, apply each mutate(exists, data) ->
+    (result, fields) in order and write the union of changed fields once.
+
+    If the document changes before commit, the transaction is retried from a
+    fresh read, up to USER_TXN_MAX_ATTEMPTS times. Concurrent edits from other
+    devices or chats are therefore never overwritten. Returns
+    (exists, data, results), where data is the document as committed.
+    """
+    user_ref = db.collection("users").document(uid)
+
+    @firestore.transactional
+    def _apply(transaction):
+        snapshot = user_ref.get(transaction=transaction)
+        exists = snapshot.exists
+        data = (snapshot.to_dict() or {}) if exists else {}
+        fields = {}
+        results = []
+        for mutate in mutations:
+            result, mutate_fields = mutate(exists, data)
+            results.append(result)
+            if mutate_fields:
+                fields.update(mutate_fields)
+                exists = True
+        if fields:
+            transaction.set(user_ref, fields, merge=True)
+        return exists, data, results
+
+    return _apply(db.transaction(max_attempts=USER_TXN_MAX_ATTEMPTS))
@@ -0,0 +1,84 @@
+"""
+Structured meeting times for scraped sections.
+
+The schedule site gives a section's time as one string such as "10:00-11:20TTh"
+or "02:30-03:20MWF05/05-07/30". scrape_schedule.py stores the parsed form next
+to it as section["meetings"], a list of
+    {"days": bitmask, "start": minute of day, "end": minute of day,
+     "startDate": "MM/DD" or None, "endDate": "MM/DD" or None}
+with Mon = 1, Tue = 2, Wed = 4, Thu = 8, Fri = 16, Sat = 32, Sun = 64.
+TBA and online sections have no meetings. agent/occupancy.py loads this file
+by path so the scraper and the agent parse times the same way.
+"""
+
+import re
+
+DAY_NAMES = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+DAY_BITS = {name: 1 << i for i, name in enumerate(DAY_NAMES)}
+
+_TIME_RE = re.compile(r"(\d{1,2}):(\d{2})-(\d{1,2}):(\d{2})")
+_DATE_RANGE_RE = re.compile(r"(\d{2}/\d{2})-(\d{2}/\d{2})")
+
+
+def parse_days(letters):
+    """"MWF" -> ["Mon", "Wed", "Fri"], "TTh" -> ["Tue", "Thu"]."""
+    days = []
+    i = 0
+    while i < len(letters):
+        if letters[i] == 'M': days.append("Mon"); i += 1
+        elif letters[i] == 'T':
+            if i + 1 < len(letters) and letters[i+1] == 'h':
+                days.append("Thu"); i += 2
+            else: days.append("Tue"); i += 1
+        elif letters[i] == 'W': days.append("Wed"); i += 1
+        elif letters[i] == 'F': days.append("Fri"); i += 1
+        elif letters[i] == 'S':
+            if i + 1 < len(letters) and letters[i+1] == 'u':
+                days.append("Sun")
+            else: days.append("Sat")
+            i += 1
+        else: i += 1
+    return days
+
+
+def days_to_mask(days):
+    mask = 0
+    for day in days:
+        mask |= DAY_BITS.get(day, 0)
+    return mask
+
+
+def mask_to_days(mask):
+    return [name for name in DAY_NAMES if mask & DAY_BITS[name]]
+
+
+def parse_meetings(time_str):
+    """Meetings for a raw time_date string; [] when it is empty, TBA or unparsable."""
+    if not time_str or time_str.strip() == "" or time_str.strip() == "TBA":
+        return []
+    match = _TIME_RE.search(time_str)
+    if not match:
+        return []
+
+    start_h, start_m, end_h, end_m = [int(g) for g in match.groups()]
+    # The site omits AM/PM. Classes run from 8:30 AM, so earlier hours are PM.
+    if start_h < 8: start_h += 12
+    if end_h < 8: end_h += 12
+    if end_h < start_h: end_h += 12
+
+    rest = time_str[match.end():].strip()
+    letters = ""
+    for c in rest:
+        if c.isalpha():
+            letters += c
+        else:
+            break
+    dates = _DATE_RANGE_RE.search(rest[len(letters):])
+
+    return [{
+        "days": days_to_mask(parse_days(letters)),
+        "start": start_h * 60 + start_m,
+        "end": end_h * 60 + end_m,
+        "startDate": dates.group(1) if dates else None,
+        "endDate": dates.group(2) if dates else None
+    }]
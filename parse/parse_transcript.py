@@ -1,4 +1,3 @@
-from tika import parser # pip install tika
 import re
 import json
 
@@ -6,7 +5,11 @@ def parse_transcript(text:str):
     '''
     Parse raw text from UWaterloo unofficial transcript
 
-    Returns a dictionary with student info and list of courses
+    Returns a dictionary with student info and list of courses. Courses still
+    in progress have no Attempted/Earned/Grade (None). Terms holds each term's
+    program, level, GPAs, standing and notes. Milestones, Awards and
+    TransferCredits keep the lines of those sections as they appear, and
+    Unparsed keeps course-table lines that could not be read.
     '''
 
     lines = text.strip().split('\n')
@@ -14,48 +17,97 @@ def parse_transcript(text:str):
         'Name': None,
         'SID': None,
         'Program': None,
-        'CoursesTaken': []
+        'CoursesTaken': [],
+        'Terms': [],
+        'Milestones': [],
+        'Awards': [],
+        'TransferCredits': [],
+        'Unparsed': []
     }
     in_courses = False
     current_term = None
+    term_info = None
+    course = None  # last course of the current table, for wrapped lines
+    section = None  # list the lines of a trailing section go to
+
+    sections = {
+        'Milestones': result['Milestones'],
+        'Scholarships and Awards': result['Awards'],
+        'Transfer Credits': result['TransferCredits']
+    }
+    # Repeated at the top of every page
+    page_header = (
+        'University of Waterloo',
+        '200 University Ave. West',
+        'Waterloo Ontario Canada N2L3G1',
+        'Undergraduate Unofficial Transcript',
+        'Beginning of Undergraduate Record'
+    )
 
     for line in lines:
-        line = line.strip()
+        # Normalize spaces
+        line = re.sub(r'\s+', ' ', line).strip()
         if not line:
             continue  # Skip empty lines
 
         # Extract student info (key-value pairs)
         if line.startswith('Name:'):
-            result['Name'] = re.sub(r'\s+', ' ', line.split(':', 1)[1].strip())
+            result['Name'] = line.split(':', 1)[1].strip()
         elif line.startswith('Student ID:'):
             result['SID'] = line.split(':', 1)[1].strip()
+        elif line.startswith('Ontario Education Nbr:') or line in page_header:
+            continue
+        elif section is None and re.match(r'^\d{2}/\d{2}/\d{4}$', line):
+            continue  # Page header date
         elif line.startswith('Program:'):
-            result['Program'] = re.sub(r'\s+', ' ', line.split(':', 1)[1].strip())
+            result['Program'] = line.split(':', 1)[1].strip()
+            if term_info is not None:
+                term_info['Program'] = result['Program']
+        elif line.startswith('Level:') and term_info is not None:
+            for key, pattern in (('Level', r'Level: (\S+)'), ('Load', r'Load: (.+?)(?= Form Of Study:|$)'), ('FormOfStudy', r'Form Of Study: (.+)$')):
+                match = re.search(pattern, line)
+                if match:
+                    term_info[key] = match.group(1).strip()
 
         # Detect term (e.g., "Winter 2026")
         elif re.match(r'^(Fall|Winter|Spring)\s+\d{4}$', line):
             current_term = line
+            term_info = {'Term': current_term, 'Notes': []}
+            result['Terms'].append(term_info)
+            in_courses = False
+            course = None
             continue  # Courses follow soon after
         # Start of course table
         elif line == 'Course Description Attempted Earned Grade':
             in_courses = True
+            course = None
             continue
 
         # End of transcript
-        elif in_courses and line.startswith('End of'):
+        elif line.startswith('End of'):
             in_courses = False
+            section = None
             continue
 
+        # Sections after the last term
+        elif line in sections:
+            in_courses = False
+            section = sections[line]
+        elif section is not None:
+            section.append(line)
+
         # Parse course lines
         elif in_courses:
-            # Normalize spaces
-            line = re.sub(r'\s{2,}', ' ', line)
-            
-            pattern = r'^([A-Z]{2,6})\s+(\d{1,3}[A-Za-z]?)\s+(.+?)\s+(\d\.\d{2})\s+(\d\.\d{2})\s+([A-Z0-9]{1,3})$'
+            if line == 'In GPA Earned':
+                in_courses = False
+                continue
+
+            pattern = r'^([A-Z]{2,6})\s+(\d{1,3}[A-Za-z]?)\s+(.+?)(?:\s+(\d\.\d{2})\s+(\d\.\d{2})\s+([A-Z0-9]{1,3}))?$'
             match = re.match(pattern,line)
+            numbers = re.match(r'^(\d\.\d{2})\s+(\d\.\d{2})\s+([A-Z0-9]{1,3})$', line)
             if match:
                 subject, number, title, attempted, earned, grade = match.groups()
-                
+
                 course = {
                     'Term': current_term,
                     'Code': f"{subject} {number}",  # e.g., "CS 446"
@@ -65,36 +117,60 @@ def parse_transcript(text:str):
                     'Grade': grade
                 }
                 result['CoursesTaken'].append(course)
+            elif numbers and course is not None and course['Grade'] is None:
+                # Last line of a course whose title wrapped
+                course['Attempted'], course['Earned'], course['Grade'] = numbers.groups()
+            elif course is not None and course['Grade'] is None and not numbers:
+                course['Description'] += ' ' + line
+            elif course is not None and not numbers:
+                # e.g. "Degree Requirement, Not in Average"
+                term_info['Notes'].append(f"{course['Code']}: {line}")
+            else:
+                result['Unparsed'].append(line)
+
+        # Term summary after the course table
+        elif term_info is not None:
+            if line.startswith('Term GPA'):
+                term_info['TermGPA'] = line.split()[2]
+            elif line.startswith('Cumulative GPA'):
+                term_info['CumulativeGPA'] = line.split()[2]
+            elif line.startswith('Academic Standing:'):
+                term_info['Standing'] = re.sub(r'\s+Effective .*$', '', line.split(':', 1)[1]).strip()
+            else:
+                term_info['Notes'].append(line)
 
     return result
 
-# step 1 : parse text from transcript
-
-raw = parser.from_file("parse/test_file/SSR_TSRPT_anonymous.pdf")
-
-'''
-with open('parse_transcript.txt','w+') as file:
-    file.write(raw["content"])
-'''
+if __name__ == "__main__":
+    from tika import parser # pip install tika
 
-# step 2 : extract useful info
+    # step 1 : parse text from transcript
 
-parsed_data = parse_transcript(raw["content"])
+    raw = parser.from_file("parse/test_file/SSR_TSRPT_anonymous.pdf")
 
-# with open("parse/example_output/parsed_transcript.txt","w+",encoding="utf-8") as file:
-#     file.write(f"Student: {parsed_data['Name'] or '-'}\n")
-#     file.write(f"SID:      {parsed_data['SID'] or '-'}\n")
-#     file.write(f"Program: {parsed_data['Program'] or '-'}\n")
-#     file.write('\n')
-#     for course in parsed_data['CoursesTaken']:
-#         # 'Term': 'Fall 2017', 'Code': 'CS 137', 'Description': 'Programming Principles', 'Attempted': '0.50', 'Earned': '0.50', 'Grade': '86'
-#         file.write(
-#             f"Term: {course['Term']} | "
-#             f"Code: {course['Code']} | "
-#             f"Description: {course['Description']} | "
-#             f"Attempted: {course['Attempted']} | "
-#             f"Earned: {course['Earned']} | "
-#             f"Grade: {course['Grade']}\n"
-#         )
+    '''
+    with open('parse_transcript.txt','w+') as file:
+        file.write(raw["content"])
+    '''
 
-json_string = json.dumps(parsed_data,indent=4)
\ No newline at end of file
+    # step 2 : extract useful info
+
+    parsed_data = parse_transcript(raw["content"])
+
+    # with open("parse/example_output/parsed_transcript.txt","w+",encoding="utf-8") as file:
+    #     file.write(f"Student: {parsed_data['Name'] or '-'}\n")
+    #     file.write(f"SID:      {parsed_data['SID'] or '-'}\n")
+    #     file.write(f"Program: {parsed_data['Program'] or '-'}\n")
+    #     file.write('\n')
+    #     for course in parsed_data['CoursesTaken']:
+    #         # 'Term': 'Fall 2017', 'Code': 'CS 137', 'Description': 'Programming Principles', 'Attempted': '0.50', 'Earned': '0.50', 'Grade': '86'
+    #         file.write(
+    #             f"Term: {course['Term']} | "
+    #             f"Code: {course['Code']} | "
+    #             f"Description: {course['Description']} | "
+    #             f"Attempted: {course['Attempted']} | "
+    #             f"Earned: {course['Earned']} | "
+    #             f"Grade: {course['Grade']}\n"
+    #         )
+
+    json_string = json.dumps(parsed_data,indent=4)
\ No newline at end of file
@@ -1,6 +1,7 @@
 import requests
 import json
 from bs4 import BeautifulSoup
+from meeting_times import parse_meetings
 
 # returns a list of all subjects
 # e.g. ['ACC', 'ACINITY', ...]
@@ -77,6 +78,7 @@ def get_subject_courses(level: str, sess: str, subject: str):
                     for srow in section_rows:
                         scols = srow.find_all("td")
                         if len(scols) >= 10:  # actual section rows
+                            time_date = scols[10].get_text(strip=True)
                             section = {
                                 "class": scols[0].get_text(strip=True),
                                 "component": scols[1].get_text(strip=True),
@@ -85,7 +87,9 @@ def get_subject_courses(level: str, sess: str, subject: str):
                                 "enrl_tot": scols[7].get_text(strip=True),
                                 "wait_cap": scols[8].get_text(strip=True),
                                 "wait_tot": scols[9].get_text(strip=True),
-                                "time_date": scols[10].get_text(strip=True),
+                                "time_date": time_date,
+                                # Parsed once here so readers never re-parse time_date
+                                "meetings": parse_meetings(time_date),
                                 "location": scols[11].get_text(strip=True) if len(scols) > 11 else ""
                             }
                             course["sections"].append(section)
@@ -3,7 +3,9 @@ from firebase_admin import credentials
 from firebase_admin import firestore
 from firebase_admin import messaging
 import scrape_schedule
+import json
 import sys
+import time
 
 """
 INSTRUCTIONS:
@@ -21,8 +23,14 @@ INSTRUCTIONS:
 
    First run (skip notifications to avoid spam):
    python parse/script_populate_db.py --skip-notify
+
+   Also write the course catalog export the agent can load from disk
+   (AGENT_COURSE_CATALOG_PATH):
+   python parse/script_populate_db.py --catalog-out course_catalog.json
 """
 
+CATALOG_COLUMNS = ["term", "subject", "catalog", "title", "units"]
+
 
 def initialize_firebase():
     try:
@@ -99,7 +107,7 @@ def send_change_notification(doc_id, course, changes):
         print(f"    -> Failed to notify for {course_code}: {e}")
 
 
-def populate_database(db, skip_notify=False):
+def populate_database(db, skip_notify=False, catalog_out=None):
     print("Fetching all subjects...")
     initial_sess = "1261"
     level = "under"
@@ -113,6 +121,7 @@ def populate_database(db, skip_notify=False):
     batch_count = 0
     limit = 500
     total_changes = 0
+    catalog_rows = []
 
     for subject in subjects:
         print(f"Processing Subject: {subject}")
@@ -125,6 +134,7 @@ def populate_database(db, skip_notify=False):
             for course in courses:
                 doc_id = f"{sess}_{course['subject']}_{course['catalog']}"
                 course['term'] = sess
+                catalog_rows.append([sess, course['subject'], course['catalog'], course['title'], course['units']])
                 doc_ref = db.collection('courses').document(doc_id)
 
                 # Check for changes before overwriting
@@ -160,12 +170,54 @@ def populate_database(db, skip_notify=False):
         except Exception as e:
             print(f"Error committing final batch: {e}")
 
+    write_course_catalog(db, catalog_rows, catalog_out)
+    publish_courses_version(db)
     print(f"\nDatabase population complete! {total_changes} changes detected and notified.")
 
 
+def write_course_catalog(db, rows, catalog_out=None):
+    """
+    Write the (term, subject, catalog, title, units) rows that agent/course_catalog.py
+    indexes for search_courses: one course_catalog/{term} document per term, and
+    optionally the whole table as a JSON file.
+    """
+    by_term = {}
+    for row in rows:
+        by_term.setdefault(row[0], []).append(row)
+    for term, term_rows in by_term.items():
+        try:
+            # Firestore does not allow nested arrays, so the rows are stored as JSON text.
+            db.collection('course_catalog').document(term).set({
+                'columns': CATALOG_COLUMNS,
+                'rows_json': json.dumps(term_rows, ensure_ascii=False, separators=(',', ':'))
+            })
+        except Exception as e:
+            print(f"Error writing course catalog for {term}: {e}")
+
+    if catalog_out:
+        with open(catalog_out, 'w', encoding='utf-8') as f:
+            json.dump({'columns': CATALOG_COLUMNS, 'rows': rows}, f, ensure_ascii=False)
+        print(f"Wrote {len(rows)} catalog rows to {catalog_out}")
+
+
+def publish_courses_version(db):
+    """
+    Bump meta/courses.version so agent servers drop their in-process course cache
+    (see agent/course_cache.py) instead of serving stale sections until TTL expiry.
+    """
+    try:
+        db.collection('meta').document('courses').set({
+            'version': int(time.time()),
+            'updatedAt': firestore.SERVER_TIMESTAMP
+        })
+    except Exception as e:
+        print(f"Error publishing courses version: {e}")
+
+
 if __name__ == "__main__":
     db = initialize_firebase()
     skip_notify = "--skip-notify" in sys.argv
     if skip_notify:
         print("Skipping notifications (--skip-notify flag)")
-    populate_database(db, skip_notify=skip_notify)
+    catalog_out = sys.argv[sys.argv.index("--catalog-out") + 1] if "--catalog-out" in sys.argv[:-1] else None
+    populate_database(db, skip_notify=skip_notify, catalog_out=catalog_out)